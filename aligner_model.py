@@ -0,0 +1,135 @@
+#!/usr/bin/env python3.5
+
+# Monte-Carlo model of the lock time of gtx_init.BruteforceClockAligner.
+#
+# Every restart of the receiver gives one of phases equally likely phases
+# of the recovered clock (one per bit of the datapath), of which only one
+# puts the comma in the first symbol of RXDATA. After a restart, the
+# receiver takes init_time (uniformly distributed within +/- init_jitter of
+# it) to become ready again, and it then receives a comma every
+# comma_interval words.
+#
+# In the default mode, the comma is checked by a free-running timer every
+# check_period, whose phase is random with respect to the first restart. A
+# check restarts the receiver unless an aligned comma was seen since the
+# previous check; the restarts issued while the receiver is not ready are
+# ignored. In the adaptive mode, the receiver is restarted or declared
+# locked as soon as commas commas have been seen after it became ready
+# (and restarted after check_period without any).
+#
+# Times are in seconds from the first restart.
+
+import argparse
+import math
+import random
+from collections import namedtuple
+
+
+Parameters = namedtuple("Parameters",
+    "phases init_time init_jitter check_period word_rate comma_interval commas")
+
+def default_parameters(line_rate=1.25e9, data_width=20, init_time=20e-6,
+                       init_jitter=5e-6, check_period=6e-3, comma_interval=16,
+                       commas=4):
+    return Parameters(data_width, init_time, init_jitter, check_period,
+                      line_rate/data_width, comma_interval, commas)
+
+
+def _ready_time(rng, parameters):
+    return parameters.init_time + rng.uniform(-parameters.init_jitter,
+                                              parameters.init_jitter)
+
+
+def _first_comma(rng, parameters):
+    return rng.randrange(parameters.comma_interval)/parameters.word_rate
+
+
+def lock_time_default(rng, parameters):
+    period = parameters.check_period
+    phase = rng.uniform(0, period)
+    t = 0.0
+    while True:
+        aligned = rng.randrange(parameters.phases) == 0
+        comma = t + _ready_time(rng, parameters) + _first_comma(rng, parameters)
+        # first check after the comma
+        check = phase + period*max(math.floor((comma - phase)/period) + 1, 0)
+        if aligned:
+            return check
+        t = check
+
+
+def lock_time_adaptive(rng, parameters):
+    t = 0.0
+    while True:
+        aligned = rng.randrange(parameters.phases) == 0
+        decision = (_first_comma(rng, parameters)
+                    + (parameters.commas - 1)*parameters.comma_interval
+                      /parameters.word_rate)
+        t += _ready_time(rng, parameters)
+        if aligned:
+            return t + decision
+        t += min(decision, parameters.check_period)
+
+
+modes = {
+    "default": lock_time_default,
+    "adaptive": lock_time_adaptive
+}
+
+
+def simulate(mode, parameters, trials=10000, seed=None):
+    rng = random.Random(seed)
+    return sorted(modes[mode](rng, parameters) for _ in range(trials))
+
+
+Summary = namedtuple("Summary", "mean median p95 p99 max")
+
+def summarize(lock_times):
+    n = len(lock_times)
+    def percentile(p):
+        return lock_times[min(int(p*n), n - 1)]
+    return Summary(sum(lock_times)/n, percentile(0.5), percentile(0.95),
+                   percentile(0.99), lock_times[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Lock time model of the bruteforce clock aligner")
+    parser.add_argument("--line-rate", default=1.25, type=float,
+                        help="line rate in Gb/s (default: %(default)s)")
+    parser.add_argument("--data-width", default=20, type=int, choices=(20, 40),
+                        help="transceiver datapath width "
+                             "(default: %(default)s)")
+    parser.add_argument("--init-time", default=20.0, type=float,
+                        help="time from a restart to the receiver being "
+                             "ready in us (default: %(default)s)")
+    parser.add_argument("--init-jitter", default=5.0, type=float,
+                        help="spread of the initialization time in us "
+                             "(default: %(default)s)")
+    parser.add_argument("--check-period", default=6.0, type=float,
+                        help="check period in ms (default: %(default)s)")
+    parser.add_argument("--comma-interval", default=16, type=int,
+                        help="words between commas (default: %(default)s)")
+    parser.add_argument("--commas", default=4, type=int,
+                        help="commas for a decision in the adaptive mode "
+                             "(default: %(default)s)")
+    parser.add_argument("--trials", default=10000, type=int,
+                        help="number of simulated lock-ups "
+                             "(default: %(default)s)")
+    parser.add_argument("--seed", default=None, type=int)
+    args = parser.parse_args()
+
+    parameters = default_parameters(
+        args.line_rate*1e9, args.data_width, args.init_time*1e-6,
+        args.init_jitter*1e-6, args.check_period*1e-3, args.comma_interval,
+        args.commas)
+    print("{:10} {:>12} {:>12} {:>12} {:>12} {:>12}".format(
+        "mode", *Summary._fields))
+    for mode in sorted(modes):
+        summary = summarize(simulate(mode, parameters, args.trials, args.seed))
+        print("{:10} ".format(mode)
+              + " ".join("{:>10.3f}ms".format(1e3*value) for value in summary))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3.5
+
+# Measures the host-side overhead of CommUART against an emulated board
+# (see virtual_board.py), comparing the current implementation with the
+# original one that issued a port write per word and decoded replies word
+# by word. The emulation of the bridge is included in the figures; the
+# number of port writes per transaction is also reported since each of them
+# is a system call (and often a USB packet) on a real serial port.
+
+import argparse
+import timeit
+
+from comm_uart import CommUART
+from virtual_board import VirtualBoardPort
+
+
+class LegacyCommUART(CommUART):
+    def read(self, addr, length=None):
+        data = []
+        length_int = 1 if length is None else length
+        self.port.write([self.msg_type["read"], length_int])
+        self.port.write((addr//4).to_bytes(4, byteorder="big"))
+        for i in range(length_int):
+            value = int.from_bytes(self.port.read(4), "big")
+            if length is None:
+                return value
+            data.append(value)
+        return data
+
+    def write(self, addr, data):
+        data = data if isinstance(data, list) else [data]
+        length = len(data)
+        offset = 0
+        while length:
+            size = min(length, 255)
+            self.port.write([self.msg_type["write"], size])
+            self.port.write(((addr+4*offset)//4).to_bytes(4, byteorder="big"))
+            for value in data[offset:offset+size]:
+                self.port.write(value.to_bytes(4, byteorder="big"))
+            offset += size
+            length -= size
+
+
+def count_port_writes(comm):
+    count = 0
+    write = comm.port.write
+    def counting_write(data):
+        nonlocal count
+        count += 1
+        return write(data)
+    comm.port.write = counting_write
+    return lambda: count
+
+
+def bench_write(comm, length, number):
+    data = list(range(length))
+    def run():
+        comm.write(0x04, data)
+    return min(timeit.repeat(run, number=number, repeat=5))/number
+
+
+def bench_read(comm, length, number):
+    def run():
+        comm.read(0x40, length)
+    return min(timeit.repeat(run, number=number, repeat=5))/number
+
+
+def main():
+    parser = argparse.ArgumentParser(description="CommUART host overhead benchmark")
+    parser.add_argument("-n", "--number", default=200, type=int,
+                        help="transactions per measurement")
+    args = parser.parse_args()
+
+    print("{:>6} {:>6} {:>14} {:>14} {:>8} {:>14}".format(
+        "op", "words", "legacy us/word", "bulk us/word", "speedup",
+        "port writes"))
+    for op, bench in ("write", bench_write), ("read", bench_read):
+        for length in 2, 16, 255:
+            results = []
+            writes = []
+            for cls in LegacyCommUART, CommUART:
+                with cls(VirtualBoardPort()) as comm:
+                    results.append(1e6*bench(comm, length, args.number)/length)
+                    port_writes = count_port_writes(comm)
+                    if op == "write":
+                        comm.write(0x04, list(range(length)))
+                    else:
+                        comm.read(0x40, length)
+                    writes.append(port_writes())
+            print("{:>6} {:>6} {:>14.3f} {:>14.3f} {:>7.1f}x {:>6} -> {:<5}".format(
+                op, length, results[0], results[1], results[0]/results[1],
+                writes[0], writes[1]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,298 @@
+#!/usr/bin/env python3.5
+
+# Measures the elaboration time (construction of the module, lowering and
+# setup of the simulator) and the simulation speed (in simulated clock
+# cycles per second) of the gateware modules, each driven with random or
+# typical stimuli for a fixed number of cycles.
+#
+# The results can be written to a JSON file (--output) and compared with
+# those of another commit (--compare): the benchmarks whose elaboration or
+# simulation time grew by more than --threshold are reported, and the exit
+# status is then 1.
+
+import argparse
+import json
+import platform
+import random
+import sys
+import time
+
+from migen import *
+from migen.sim import Simulator, passive
+from migen.fhdl.specials import Tristate
+
+from line_coding import Encoder, Decoder
+from prbs import PRBSGenerator, PRBSChecker
+from sequencer import Sequencer, InstWrite, InstWait, InstEnd
+from i2c import I2CMaster, I2C_XFER_ADDR, I2C_CONFIG_ADDR, I2C_START, \
+                I2C_WRITE, I2C_STOP, I2C_IDLE
+from wishbonebridge import WishboneStreamingBridge
+
+
+# Each benchmark returns the module, the passive generators that drive it
+# and the special overrides of the simulation.
+
+def encoder(nwords):
+    def benchmark(rng):
+        dut = Encoder(nwords, True)
+
+        @passive
+        def stimulus():
+            while True:
+                for i in range(nwords):
+                    k = rng.randrange(8) == 0
+                    yield dut.k[i].eq(k)
+                    yield dut.d[i].eq(0xbc if k else rng.randrange(256))
+                yield
+        return dut, [stimulus()], {}
+    return benchmark
+
+
+def decoder(rng):
+    dut = Decoder(True)
+
+    @passive
+    def stimulus():
+        while True:
+            yield dut.input.eq(rng.randrange(1024))
+            yield
+    return dut, [stimulus()], {}
+
+
+def prbs_generator(width):
+    def benchmark(rng):
+        return PRBSGenerator(width), [], {}
+    return benchmark
+
+
+def prbs_checker(width):
+    def benchmark(rng):
+        dut = PRBSChecker(width)
+
+        @passive
+        def stimulus():
+            while True:
+                yield dut.i.eq(rng.getrandbits(width))
+                yield
+        return dut, [stimulus()], {}
+    return benchmark
+
+
+@passive
+def _wishbone_slave(bus, rng):
+    while True:
+        yield bus.ack.eq(0)
+        yield
+        if (yield bus.cyc) and (yield bus.stb):
+            if not (yield bus.we):
+                yield bus.dat_r.eq(rng.getrandbits(32))
+            yield bus.ack.eq(1)
+            yield
+
+
+def sequencer(rng):
+    program = []
+    for i in range(64):
+        program.append(InstWrite(i % 2, rng.getrandbits(20)))
+        program.append(InstWait(i % 2, 1 << rng.randrange(20)))
+    program.append(InstEnd())
+    dut = Sequencer(program)
+    return dut, [_wishbone_slave(dut.bus, rng)], {}
+
+
+class _SimTristate:
+    @staticmethod
+    def lower(tristate):
+        module = Module()
+        module.comb += [
+            If(tristate.oe, tristate.target.eq(tristate.o)),
+            tristate.i.eq(tristate.target)
+        ]
+        return module
+
+
+def i2c_master(rng):
+    pads = Record([("scl", 1), ("sda", 1)])
+    dut = I2CMaster(pads)
+
+    @passive
+    def stimulus():
+        yield from dut.bus.write(I2C_CONFIG_ADDR, 4)
+        while True:
+            for command in (I2C_START, I2C_WRITE | rng.randrange(256),
+                            I2C_STOP):
+                yield from dut.bus.write(I2C_XFER_ADDR, command)
+                while not (yield from dut.bus.read(I2C_XFER_ADDR)) & I2C_IDLE:
+                    pass
+    return dut, [stimulus()], {Tristate: _SimTristate}
+
+
+def wishbone_bridge(rng):
+    phy = Record([("source", [("stb", 1), ("ack", 1), ("eop", 1), ("data", 8)]),
+                  ("sink", [("stb", 1), ("ack", 1), ("eop", 1), ("data", 8)])])
+    dut = WishboneStreamingBridge(phy, 1000000)
+    cmds = WishboneStreamingBridge.cmds
+
+    # alternate writes and reads of 4 words, as fast as the bridge accepts
+    # them
+    @passive
+    def source():
+        while True:
+            for cmd in cmds["write"], cmds["read"]:
+                request = [cmd, 4] + list((rng.getrandbits(8)).to_bytes(4, "big"))
+                if cmd == cmds["write"]:
+                    request += [rng.getrandbits(8) for _ in range(16)]
+                for octet in request:
+                    yield phy.source.data.eq(octet)
+                    yield phy.source.stb.eq(1)
+                    yield
+                    while not (yield phy.source.ack):
+                        yield
+                yield phy.source.stb.eq(0)
+
+    @passive
+    def sink():
+        yield phy.sink.ack.eq(1)
+        while True:
+            yield
+    return dut, [source(), sink(), _wishbone_slave(dut.wishbone, rng)], {}
+
+
+benchmarks = {
+    "decoder": decoder,
+    "sequencer": sequencer,
+    "i2c_master": i2c_master,
+    "wishbone_bridge": wishbone_bridge
+}
+for nwords in 1, 2, 4:
+    benchmarks["encoder_{}".format(nwords)] = encoder(nwords)
+for width in 16, 32, 64:
+    benchmarks["prbs_generator_{}".format(width)] = prbs_generator(width)
+    benchmarks["prbs_checker_{}".format(width)] = prbs_checker(width)
+
+
+# Returns the elaboration and simulation times of the benchmark over cycles
+# clock cycles, in seconds.
+def run(name, cycles, seed=0):
+    rng = random.Random(seed)
+
+    def clock():
+        for _ in range(cycles):
+            yield
+
+    t0 = time.perf_counter()
+    dut, generators, special_overrides = benchmarks[name](rng)
+    with Simulator(dut, generators + [clock()],
+                   special_overrides=special_overrides) as simulator:
+        t1 = time.perf_counter()
+        simulator.run()
+    t2 = time.perf_counter()
+    return t1 - t0, t2 - t1
+
+
+# Returns the results of the benchmarks, with the best of repeat runs.
+def run_all(names=None, cycles=2000, repeat=3, seed=0):
+    if names is None:
+        names = sorted(benchmarks)
+    results = dict()
+    for name in names:
+        times = [run(name, cycles, seed) for _ in range(repeat)]
+        elaboration = min(elaboration for elaboration, simulation in times)
+        simulation = min(simulation for elaboration, simulation in times)
+        results[name] = {
+            "elaboration": elaboration,
+            "simulation": simulation,
+            "cycles": cycles,
+            "cycles_per_second": cycles/simulation
+        }
+    return {
+        "python": platform.python_version(),
+        "results": results
+    }
+
+
+# Returns the (name, metric, baseline, current) of the benchmarks present in
+# both sets of results whose elaboration time or simulation time per cycle
+# grew by more than threshold (relative).
+def compare(baseline, current, threshold=0.2):
+    def metrics(result):
+        return {
+            "elaboration": result["elaboration"],
+            "simulation": 1/result["cycles_per_second"]
+        }
+
+    regressions = []
+    for name in sorted(set(baseline["results"]) & set(current["results"])):
+        old = metrics(baseline["results"][name])
+        new = metrics(current["results"][name])
+        for metric in sorted(old):
+            if new[metric] > old[metric]*(1 + threshold):
+                regressions.append((name, metric, old[metric], new[metric]))
+    return regressions
+
+
+def format_results(results, baseline=None):
+    lines = ["{:20} {:>14} {:>14} {:>10}".format(
+        "benchmark", "elaboration ms", "simulation ms", "cycles/s")]
+    for name, result in sorted(results["results"].items()):
+        line = "{:20} {:>14.1f} {:>14.1f} {:>10.0f}".format(
+            name, 1e3*result["elaboration"], 1e3*result["simulation"],
+            result["cycles_per_second"])
+        if baseline is not None and name in baseline["results"]:
+            line += " ({:+.0%} cycles/s)".format(
+                result["cycles_per_second"]
+                /baseline["results"][name]["cycles_per_second"] - 1)
+        lines.append(line)
+    return lines
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Gateware simulation performance benchmarks")
+    parser.add_argument("benchmarks", metavar="BENCHMARK", nargs="*",
+                        help="benchmarks to run (default: all), among: "
+                             + ", ".join(sorted(benchmarks)))
+    parser.add_argument("--cycles", default=2000, type=int,
+                        help="simulated cycles per benchmark "
+                             "(default: %(default)s)")
+    parser.add_argument("--repeat", default=3, type=int,
+                        help="runs per benchmark, the best is kept "
+                             "(default: %(default)s)")
+    parser.add_argument("-o", "--output", default=None,
+                        help="write the results to a JSON file")
+    parser.add_argument("--compare", metavar="JSON", default=None,
+                        help="compare with the results of a previous run")
+    parser.add_argument("--threshold", default=20.0, type=float,
+                        help="time increase reported as a regression, in "
+                             "percent (default: %(default)s)")
+    args = parser.parse_args()
+
+    for name in args.benchmarks:
+        if name not in benchmarks:
+            parser.error("unknown benchmark {}".format(name))
+
+    baseline = None
+    if args.compare is not None:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+
+    results = run_all(args.benchmarks or None, args.cycles, args.repeat)
+    for line in format_results(results, baseline):
+        print(line)
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=4, sort_keys=True)
+
+    if baseline is not None:
+        regressions = compare(baseline, results, args.threshold/100)
+        units = {"elaboration": (1e3, "ms"), "simulation": (1e6, "us/cycle")}
+        for name, metric, old, new in regressions:
+            scale, unit = units[metric]
+            print("regression: {} {} {:.2f}{} -> {:.2f}{}".format(
+                name, metric, scale*old, unit, scale*new, unit))
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
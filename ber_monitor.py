@@ -0,0 +1,238 @@
+# Continuous bit error ratio monitoring of the PRBS receiver (demo_prbs.py).
+#
+# The error counter (0x40) and, on bitstreams that have it, the checked
+# word counter (0x44) are sampled in a single bridge transaction. Counts are
+# relative to the first sample, so errors counted while the receiver was
+# synchronizing are left out. The BER is estimated as errors/(16*words)
+# with the default 20-bit transceiver datapath (32 bits per word with 40);
+# since the checker counts errored words and a single bit error on the
+# fiber may cause several errors to be detected, this errs on the
+# pessimistic side. Confidence bounds assume Poisson-distributed errors.
+#
+# Samples can be appended to a CSV file and to a binary log made of
+# little-endian records of <8> TIME (double, UNIX time) <8> ERRORS <8> WORDS,
+# and summarized in a file in the Prometheus text exposition format, which
+# is replaced atomically (e.g. for the node exporter textfile collector).
+
+import logging
+import math
+import os
+import struct
+import time
+from collections import namedtuple
+from functools import lru_cache
+
+
+logger = logging.getLogger(__name__)
+
+@lru_cache(maxsize=None)
+def _normal_quantile(p):
+    low, high = -40.0, 40.0
+    for _ in range(100):
+        middle = (low + high)/2
+        if (1 + math.erf(middle/math.sqrt(2)))/2 < p:
+            low = middle
+        else:
+            high = middle
+    return (low + high)/2
+
+
+# Exact for 2 degrees of freedom, Wilson-Hilferty approximation otherwise
+def _chi2_quantile(p, df):
+    if df == 2:
+        return -2*math.log(1 - p)
+    h = 2/(9*df)
+    return df*max(0.0, 1 - h + _normal_quantile(p)*math.sqrt(h))**3
+
+
+# Two-sided confidence interval of the mean of a Poisson variable observed
+# to be k
+def poisson_interval(k, confidence=0.95):
+    alpha = 1 - confidence
+    if k == 0:
+        low = 0.0
+    else:
+        low = _chi2_quantile(alpha/2, 2*k)/2
+    high = _chi2_quantile(1 - alpha/2, 2*k + 2)/2
+    return low, high
+
+
+Sample = namedtuple("Sample", "time errors words")
+BER = namedtuple("BER", "ber low high")
+
+
+def ber(errors, words, bits_per_word=16, confidence=0.95):
+    bits = bits_per_word*words
+    if not bits:
+        return BER(None, None, None)
+    low, high = poisson_interval(errors, confidence)
+    return BER(errors/bits, low/bits, high/bits)
+
+
+# word_rate is the number of words checked per second, which is the
+# transceiver word clock frequency (line rate/data width) less the header
+# cycles (1 in 16): 58.6M at the default 1.25Gbps/20 bits.
+class BERMonitor:
+    def __init__(self, comm, word_counter=True, confidence=0.95,
+                 bits_per_word=16, word_rate=62.5e6*15/16):
+        self.comm = comm
+        self.word_counter = word_counter
+        self.confidence = confidence
+        self.bits_per_word = bits_per_word
+        self.wrap_time = 2**32/word_rate
+        self.first = None
+        self.last = None
+        self._counters = None
+        self._totals = [0, 0]
+
+    # Reads the counters, extending them beyond 32 bits; they must be
+    # sampled at least once per wraparound of the word counter (wrap_time,
+    # 73s at 1.25Gbps and 18s at 10Gbps). A warning is logged when samples
+    # are more than half of that apart.
+    def sample(self):
+        counters = self.comm.read_block(0x40, 2 if self.word_counter else 1)
+        now = time.time()
+        if (self.word_counter and self.last is not None
+                and now - self.last.time > self.wrap_time/2):
+            logger.warning("counters sampled %.1fs apart, the word count may "
+                           "have wrapped (every %.1fs) and be too low",
+                           now - self.last.time, self.wrap_time)
+        if self._counters is not None:
+            for i, (value, last) in enumerate(zip(counters, self._counters)):
+                self._totals[i] += (value - last) & 0xffffffff
+        self._counters = counters
+        sample = Sample(now, self._totals[0], self._totals[1])
+        if self.first is None:
+            self.first = sample
+        self.last = sample
+        return sample
+
+    def interval_ber(self, previous, current):
+        return ber(current.errors - previous.errors,
+                   current.words - previous.words,
+                   self.bits_per_word, self.confidence)
+
+    def cumulative_ber(self):
+        return ber(self.last.errors, self.last.words,
+                   self.bits_per_word, self.confidence)
+
+
+def _format(value):
+    return "" if value is None else "{:.6g}".format(value)
+
+
+class CSVLog:
+    fields = ["time", "errors", "words",
+              "ber", "ber_low", "ber_high",
+              "cumulative_ber", "cumulative_ber_low", "cumulative_ber_high"]
+
+    def __init__(self, filename):
+        self.file = open(filename, "a")
+        if not self.file.tell():
+            self.file.write(",".join(self.fields) + "\n")
+
+    def write(self, sample, interval, cumulative):
+        self.file.write("{:.6f},{},{},{}\n".format(
+            sample.time, sample.errors, sample.words,
+            ",".join(_format(value) for value in interval + cumulative)))
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+_record = struct.Struct("<dQQ")
+
+
+class BinaryLog:
+    def __init__(self, filename):
+        self.file = open(filename, "ab")
+
+    def write(self, sample, interval, cumulative):
+        self.file.write(_record.pack(*sample))
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+def read_binary_log(filename):
+    with open(filename, "rb") as f:
+        data = f.read()
+    data = data[:len(data) - len(data) % _record.size]
+    return [Sample(*record) for record in _record.iter_unpack(data)]
+
+
+def write_prometheus(filename, labels, sample, interval, cumulative):
+    label_text = ",".join("{}=\"{}\"".format(name, value)
+                          for name, value in sorted(labels.items()))
+    metrics = [
+        ("prbs_errors_total", "counter",
+         "PRBS errors since the start of monitoring", sample.errors),
+        ("prbs_words_total", "counter",
+         "PRBS words checked since the start of monitoring", sample.words),
+        ("prbs_ber", "gauge",
+         "Bit error ratio since the start of monitoring", cumulative.ber),
+        ("prbs_ber_low", "gauge",
+         "Lower confidence bound of prbs_ber", cumulative.low),
+        ("prbs_ber_high", "gauge",
+         "Upper confidence bound of prbs_ber", cumulative.high),
+        ("prbs_ber_interval", "gauge",
+         "Bit error ratio over the last sampling interval", interval.ber),
+    ]
+    lines = []
+    for name, kind, help_text, value in metrics:
+        if value is None:
+            continue
+        lines.append("# HELP {} {}".format(name, help_text))
+        lines.append("# TYPE {} {}".format(name, kind))
+        lines.append("{}{{{}}} {}".format(name, label_text, value))
+    temporary = filename + ".tmp"
+    with open(temporary, "w") as f:
+        f.write("\n".join(lines) + "\n")
+    os.replace(temporary, filename)
+
+
+# Samples at rate Hz for duration seconds (forever if None). Logs are
+# flushed, the Prometheus file is rewritten and a summary line is printed
+# every report_interval seconds.
+def run(monitor, rate, duration=None, logs=(), prometheus=None,
+        report_interval=1.0, out=print):
+    period = 1/rate
+    labels = {"port": monitor.comm.port.name}
+    start = time.monotonic()
+    deadline = start
+    next_report = start + report_interval
+    previous = monitor.sample()
+    try:
+        while duration is None or deadline - start < duration:
+            deadline += period
+            delay = deadline - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            elif -delay > period:
+                # fell behind, skip the missed samples
+                deadline = time.monotonic()
+            sample = monitor.sample()
+            interval = monitor.interval_ber(previous, sample)
+            cumulative = monitor.cumulative_ber()
+            for log in logs:
+                log.write(sample, interval, cumulative)
+            previous = sample
+            if deadline >= next_report:
+                next_report = deadline + report_interval
+                for log in logs:
+                    log.flush()
+                if prometheus is not None:
+                    write_prometheus(prometheus, labels, sample, interval,
+                                     cumulative)
+                out("errors={} words={} BER={} [{}, {}]".format(
+                    sample.errors, sample.words,
+                    *(_format(value) for value in cumulative)))
+    finally:
+        for log in logs:
+            log.close()
@@ -0,0 +1,71 @@
+import hashlib
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+
+def _sources_digest(platform, build_dir, build_name):
+    digest = hashlib.sha256()
+    filenames = [os.path.join(build_dir, build_name + extension)
+                 for extension in (".v", ".xdc", ".tcl")]
+    filenames += sorted(filename for filename, language, library
+                        in platform.sources)
+    for filename in filenames:
+        if os.path.exists(filename):
+            digest.update(filename.encode())
+            with open(filename, "rb") as f:
+                digest.update(f.read())
+    return digest.hexdigest()
+
+
+# Generates the Verilog, constraints and Vivado script of the design, and
+# runs Vivado only if they differ from those of the last successful build
+# in build_dir (or if there is no bitstream there). Returns True if Vivado
+# was run.
+def build(platform, top, build_dir, build_name="top", cache=True):
+    platform.build(top, build_dir=build_dir, build_name=build_name, run=False)
+    digest = _sources_digest(platform, build_dir, build_name)
+    stamp = os.path.join(build_dir, build_name + ".sha256")
+    bitstream = os.path.join(build_dir, build_name + ".bit")
+    if cache and os.path.exists(bitstream) and os.path.exists(stamp):
+        with open(stamp) as f:
+            if f.read().strip() == digest:
+                print("{}: design unchanged, skipping Vivado".format(build_dir))
+                return False
+    if os.path.exists(stamp):
+        os.remove(stamp)
+
+    try:
+        # private Migen helper, imported here so that the module (and builds
+        # without the cache) do not depend on it
+        from migen.build.xilinx.vivado import _run_vivado
+    except ImportError:
+        print("{}: migen.build.xilinx.vivado._run_vivado not found, "
+              "cannot run Vivado on the generated sources, rebuilding with "
+              "platform.build".format(build_dir))
+        platform.build(top, build_dir=build_dir, build_name=build_name)
+    else:
+        cwd = os.getcwd()
+        os.chdir(build_dir)
+        try:
+            _run_vivado(build_name)
+        finally:
+            os.chdir(cwd)
+    with open(stamp, "w") as f:
+        f.write(digest + "\n")
+    return True
+
+
+# Calls each of the given functions in its own worker process (builds
+# change the working directory, so they cannot share one) and waits for all
+# of them. The functions and their arguments must be picklable.
+def run_parallel(calls):
+    if not calls:
+        return
+    if len(calls) == 1:
+        function, args = calls[0]
+        function(*args)
+        return
+    with ProcessPoolExecutor(max_workers=len(calls)) as executor:
+        futures = [executor.submit(function, *args) for function, args in calls]
+        for future in futures:
+            future.result()
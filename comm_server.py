@@ -0,0 +1,117 @@
+#!/usr/bin/env python3.5
+
+# Keeps the connection to a board open and shares it between several host
+# tools. Clients connect to a Unix socket and speak the raw bridge protocol
+# (see wishbonebridge.py) over it; CommUART and AsyncCommUART do this when
+# given unix://<socket path> as their port, e.g.:
+#   ./comm_server.py /dev/ttyUSB1 /tmp/prbs_rx.sock &
+#   ./demo_prbs.py --readout unix:///tmp/prbs_rx.sock
+# The connection to the board itself may use the framed protocol.
+# Bus transactions are serialized, and identical reads issued while one of
+# them is still pending are answered from a single bus transaction.
+
+import argparse
+import asyncio
+import logging
+import os
+
+from comm_uart import CommProtocol, _raw_header, decode_words, encode_words
+from comm_uart_async import AsyncCommUART
+
+
+logger = logging.getLogger(__name__)
+
+
+class CommServer:
+    def __init__(self, comm):
+        self.comm = comm
+        self.coalesced_reads = 0
+        self._pending_reads = dict()
+
+    async def read(self, addr, length):
+        key = (addr, length)
+        future = self._pending_reads.get(key)
+        if future is None:
+            future = asyncio.ensure_future(self.comm.read_block(addr, length))
+            self._pending_reads[key] = future
+            def done(future):
+                if self._pending_reads.get(key) is future:
+                    del self._pending_reads[key]
+            future.add_done_callback(done)
+        else:
+            self.coalesced_reads += 1
+        return await asyncio.shield(future)
+
+    async def write(self, addr, data):
+        # reads issued from now on must see this write
+        self._pending_reads.clear()
+        await self.comm.write_block(addr, data)
+
+    async def handle_client(self, reader, writer):
+        logger.debug("client connected")
+        msg_type = CommProtocol.msg_type
+        try:
+            while True:
+                try:
+                    header = await reader.readexactly(_raw_header.size)
+                except asyncio.IncompleteReadError:
+                    break
+                cmd, length, addr = _raw_header.unpack(header)
+                if cmd == msg_type["write"]:
+                    data = await reader.readexactly(4*length)
+                    await self.write(4*addr, decode_words(data))
+                elif cmd == msg_type["read"]:
+                    data = await self.read(4*addr, length)
+                    writer.write(encode_words(data))
+                    await writer.drain()
+                else:
+                    logger.error("invalid command 0x%02x from client, "
+                                 "disconnecting", cmd)
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        except TimeoutError:
+            logger.error("board not responding, disconnecting client",
+                         exc_info=True)
+        finally:
+            writer.close()
+            logger.debug("client disconnected")
+
+    def serve(self, path):
+        return asyncio.start_unix_server(self.handle_client, path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bridge connection sharing daemon")
+    parser.add_argument("serial_port", metavar="SERIAL_PORT",
+                        help="serial device of the board")
+    parser.add_argument("socket", metavar="SOCKET",
+                        help="path of the Unix socket to listen on")
+    parser.add_argument("--baudrate", default=115200, type=int)
+    parser.add_argument("--framed", default=False, action="store_true",
+                        help="use the framed, CRC-protected bridge protocol "
+                             "towards the board")
+    parser.add_argument("-v", "--verbose", default=0, action="count")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING - 10*args.verbose)
+
+    loop = asyncio.get_event_loop()
+    comm = AsyncCommUART(args.serial_port, args.baudrate, framed=args.framed)
+    server = CommServer(comm)
+    listener = loop.run_until_complete(server.serve(args.socket))
+    try:
+        loop.run_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        listener.close()
+        loop.run_until_complete(listener.wait_closed())
+        loop.close()
+        comm.close()
+        os.unlink(args.socket)
+        logger.info("%d reads coalesced", server.coalesced_reads)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,210 @@
 import logging
+import random
+import socket
+import struct
+import sys
+import time
+from array import array
+from collections import deque, namedtuple
+from concurrent.futures import Future
+from functools import lru_cache
+
 import serial
 
 
 logger = logging.getLogger(__name__)
 
 
-class CommUART:
+def _make_crc16_table():
+    table = []
+    for i in range(256):
+        crc = i << 8
+        for _ in range(8):
+            if crc & 0x8000:
+                crc = ((crc << 1) ^ 0x1021) & 0xffff
+            else:
+                crc = (crc << 1) & 0xffff
+        table.append(crc)
+    return table
+
+_crc16_table = _make_crc16_table()
+
+
+# CRC-16/CCITT as computed by the framed mode of WishboneStreamingBridge
+def crc16(data, crc=0xffff):
+    for octet in data:
+        crc = ((crc << 8) & 0xffff) ^ _crc16_table[(crc >> 8) ^ octet]
+    return crc
+
+
+word_typecode = "I" if array("I").itemsize == 4 else "L"
+
+_raw_header = struct.Struct(">BBI")
+_framed_header = struct.Struct(">BBBBI")
+_crc = struct.Struct(">H")
+
+
+@lru_cache(maxsize=None)
+def _words(n):
+    return struct.Struct(">{}I".format(n))
+
+
+# Converts big-endian bytes into an array of 32-bit words
+def decode_words(data):
+    words = array(word_typecode)
+    words.frombytes(data)
+    if sys.byteorder == "little":
+        words.byteswap()
+    return words
+
+
+# Converts 32-bit words into big-endian bytes
+def encode_words(words):
+    return _words(len(words)).pack(*words)
+
+
+# Minimal pyserial-like port talking to a comm_server.py daemon
+class UnixSocketPort:
+    def __init__(self, path, timeout=None):
+        self.name = "unix://" + path
+        self.timeout = timeout
+        self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.socket.connect(path)
+        self.socket.settimeout(timeout)
+
+    def close(self):
+        self.socket.close()
+
+    def fileno(self):
+        return self.socket.fileno()
+
+    @property
+    def in_waiting(self):
+        # POSIX only, like unix sockets; not imported at the top so that the
+        # serial ports work wherever pyserial does
+        import fcntl
+        import termios
+
+        buf = bytearray(4)
+        fcntl.ioctl(self.socket, termios.FIONREAD, buf)
+        return int.from_bytes(buf, sys.byteorder)
+
+    def read(self, size=1):
+        data = bytearray()
+        if self.timeout is not None:
+            deadline = time.monotonic() + self.timeout
+        while len(data) < size:
+            try:
+                chunk = self.socket.recv(size - len(data))
+            except (socket.timeout, BlockingIOError):
+                break
+            if not chunk:
+                break
+            data += chunk
+            if self.timeout:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self.socket.settimeout(remaining)
+        if self.timeout:
+            self.socket.settimeout(self.timeout)
+        return bytes(data)
+
+    def write(self, data):
+        self.socket.sendall(data)
+        return len(data)
+
+    def reset_input_buffer(self):
+        self.socket.setblocking(False)
+        try:
+            while self.socket.recv(4096):
+                pass
+        except BlockingIOError:
+            pass
+        finally:
+            self.socket.settimeout(self.timeout)
+
+
+# Opens a serial port URL (see serial.serial_for_url), a connection to a
+# comm_server.py daemon given as unix://<socket path>, or an emulated board
+# given as virtual://[<options>] (see virtual_board.py). Objects that are
+# not strings are assumed to be open ports and are returned unchanged.
+def open_port(port, baudrate, timeout):
+    if not isinstance(port, str):
+        return port
+    if port.startswith("unix://"):
+        return UnixSocketPort(port[len("unix://"):], timeout)
+    if port.startswith("virtual://"):
+        from virtual_board import VirtualBoardPort
+        return VirtualBoardPort.from_url(port, timeout)
+    return serial.serial_for_url(port, baudrate, timeout=timeout)
+
+
+# Request encoding shared by the blocking and asyncio clients
+class CommProtocol:
     msg_type = {
         "write": 0x01,
         "read":  0x02
     }
-    def __init__(self, port, baudrate=115200):
-        self.port = serial.serial_for_url(port, baudrate)
+    sync_byte = 0x5a
+    max_length = 255
+
+    def __init__(self, framed, retries, max_write_length):
+        self.framed = framed
+        self.retries = retries
+        self.max_write_length = max_write_length
+        # Random, so that the first request of a session is unlikely to
+        # repeat the last SEQ of the previous session, which the bridge would
+        # take for a retry if it came within its seq_timeout
+        self.seq = random.randrange(256)
+
+        # requests are assembled here and sent with a single write
+        self._request = bytearray(_framed_header.size + 4*self.max_length
+                                  + _crc.size)
+        self._request_view = memoryview(self._request)
+
+    # Assembles a request into the request buffer and returns its length
+    def _pack_request(self, cmd, addr, length, data=None):
+        if self.framed:
+            self.seq = (self.seq + 1) & 0xff
+            _framed_header.pack_into(self._request, 0, self.sync_byte,
+                                     self.seq, cmd, length, addr//4)
+            n = _framed_header.size
+        else:
+            _raw_header.pack_into(self._request, 0, cmd, length, addr//4)
+            n = _raw_header.size
+        if data is not None:
+            _words(length).pack_into(self._request, n, *data)
+            n += 4*length
+        if self.framed:
+            _crc.pack_into(self._request, n, crc16(self._request_view[1:n]))
+            n += _crc.size
+        return n
+
+    # Takes a framed reply without its SYNC byte, returns the payload or
+    # None if the reply is invalid
+    @staticmethod
+    def _check_framed_reply(seq, reply):
+        if reply[0] != seq or crc16(reply) != 0:
+            return None
+        return reply[1:-_crc.size]
+
+    @staticmethod
+    def _framed_reply_length(reply_length):
+        return 1 + reply_length + _crc.size
+
+
+class CommUART(CommProtocol):
+    # In framed mode (see wishbonebridge.py), timeout defaults to 0.25s and
+    # each transaction is attempted up to 1+retries times. In raw mode,
+    # timeout defaults to None (block forever). When a read times out, a
+    # TimeoutError is raised.
+    def __init__(self, port, baudrate=115200, framed=False, timeout=None,
+                 retries=3, max_write_length=16):
+        CommProtocol.__init__(self, framed, retries, max_write_length)
+        if framed and timeout is None:
+            timeout = 0.25
+        self.port = open_port(port, baudrate, timeout)
 
     def close(self):
         self.port.close()
@@ -22,29 +215,214 @@ class CommUART:
     def __exit__(self, type, value, traceback):
         self.close()
 
-    def read(self, addr, length=None):
-        data = []
-        length_int = 1 if length is None else length
-        self.port.write([self.msg_type["read"], length_int])
-        self.port.write((addr//4).to_bytes(4, byteorder="big"))
-        for i in range(length_int):
-            value = int.from_bytes(self.port.read(4), "big")
-            logger.debug("read %08x @ %08x", value, addr + 4*i)
-            if length is None:
-                return value
-            data.append(value)
+    def _read_exact(self, n):
+        data = self.port.read(n)
+        if len(data) != n:
+            raise TimeoutError("timeout reading from {}".format(self.port.name))
         return data
 
-    def write(self, addr, data):
-        data = data if isinstance(data, list) else [data]
+    def _receive_framed_reply(self, seq, reply_length):
+        try:
+            # skip leftovers from earlier garbled exchanges
+            while self._read_exact(1)[0] != self.sync_byte:
+                pass
+            reply = self._read_exact(self._framed_reply_length(reply_length))
+        except TimeoutError:
+            return None
+        return self._check_framed_reply(seq, reply)
+
+    def _framed_transaction(self, request, seq, reply_length, retry=False):
+        for attempt in range(1 + self.retries):
+            if attempt or retry:
+                logger.warning("retrying transaction %d (attempt %d)",
+                               seq, attempt + 1 + retry)
+                self.port.reset_input_buffer()
+            self.port.write(request)
+            reply = self._receive_framed_reply(seq, reply_length)
+            if reply is not None:
+                return reply
+        raise TimeoutError("no valid reply to transaction {} after {} attempts"
+                           .format(seq, 1 + self.retries))
+
+    def read_block(self, addr, length):
+        data = array(word_typecode)
+        offset = 0
+        while offset < length:
+            size = min(length - offset, self.max_length)
+            n = self._pack_request(self.msg_type["read"], addr + 4*offset, size)
+            if self.framed:
+                reply = self._framed_transaction(self._request_view[:n],
+                                                 self.seq, 4*size)
+            else:
+                self.port.write(self._request_view[:n])
+                reply = self._read_exact(4*size)
+            data.extend(decode_words(reply))
+            offset += size
+        if logger.isEnabledFor(logging.DEBUG):
+            for i, value in enumerate(data):
+                logger.debug("read %08x @ %08x", value, addr + 4*i)
+        return data
+
+    def write_block(self, addr, data):
         length = len(data)
+        max_length = self.max_write_length if self.framed else self.max_length
         offset = 0
-        while length:
-            size = min(length, 255)
-            self.port.write([self.msg_type["write"], size])
-            self.port.write(((addr+offset)//4).to_bytes(4, byteorder="big"))
-            for i, value in enumerate(data[offset:offset+size]):
-                self.port.write(value.to_bytes(4, byteorder="big"))
-                logger.debug("write %08x @ %08x", value, addr + offset, 4*i)
+        while offset < length:
+            size = min(length - offset, max_length)
+            n = self._pack_request(self.msg_type["write"], addr + 4*offset,
+                                   size, data[offset:offset+size])
+            if self.framed:
+                self._framed_transaction(self._request_view[:n], self.seq, 0)
+            else:
+                self.port.write(self._request_view[:n])
             offset += size
-            length -= size
+        if logger.isEnabledFor(logging.DEBUG):
+            for i, value in enumerate(data):
+                logger.debug("write %08x @ %08x", value, addr + 4*i)
+
+    # Requests issued on the returned object are sent back to back when it
+    # is flushed (at the latest when leaving its with block), without waiting
+    # for each reply. window is the number of request bytes that may be sent
+    # ahead of the replies, and must not exceed the FIFO depth of the bridge.
+    def batch(self, window=64):
+        return Batch(self, window)
+
+    def read(self, addr, length=None):
+        if length is None:
+            return self.read_block(addr, 1)[0]
+        else:
+            return self.read_block(addr, length).tolist()
+
+    def write(self, addr, data):
+        if isinstance(data, int):
+            data = [data]
+        self.write_block(addr, data)
+
+
+_Request = namedtuple("_Request", "start end seq reply_length future decode")
+
+
+class Batch:
+    def __init__(self, comm, window):
+        self.comm = comm
+        self.window = window
+        self.buffer = bytearray()
+        self.requests = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        if type is None:
+            self.flush()
+
+    def _add(self, cmd, addr, length, data, reply_length, decode):
+        n = self.comm._pack_request(cmd, addr, length, data)
+        start = len(self.buffer)
+        self.buffer += self.comm._request_view[:n]
+        future = Future()
+        self.requests.append(_Request(start, start + n, self.comm.seq,
+                                      reply_length, future, decode))
+        return future
+
+    # Returns a Future whose result is what CommUART.read would have returned
+    def read(self, addr, length=None):
+        length_int = 1 if length is None else length
+        if length_int > self.comm.max_length:
+            raise ValueError("batched reads are limited to {} words"
+                             .format(self.comm.max_length))
+        if length is None:
+            decode = lambda reply: decode_words(reply)[0]
+        else:
+            decode = lambda reply: decode_words(reply).tolist()
+        return self._add(self.comm.msg_type["read"], addr, length_int, None,
+                         4*length_int, decode)
+
+    # Returns a Future that completes once the write has been sent (raw mode)
+    # or acknowledged (framed mode)
+    def write(self, addr, data):
+        if isinstance(data, int):
+            data = [data]
+        max_length = (self.comm.max_write_length if self.comm.framed
+                      else self.comm.max_length)
+        reply_length = 0 if self.comm.framed else None
+        future = None
+        for offset in range(0, len(data), max_length):
+            size = min(len(data) - offset, max_length)
+            future = self._add(self.comm.msg_type["write"], addr + 4*offset,
+                               size, data[offset:offset+size], reply_length,
+                               lambda reply: None)
+        return future
+
+    def _complete(self, request, reply):
+        if reply is None:
+            request.future.set_result(None)
+        else:
+            request.future.set_result(request.decode(reply))
+
+    # Waits until the oldest reply arrives and retires all requests up to it.
+    # Requests without replies can be retired once all replies have arrived,
+    # as the bridge is then only consuming.
+    def _retire(self, in_flight):
+        comm = self.comm
+        if all(request.reply_length is None for request in in_flight):
+            while in_flight:
+                self._complete(in_flight.popleft(), None)
+            return
+        while True:
+            request = in_flight.popleft()
+            if request.reply_length is None:
+                self._complete(request, None)
+                continue
+            if comm.framed:
+                reply = comm._receive_framed_reply(request.seq,
+                                                   request.reply_length)
+                if reply is None:
+                    # fall back to one request at a time; reusing the
+                    # sequence number keeps a retried write from being
+                    # executed twice
+                    for request in [request] + list(in_flight):
+                        reply = comm._framed_transaction(
+                            self.buffer[request.start:request.end],
+                            request.seq, request.reply_length, retry=True)
+                        self._complete(request, reply)
+                    in_flight.clear()
+                    return
+            else:
+                reply = comm._read_exact(request.reply_length)
+            self._complete(request, reply)
+            return
+
+    def flush(self):
+        comm = self.comm
+        view = memoryview(self.buffer)
+        in_flight = deque()
+        try:
+            for request in self.requests:
+                # the bridge only remembers the last sequence number, so
+                # framed writes are not overlapped with other requests to
+                # make sure that retrying them is safe
+                barrier = comm.framed and request.reply_length == 0
+                while in_flight and (barrier or
+                        self._in_flight_length(in_flight)
+                        + request.end - request.start > self.window):
+                    self._retire(in_flight)
+                comm.port.write(view[request.start:request.end])
+                in_flight.append(request)
+                while barrier and in_flight:
+                    self._retire(in_flight)
+            while in_flight:
+                self._retire(in_flight)
+        except Exception as e:
+            for request in self.requests:
+                if not request.future.done():
+                    request.future.set_exception(e)
+            raise
+        finally:
+            view.release()
+            self.buffer = bytearray()
+            self.requests = []
+
+    @staticmethod
+    def _in_flight_length(in_flight):
+        return in_flight[-1].end - in_flight[0].start
@@ -0,0 +1,155 @@
+import asyncio
+import logging
+from array import array
+
+from comm_uart import CommProtocol, decode_words, open_port, word_typecode
+
+
+logger = logging.getLogger(__name__)
+
+
+# asyncio counterpart of CommUART, with the same read/write semantics.
+# The port is opened in non-blocking mode; on ports that have a file
+# descriptor the event loop is woken up when data arrives, others (e.g.
+# loop://) are polled every poll_interval seconds.
+# Transactions on one port are serialized, transactions on different ports
+# run concurrently. Unlike CommUART, reads time out by default in raw mode
+# too (after 1s), so that a board that does not respond cannot stall
+# the others; the input buffer is then flushed, as a late reply would be
+# taken for the next one.
+class AsyncCommUART(CommProtocol):
+    def __init__(self, port, baudrate=115200, framed=False, timeout=None,
+                 retries=3, max_write_length=16, poll_interval=1e-3):
+        CommProtocol.__init__(self, framed, retries, max_write_length)
+        if timeout is None:
+            timeout = 0.25 if framed else 1.0
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+        self.port = open_port(port, baudrate, 0)
+        try:
+            self._fd = self.port.fileno()
+        except (AttributeError, NotImplementedError, ValueError):
+            self._fd = None
+        self._rx = bytearray()
+        self._lock = asyncio.Lock()
+
+    def close(self):
+        self.port.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, type, value, traceback):
+        self.close()
+
+    async def _wait_readable(self, timeout):
+        loop = asyncio.get_event_loop()
+        if self._fd is None:
+            if timeout is None:
+                timeout = self.poll_interval
+            await asyncio.sleep(min(timeout, self.poll_interval))
+            return
+        readable = loop.create_future()
+        loop.add_reader(self._fd, lambda: readable.done() or readable.set_result(None))
+        try:
+            await asyncio.wait_for(readable, timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            loop.remove_reader(self._fd)
+
+    async def _read_exact(self, n):
+        loop = asyncio.get_event_loop()
+        deadline = None if self.timeout is None else loop.time() + self.timeout
+        while True:
+            self._rx += self.port.read(self.port.in_waiting)
+            if len(self._rx) >= n:
+                break
+            remaining = None if deadline is None else deadline - loop.time()
+            if remaining is not None and remaining <= 0:
+                raise TimeoutError("timeout reading from {}".format(self.port.name))
+            await self._wait_readable(remaining)
+        data = bytes(self._rx[:n])
+        del self._rx[:n]
+        return data
+
+    def _reset_input_buffer(self):
+        self.port.reset_input_buffer()
+        self._rx.clear()
+
+    async def _receive_framed_reply(self, seq, reply_length):
+        try:
+            # skip leftovers from earlier garbled exchanges
+            while (await self._read_exact(1))[0] != self.sync_byte:
+                pass
+            reply = await self._read_exact(self._framed_reply_length(reply_length))
+        except TimeoutError:
+            return None
+        return self._check_framed_reply(seq, reply)
+
+    async def _framed_transaction(self, request, seq, reply_length):
+        for attempt in range(1 + self.retries):
+            if attempt:
+                logger.warning("retrying transaction %d (attempt %d)",
+                               seq, attempt + 1)
+                self._reset_input_buffer()
+            self.port.write(request)
+            reply = await self._receive_framed_reply(seq, reply_length)
+            if reply is not None:
+                return reply
+        raise TimeoutError("no valid reply to transaction {} after {} attempts"
+                           .format(seq, 1 + self.retries))
+
+    async def read_block(self, addr, length):
+        data = array(word_typecode)
+        offset = 0
+        async with self._lock:
+            while offset < length:
+                size = min(length - offset, self.max_length)
+                n = self._pack_request(self.msg_type["read"], addr + 4*offset, size)
+                if self.framed:
+                    reply = await self._framed_transaction(
+                        bytes(self._request_view[:n]), self.seq, 4*size)
+                else:
+                    self.port.write(self._request_view[:n])
+                    try:
+                        reply = await self._read_exact(4*size)
+                    except TimeoutError:
+                        self._reset_input_buffer()
+                        raise
+                data.extend(decode_words(reply))
+                offset += size
+        if logger.isEnabledFor(logging.DEBUG):
+            for i, value in enumerate(data):
+                logger.debug("read %08x @ %08x", value, addr + 4*i)
+        return data
+
+    async def write_block(self, addr, data):
+        length = len(data)
+        max_length = self.max_write_length if self.framed else self.max_length
+        offset = 0
+        async with self._lock:
+            while offset < length:
+                size = min(length - offset, max_length)
+                n = self._pack_request(self.msg_type["write"], addr + 4*offset,
+                                       size, data[offset:offset+size])
+                if self.framed:
+                    await self._framed_transaction(
+                        bytes(self._request_view[:n]), self.seq, 0)
+                else:
+                    self.port.write(self._request_view[:n])
+                offset += size
+        if logger.isEnabledFor(logging.DEBUG):
+            for i, value in enumerate(data):
+                logger.debug("write %08x @ %08x", value, addr + 4*i)
+
+    async def read(self, addr, length=None):
+        if length is None:
+            return (await self.read_block(addr, 1))[0]
+        else:
+            return (await self.read_block(addr, length)).tolist()
+
+    async def write(self, addr, data):
+        if isinstance(data, int):
+            data = [data]
+        await self.write_block(addr, data)
@@ -0,0 +1,54 @@
+from operator import xor
+from functools import reduce
+
+from migen import *
+
+
+# Parallel CRC update, MSB first, no reflection.
+# next is the register value after shifting in all bits of data,
+# starting with data[-1].
+class CRCEngine(Module):
+    def __init__(self, data_width, width=16, polynom=0x1021):
+        self.data = Signal(data_width)
+        self.last = Signal(width)
+        self.next = Signal(width)
+
+        # # #
+
+        # each bit of the register is tracked as a set of XOR terms
+        state = [{("last", i)} for i in range(width)]
+        for i in reversed(range(data_width)):
+            feedback = state[-1] ^ {("data", i)}
+            new_state = []
+            for j in range(width):
+                terms = state[j-1] if j else set()
+                if polynom & (1 << j):
+                    terms = terms ^ feedback
+                new_state.append(terms)
+            state = new_state
+
+        for i, terms in enumerate(state):
+            inputs = [getattr(self, kind)[n] for kind, n in sorted(terms)]
+            self.comb += self.next[i].eq(reduce(xor, inputs, 0))
+
+
+class CRC16(Module):
+    def __init__(self, data_width=8):
+        self.data = Signal(data_width)
+        self.ce = Signal()
+        self.reset = Signal()
+        self.value = Signal(16, reset=0xffff)
+
+        # # #
+
+        self.submodules.engine = CRCEngine(data_width)
+        self.comb += [
+            self.engine.data.eq(self.data),
+            self.engine.last.eq(self.value)
+        ]
+        self.sync += \
+            If(self.reset,
+                self.value.eq(self.value.reset)
+            ).Elif(self.ce,
+                self.value.eq(self.engine.next)
+            )
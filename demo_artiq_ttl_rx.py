@@ -1,18 +1,25 @@
 #!/usr/bin/env python3.5
 
+import argparse
+
 from migen import *
 from migen.build.platforms import kc705
 from misoc.cores.uart import RS232PHY
 
-from gtx import GTXReceiver
+from gtx import GTXReceiver, GTXTransceiver
 from ttl_xm105 import ttl_extension
 from sequencer import Sequencer
 from i2c import I2CMaster
 from si5324_kc705 import get_i2c_program, Si5324ClockRouter
+from remote_ttl import (protocols, FrameLayout, StateRX, DeltaRX, EventRX,
+                        InputTX)
 
 
+# ninputs TTLs, after those driven by the first 32 channels, are inputs sent
+# back to the transmitter (with the events protocol).
 class ARTIQTTLRX(Module):
-    def __init__(self, platform):
+    def __init__(self, platform, protocol="state", nchannels=32, crc=False,
+                 ninputs=0):
         platform.add_extension(ttl_extension)
 
         sys_clock_pads = platform.request("clk156")
@@ -23,10 +30,21 @@ class ARTIQTTLRX(Module):
         sys_clk_freq = 156000000
         self.comb += platform.request("sfp_tx_disable_n").eq(1)
 
-        gtx = GTXReceiver(
-            clock_pads=platform.request("sgmii_clock"),
-            rx_pads=platform.request("sfp_rx"),
-            sys_clk_freq=sys_clk_freq)
+        if ninputs:
+            if protocol != "events":
+                raise ValueError("remote inputs need the events protocol")
+            if ninputs > 10:
+                raise ValueError("at most 10 inputs")
+            gtx = GTXTransceiver(
+                clock_pads=platform.request("sgmii_clock"),
+                tx_pads=platform.request("sfp_tx"),
+                rx_pads=platform.request("sfp_rx"),
+                sys_clk_freq=sys_clk_freq)
+        else:
+            gtx = GTXReceiver(
+                clock_pads=platform.request("sgmii_clock"),
+                rx_pads=platform.request("sfp_rx"),
+                sys_clk_freq=sys_clk_freq)
         self.submodules += gtx
 
         # clean up GTX clock using Si5324
@@ -37,24 +55,24 @@ class ARTIQTTLRX(Module):
         self.comb += sequencer.bus.connect(i2c_master.bus)
 
         # decode frames
-        back_buffer = Signal(32)
-        front_buffer = Signal(32)
-        frame_hi = Signal()
-        self.sync.rx_clean += [
-            If(gtx.decoders[0].k,
-                front_buffer.eq(back_buffer),
-                frame_hi.eq(0)
-            ).Else(
-                If(frame_hi,
-                    back_buffer[16:].eq(
-                        Cat(gtx.decoders[0].d, gtx.decoders[1].d))
-                ).Else(
-                    back_buffer[:16].eq(
-                        Cat(gtx.decoders[0].d, gtx.decoders[1].d))
-                ),
-                frame_hi.eq(1)
-            )
+        lanes = len(gtx.decoders)
+        if protocol == "state":
+            link = StateRX(FrameLayout(nchannels, lanes, crc))
+        elif protocol == "delta":
+            link = DeltaRX(nchannels, lanes)
+        elif protocol == "events":
+            link = EventRX(nchannels, lanes)
+        else:
+            raise ValueError("unknown protocol {}".format(protocol))
+        link = ClockDomainsRenamer("rx_clean")(link)
+        self.submodules += link
+        self.comb += [
+            [link.k[i].eq(gtx.decoders[i].k) for i in range(lanes)],
+            [link.d[i].eq(gtx.decoders[i].d) for i in range(lanes)]
         ]
+        # only the first 32 channels have outputs
+        front_buffer = Signal(max(nchannels, 32))
+        self.comb += front_buffer.eq(link.values)
 
         # drive TTLs
         self.comb += [
@@ -66,10 +84,40 @@ class ARTIQTTLRX(Module):
         for i in range(22):
             self.comb += platform.request("ttl").eq(front_buffer[10+i])
 
+        # capture inputs, timestamped with the time of the transmitter
+        if ninputs:
+            inputs = ClockDomainsRenamer("rx_clean")(InputTX(ninputs, lanes))
+            self.submodules += inputs
+            self.comb += [
+                inputs.inputs.eq(Cat(*[platform.request("ttl")
+                                       for i in range(ninputs)])),
+                inputs.time.eq(link.now),
+                [gtx.encoder.k[i].eq(inputs.k[i]) for i in range(lanes)],
+                [gtx.encoder.d[i].eq(inputs.d[i]) for i in range(lanes)]
+            ]
+
 
 def main():
+    parser = argparse.ArgumentParser(
+        description="ARTIQ remote TTL demo (receiver)")
+    parser.add_argument("--protocol", default="state", choices=protocols,
+                        help="remote TTL protocol, the same as the "
+                             "transmitter (default: %(default)s)")
+    parser.add_argument("--channels", default=32, type=int,
+                        help="number of remote TTL channels, the same as the "
+                             "transmitter (default: %(default)s)")
+    parser.add_argument("--crc", action="store_true",
+                        help="check the CRC of the frames of the state "
+                             "protocol, as the transmitter")
+    parser.add_argument("--inputs", default=0, type=int,
+                        help="number of TTL inputs sent back to the "
+                             "transmitter, as the transmitter "
+                             "(default: %(default)s)")
+    args = parser.parse_args()
+
     platform = kc705.Platform()
-    top = ARTIQTTLRX(platform)
+    top = ARTIQTTLRX(platform, args.protocol, args.channels, args.crc,
+                     args.inputs)
     platform.build(top, build_dir="artiq_ttl_rx")
 
 if __name__ == "__main__":
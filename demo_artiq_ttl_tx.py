@@ -13,20 +13,46 @@ from artiq.gateware import rtio
 from artiq.gateware.rtio.phy import ttl_simple
 
 from ttl_xm105 import ttl_extension
-from gtx import GTXTransmitter
+from gtx import GTXTransmitter, GTXTransceiver
+from remote_ttl import (protocols, FrameLayout, StateTX, DeltaTX, EventTX,
+                        InputRX, LatencyMeter, DelayLine)
 
 
+# With loopback_pad (an input connected to the first remote output),
+# latency_channel is an RTIO channel that measures the latency of the remote
+# outputs (write to address 0) and returns it in RTIO cycles as an input
+# (0xffff if the loopback failed), and compensation is the delay to apply
+# to the local outputs, set to the measured latency or written to address 1.
+#
+# With ninputs (and rx_pads for the return link, with the events protocol),
+# rtio_input_channels are the RTIO TTL input channels of the inputs of the
+# receiver. Their events are timestamped by the receiver and reach the RTIO
+# core a constant time after the edges.
 class RemoteTTLChannels(Module):
-    def __init__(self, clock_pads, tx_pads, sys_clk_freq, **kwargs):
+    def __init__(self, clock_pads, tx_pads, sys_clk_freq, protocol="state",
+                 nchannels=32, crc=False, loopback_pad=None, rx_pads=None,
+                 ninputs=0, **kwargs):
         self.clock_domains.cd_rtio = ClockDomain()
         self.rtio_channels = []
+        self.rtio_input_channels = []
+        self.latency_channel = None
+        self.compensation = Signal(8)
 
         # # #
 
-        gtx = GTXTransmitter(
-            clock_pads=clock_pads,
-            tx_pads=tx_pads,
-            sys_clk_freq=sys_clk_freq)
+        if ninputs:
+            if protocol != "events":
+                raise ValueError("remote inputs need the events protocol")
+            gtx = GTXTransceiver(
+                clock_pads=clock_pads,
+                tx_pads=tx_pads,
+                rx_pads=rx_pads,
+                sys_clk_freq=sys_clk_freq)
+        else:
+            gtx = GTXTransmitter(
+                clock_pads=clock_pads,
+                tx_pads=tx_pads,
+                sys_clk_freq=sys_clk_freq)
         self.submodules += gtx
 
         self.comb += [
@@ -34,34 +60,95 @@ class RemoteTTLChannels(Module):
             self.cd_rtio.rst.eq(ResetSignal("tx")),
         ]
 
-        ttl_values = Signal(32)
-        frame_counter = Signal(max=3)
-        self.sync.tx += [
-            If(frame_counter == 0,
-                gtx.encoder.k[0].eq(1),
-                gtx.encoder.d[0].eq((5 << 5) | 28),
-                gtx.encoder.k[1].eq(0),
-                gtx.encoder.d[1].eq(0),
-                frame_counter.eq(1),
-            ).Elif(frame_counter == 1,
-                gtx.encoder.k[0].eq(0),
-                gtx.encoder.d[0].eq(ttl_values[0:8]),
-                gtx.encoder.k[1].eq(0),
-                gtx.encoder.d[1].eq(ttl_values[8:16]),
-                frame_counter.eq(2)
-            ).Else(
-                gtx.encoder.k[0].eq(0),
-                gtx.encoder.d[0].eq(ttl_values[16:24]),
-                gtx.encoder.k[1].eq(0),
-                gtx.encoder.d[1].eq(ttl_values[24:32]),
-                frame_counter.eq(0)
-            )
+        lanes = len(gtx.encoder.k)
+        ttl_values = Signal(nchannels)
+        if protocol == "state":
+            link = StateTX(FrameLayout(nchannels, lanes, crc))
+        elif protocol == "delta":
+            link = DeltaTX(nchannels, lanes)
+        elif protocol == "events":
+            link = EventTX(nchannels, lanes)
+        else:
+            raise ValueError("unknown protocol {}".format(protocol))
+        link = ClockDomainsRenamer("tx")(link)
+        if protocol == "events":
+            ttl_values_r = Signal(nchannels)
+            self.sync.rio_phy += ttl_values_r.eq(ttl_values)
+            self.comb += [
+                link.stb.eq(ttl_values ^ ttl_values_r),
+                link.value.eq(ttl_values)
+            ]
+        else:
+            self.comb += link.values.eq(ttl_values)
+        self.submodules += link
+        self.comb += [
+            [gtx.encoder.k[i].eq(link.k[i]) for i in range(lanes)],
+            [gtx.encoder.d[i].eq(link.d[i]) for i in range(lanes)]
         ]
 
-        for i in range(32):
+        if ninputs:
+            inputs = ClockDomainsRenamer("rio_phy")(InputRX(ninputs, lanes))
+            self.submodules += inputs
+            self.comb += [
+                [inputs.k[i].eq(gtx.decoders[i].k) for i in range(lanes)],
+                [inputs.d[i].eq(gtx.decoders[i].d) for i in range(lanes)],
+                inputs.now.eq(link.now)
+            ]
+
+        # as ttl_simple.Inout, with the sensitivity written to address 2
+        for i in range(ninputs):
+            value = inputs.values[i]
+
+            rtlink = rtio.rtlink.Interface(
+                rtio.rtlink.OInterface(2, 2),
+                rtio.rtlink.IInterface(1))
+            channel = rtio.Channel(rtlink, [value], **kwargs)
+            self.rtio_input_channels.append(channel)
+
+            sensitivity = Signal(2)
+            value_r = Signal()
+            self.sync.rio_phy += [
+                If(rtlink.o.stb & (rtlink.o.address == 2),
+                    sensitivity.eq(rtlink.o.data)
+                ),
+                value_r.eq(value)
+            ]
+            self.comb += [
+                rtlink.i.stb.eq((sensitivity[0] & value & ~value_r)
+                                | (sensitivity[1] & ~value & value_r)),
+                rtlink.i.data.eq(value)
+            ]
+
+        if loopback_pad is not None:
+            meter = ClockDomainsRenamer("rio_phy")(LatencyMeter(255))
+            self.submodules += meter
+
+            rtlink = rtio.rtlink.Interface(
+                rtio.rtlink.OInterface(16, 1),
+                rtio.rtlink.IInterface(16))
+            self.latency_channel = rtio.Channel(rtlink, ififo_depth=4)
+            self.comb += [
+                meter.loopback.eq(loopback_pad),
+                meter.start.eq(rtlink.o.stb & (rtlink.o.address == 0)),
+                rtlink.i.stb.eq(meter.valid),
+                rtlink.i.data.eq(Mux(meter.timeout, 0xffff, meter.latency))
+            ]
+            # the latency counts the register of ttl_values, which the local
+            # outputs also have
+            self.sync.rio_phy += [
+                If(rtlink.o.stb & (rtlink.o.address == 1),
+                    self.compensation.eq(rtlink.o.data)
+                ).Elif(meter.valid & ~meter.timeout & (meter.latency != 0),
+                    self.compensation.eq(meter.latency - 1)
+                )
+            ]
+
+        for i in range(nchannels):
             value = ttl_values[i]
 
             rtlink = rtio.rtlink.Interface(rtio.rtlink.OInterface(1))
+            if protocol == "events":
+                self.comb += rtlink.o.busy.eq(link.busy[i])
             probes = [value]
             override_en = Signal()
             override_o = Signal()
@@ -81,6 +168,11 @@ class RemoteTTLChannels(Module):
                     value.eq(value_k)
                 )
             ]
+            if i == 0 and loopback_pad is not None:
+                self.sync.rio_phy += \
+                    If(meter.override,
+                        value.eq(meter.o)
+                    )
 
 
 class ARTIQTTLTX(MiniSoC, AMPSoC):
@@ -102,7 +194,8 @@ class ARTIQTTLTX(MiniSoC, AMPSoC):
     }
     mem_map.update(MiniSoC.mem_map)
 
-    def __init__(self, **kwargs):
+    def __init__(self, protocol="state", remote_channels=32, crc=False,
+                 latency=False, remote_inputs=0, **kwargs):
         MiniSoC.__init__(self,
                          cpu_type="or1k",
                          sdram_controller_type="minicon",
@@ -115,28 +208,47 @@ class ARTIQTTLTX(MiniSoC, AMPSoC):
         platform = self.platform
         platform.add_extension(ttl_extension)
 
-        rtio_channels = []
-        phy = ttl_simple.Output(platform.request("user_sma_gpio_p"))
-        self.submodules += phy
-        rtio_channels.append(rtio.Channel.from_phy(phy))
-        phy = ttl_simple.Output(platform.request("user_sma_gpio_n"))
-        self.submodules += phy
-        rtio_channels.append(rtio.Channel.from_phy(phy))
-        for i in range(8):
-            phy = ttl_simple.Output(platform.request("user_led"))
-            self.submodules += phy
-            rtio_channels.append(rtio.Channel.from_phy(phy))
-        for i in range(22):
-            phy = ttl_simple.Output(platform.request("ttl"))
-            self.submodules += phy
-            rtio_channels.append(rtio.Channel.from_phy(phy))
         self.comb += platform.request("sfp_tx_disable_n").eq(1)
         self.submodules.remote_ttl_channels = RemoteTTLChannels(
             clock_pads=platform.request("sgmii_clock"),
             tx_pads=platform.request("sfp_tx"),
-            sys_clk_freq=125000000)
+            sys_clk_freq=125000000,
+            protocol=protocol,
+            nchannels=remote_channels,
+            crc=crc,
+            loopback_pad=platform.request("user_sma_clock_n")
+                         if latency else None,
+            rx_pads=platform.request("sfp_rx") if remote_inputs else None,
+            ninputs=remote_inputs)
+
+        # with latency, the local outputs are delayed to line up with the
+        # remote ones
+        def output(pad):
+            if latency:
+                delay_line = ClockDomainsRenamer("rio_phy")(DelayLine())
+                self.submodules += delay_line
+                self.comb += [
+                    pad.eq(delay_line.o),
+                    delay_line.delay.eq(
+                        self.remote_ttl_channels.compensation)
+                ]
+                pad = delay_line.i
+            phy = ttl_simple.Output(pad)
+            self.submodules += phy
+            return rtio.Channel.from_phy(phy)
+
+        rtio_channels = []
+        rtio_channels.append(output(platform.request("user_sma_gpio_p")))
+        rtio_channels.append(output(platform.request("user_sma_gpio_n")))
+        for i in range(8):
+            rtio_channels.append(output(platform.request("user_led")))
+        for i in range(22):
+            rtio_channels.append(output(platform.request("ttl")))
         rtio_channels += self.remote_ttl_channels.rtio_channels
+        rtio_channels += self.remote_ttl_channels.rtio_input_channels
         self.config["RTIO_REGULAR_TTL_COUNT"] = len(rtio_channels)
+        if latency:
+            rtio_channels.append(self.remote_ttl_channels.latency_channel)
         self.config["RTIO_LOG_CHANNEL"] = len(rtio_channels)
         rtio_channels.append(rtio.LogChannel())
 
@@ -174,9 +286,24 @@ def main():
         description="ARTIQ remote TTL demo (transmitter)")
     builder_args(parser)
     soc_kc705_args(parser)
+    parser.add_argument("--protocol", default="state", choices=protocols,
+                        help="remote TTL protocol (default: %(default)s)")
+    parser.add_argument("--channels", default=32, type=int,
+                        help="number of remote TTL channels "
+                             "(default: %(default)s)")
+    parser.add_argument("--crc", action="store_true",
+                        help="protect the frames of the state protocol "
+                             "with a CRC")
+    parser.add_argument("--latency", action="store_true",
+                        help="measure the latency of the remote TTLs with "
+                             "a loopback and delay the local TTLs to match")
+    parser.add_argument("--inputs", default=0, type=int,
+                        help="number of remote TTL inputs, with the events "
+                             "protocol (default: %(default)s)")
     args = parser.parse_args()
 
-    soc = ARTIQTTLTX(**soc_kc705_argdict(args))
+    soc = ARTIQTTLTX(args.protocol, args.channels, args.crc, args.latency,
+                     args.inputs, **soc_kc705_argdict(args))
     build_artiq_soc(soc, builder_argdict(args))
 
 
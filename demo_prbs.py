@@ -1,156 +1,62 @@
 #!/usr/bin/env python3.5
 
 import argparse
-from operator import or_
-from functools import reduce
-
-from migen import *
-from migen.genlib.cdc import GrayCounter, NoRetiming, MultiReg, GrayDecoder
-from migen.build.platforms import kc705
-from misoc.cores.uart import RS232PHY
-from misoc.interconnect import wishbone
-
-from gtx import GTXTransmitter, GTXReceiver
-from prbs import PRBSGenerator, PRBSChecker
-from i2c import *
-from sequencer import Sequencer
-from si5324_kc705 import get_i2c_program, Si5324ClockRouter
-from wishbonebridge import WishboneStreamingBridge
+
 from comm_uart import CommUART
+from i2c_registers import *
+import ber_monitor
 
 
-class PRBSTX(Module):
-    def __init__(self, platform):
-        sys_clock_pads = platform.request("clk156")
-        self.clock_domains.cd_sys = ClockDomain(reset_less=True)
-        self.specials += Instance("IBUFGDS",
-            i_I=sys_clock_pads.p, i_IB=sys_clock_pads.n,
-            o_O=self.cd_sys.clk)
-        self.comb += platform.request("sfp_tx_disable_n").eq(1)
-
-        gtx = GTXTransmitter(
-            clock_pads=platform.request("sgmii_clock"),
-            tx_pads=platform.request("sfp_tx"),
-            sys_clk_freq=156000000)
-        self.submodules += gtx
-
-        frame_counter = Signal(4)
-        header = Signal()
-        self.sync.tx += [
-            frame_counter.eq(frame_counter + 1),
-            header.eq(frame_counter == 0)
-        ]
-
-        generator = ClockDomainsRenamer("tx")(CEInserter()(PRBSGenerator(16)))
-        self.submodules += generator
-
-        self.comb += [
-            If(header,
-                gtx.encoder.k[0].eq(1),
-                gtx.encoder.d[0].eq((5 << 5) | 28),
-                gtx.encoder.k[1].eq(0),
-                gtx.encoder.d[1].eq(0),
-                generator.ce.eq(0)
-            ).Else(
-                gtx.encoder.k[0].eq(0),
-                gtx.encoder.d[0].eq(generator.o[:8]),
-                gtx.encoder.k[1].eq(0),
-                gtx.encoder.d[1].eq(generator.o[8:]),
-                generator.ce.eq(1)
-            )
-        ]
-
-
-class PRBSRX(Module):
-    def __init__(self, platform):
-        sys_clock_pads = platform.request("clk156")
-        self.clock_domains.cd_sys = ClockDomain(reset_less=True)
-        self.specials += Instance("IBUFGDS",
-            i_I=sys_clock_pads.p, i_IB=sys_clock_pads.n,
-            o_O=self.cd_sys.clk)
-        sys_clk_freq = 156000000
-        self.comb += platform.request("sfp_tx_disable_n").eq(1)
-
-        gtx = GTXReceiver(
-            clock_pads=platform.request("sgmii_clock"),
-            rx_pads=platform.request("sfp_rx"),
-            sys_clk_freq=sys_clk_freq)
-        self.submodules += gtx
-
-        # PRBS checker
-        checker = ClockDomainsRenamer("rx_clean")(CEInserter()(PRBSChecker(16)))
-        self.submodules += checker
-
-        self.sync.rx += [
-            checker.ce.eq(~gtx.decoders[0].k),
-            checker.i[:8].eq(gtx.decoders[0].d),
-            checker.i[8:].eq(gtx.decoders[1].d)
-        ]
-
-        error_accumulator = ClockDomainsRenamer("rx_clean")(GrayCounter(32))
-        self.submodules += error_accumulator
-        error_bits = [checker.errors[i] for i in range(len(checker.errors))]
-        self.comb += error_accumulator.ce.eq(reduce(or_, error_bits))
-
-        error_decoder = GrayDecoder(32)
-        self.submodules += error_decoder
-        self.specials += [
-            NoRetiming(error_accumulator.q),
-            MultiReg(error_accumulator.q, error_decoder.i)
-        ]
-
-        # Wishbone target - I2C
-        i2c_master = I2CMaster(platform.request("i2c"))
-        self.submodules += i2c_master
-
-        # Wishbone target - PRBS error count
-        checker_wb = wishbone.Interface()
-        self.sync += [
-            checker_wb.dat_r.eq(error_decoder.o),
-            checker_wb.ack.eq(0),
-            If(checker_wb.cyc & checker_wb.stb & ~checker_wb.ack,
-                checker_wb.ack.eq(1))
-        ]
-
-        # Wishbone master - Sequencer
-        sequencer = Sequencer(get_i2c_program(sys_clk_freq))
-        self.submodules += sequencer
-
-        # Wishbone master - UART bridge
-        uart_phy = RS232PHY(platform.request("serial"), sys_clk_freq, 115200)
-        bridge = WishboneStreamingBridge(uart_phy, sys_clk_freq)
-        self.submodules += uart_phy, bridge
-
-        # Wishbone interconnect
-        interconnect = wishbone.InterconnectShared(
-            [sequencer.bus, bridge.wishbone],
-            [(lambda a: a[4] == 0, i2c_master.bus),
-             (lambda a: a[4] == 1, checker_wb)],
-            register=True)
-        self.submodules += interconnect
-
-        si5324_clock_router = Si5324ClockRouter(platform, sys_clk_freq)
-        self.submodules += si5324_clock_router
-
-def build_tx():
-    platform = kc705.Platform()
-    top = PRBSTX(platform)
-    platform.build(top, build_dir="prbs_tx")
-
-
-def build_rx():
-    platform = kc705.Platform()
-    top = PRBSRX(platform)
-    platform.build(top, build_dir="prbs_rx")
-
-
-def readout(port):
-    with CommUART(port) as comm:
+def readout(port, framed=False):
+    with CommUART(port, framed=framed) as comm:
         print(comm.read(0x40))
 
 
-def set_pll_phase(port, phase):
-    with CommUART(port) as comm:
+# Reads the error counters of several boards concurrently, once or every
+# interval seconds. Boards that do not respond are reported without holding
+# up the others.
+async def async_readout(ports, framed=False, interval=None):
+    import asyncio
+    from comm_uart_async import AsyncCommUART
+
+    comms = [AsyncCommUART(port, framed=framed) for port in ports]
+    try:
+        while True:
+            counts = await asyncio.gather(*[comm.read(0x40) for comm in comms],
+                                          return_exceptions=True)
+            for port, count in zip(ports, counts):
+                if isinstance(count, TimeoutError):
+                    print("{}: no response".format(port))
+                elif isinstance(count, Exception):
+                    print("{}: error: {}".format(port, count))
+                else:
+                    print("{}: {}".format(port, count))
+            if interval is None:
+                break
+            await asyncio.sleep(interval)
+    finally:
+        for comm in comms:
+            comm.close()
+
+
+def monitor(port, framed=False, rate=10.0, duration=None, csv=None,
+            binlog=None, prometheus=None, word_counter=True, data_width=20,
+            line_rate=1.25e9):
+    logs = []
+    if csv is not None:
+        logs.append(ber_monitor.CSVLog(csv))
+    if binlog is not None:
+        logs.append(ber_monitor.BinaryLog(binlog))
+    with CommUART(port, framed=framed) as comm:
+        # one header cycle out of 16 is not checked
+        monitor = ber_monitor.BERMonitor(
+            comm, word_counter, bits_per_word=8*data_width//10,
+            word_rate=line_rate/data_width*15/16)
+        ber_monitor.run(monitor, rate, duration, logs, prometheus)
+
+
+def set_pll_phase(port, phase, framed=False):
+    with CommUART(port, framed=framed) as comm:
         comm.write(0x00, I2C_START)
         while not (comm.read(0x00) & I2C_IDLE):
             pass
@@ -169,24 +75,90 @@ def main():
                         help="do not build TX bitstream")
     parser.add_argument("--no-rx", default=False, action="store_true",
                         help="do not build RX bitstream")
-    parser.add_argument("--readout", metavar="SERIAL_PORT",
+    parser.add_argument("--no-cache", default=False, action="store_true",
+                        help="run Vivado even if the design is unchanged")
+    parser.add_argument("--line-rate", default=1.25, type=float,
+                        help="transceiver line rate in Gb/s "
+                             "(default: %(default)s)")
+    parser.add_argument("--data-width", default=20, type=int, choices=(20, 40),
+                        help="transceiver datapath width "
+                             "(default: %(default)s)")
+    parser.add_argument("--readout", metavar="SERIAL_PORT", nargs="+",
                         default=None, type=str,
                         help="read out error counter value from the board "
-                             "on the specified serial device. Disables all "
+                             "on the specified serial device(s). Disables all "
                              "bitstream builds.")
+    parser.add_argument("--interval", default=None, type=float,
+                        help="keep reading out the error counters every "
+                             "INTERVAL seconds")
+    parser.add_argument("--monitor", metavar="SERIAL_PORT",
+                        default=None, type=str,
+                        help="continuously monitor the bit error ratio of "
+                             "the board on the specified serial device. "
+                             "Disables all bitstream builds.")
+    parser.add_argument("--rate", default=10.0, type=float,
+                        help="monitor sampling rate in Hz (default: %(default)s)")
+    parser.add_argument("--duration", default=None, type=float,
+                        help="stop monitoring after DURATION seconds")
+    parser.add_argument("--csv", default=None,
+                        help="append monitor samples to a CSV file")
+    parser.add_argument("--binlog", default=None,
+                        help="append monitor samples to a binary log")
+    parser.add_argument("--prometheus", default=None,
+                        help="keep BER metrics in a Prometheus text file")
+    parser.add_argument("--no-word-counter", default=False, action="store_true",
+                        help="monitor bitstreams without the word counter "
+                             "(errors only)")
     parser.add_argument("--set-pll-phase", nargs=2,
                         metavar=("SERIAL_PORT", "PHASE"),
                         default=None, type=str)
+    parser.add_argument("--framed", default=False, action="store_true",
+                        help="use the framed, CRC-protected bridge protocol "
+                             "(the bitstreams must be built with it)")
     args = parser.parse_args()
     if args.readout is not None:
-        readout(args.readout)
+        if len(args.readout) == 1 and args.interval is None:
+            readout(args.readout[0], args.framed)
+        else:
+            import asyncio
+            loop = asyncio.get_event_loop()
+            try:
+                loop.run_until_complete(
+                    async_readout(args.readout, args.framed, args.interval))
+            finally:
+                loop.close()
     if args.set_pll_phase is not None:
-        set_pll_phase(args.set_pll_phase[0], int(args.set_pll_phase[1]))
-    if args.readout is None and args.set_pll_phase is None:
+        set_pll_phase(args.set_pll_phase[0], int(args.set_pll_phase[1]),
+                      args.framed)
+    if args.monitor is not None:
+        try:
+            monitor(args.monitor, args.framed, args.rate, args.duration,
+                    args.csv, args.binlog, args.prometheus,
+                    not args.no_word_counter, args.data_width,
+                    args.line_rate*1e9)
+        except KeyboardInterrupt:
+            pass
+    if (args.readout is None and args.set_pll_phase is None
+            and args.monitor is None):
+        # gateware modules are only loaded here, so that the host-side
+        # commands start quickly
+        import build_cache
+        from gtx_config import gtx_config
+        from prbs_kc705 import build_tx, build_rx
+
+        line_rate = args.line_rate*1e9
+        try:
+            gtx_config(line_rate, data_width=args.data_width)
+        except ValueError as e:
+            parser.error(str(e))
+        builds = []
         if not args.no_tx:
-            build_tx()
+            builds.append((build_tx, (args.framed, line_rate, args.data_width,
+                                      not args.no_cache)))
         if not args.no_rx:
-            build_rx()
+            builds.append((build_rx, (args.framed, line_rate, args.data_width,
+                                      not args.no_cache)))
+        build_cache.run_parallel(builds)
 
 
 if __name__ == "__main__":
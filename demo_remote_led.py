@@ -6,10 +6,12 @@ from migen import *
 from migen.build.platforms import kc705
 
 from gtx import GTXTransmitter, GTXReceiver
+from gtx_config import gtx_config
+import build_cache
 
 
 class RemoteLEDTX(Module):
-    def __init__(self, platform):
+    def __init__(self, platform, line_rate=1.25e9, data_width=20):
         sys_clock_pads = platform.request("clk156")
         self.clock_domains.cd_sys = ClockDomain(reset_less=True)
         self.specials += Instance("IBUFGDS",
@@ -31,7 +33,9 @@ class RemoteLEDTX(Module):
         gtx = GTXTransmitter(
             clock_pads=platform.request("sgmii_clock"),
             tx_pads=platform.request("sfp_tx"),
-            sys_clk_freq=156000000
+            sys_clk_freq=156000000,
+            line_rate=line_rate,
+            data_width=data_width
         )
         self.submodules += gtx
 
@@ -44,10 +48,15 @@ class RemoteLEDTX(Module):
             gtx.encoder.k[1].eq(0),
             gtx.encoder.d[1].eq(word),
         ]
+        for i in range(2, gtx.config.nwords):
+            self.comb += [
+                gtx.encoder.k[i].eq(0),
+                gtx.encoder.d[i].eq(0)
+            ]
 
 
 class RemoteLEDRX(Module):
-    def __init__(self, platform):
+    def __init__(self, platform, line_rate=1.25e9, data_width=20):
         sys_clock_pads = platform.request("clk156")
         self.clock_domains.cd_sys = ClockDomain(reset_less=True)
         self.specials += Instance("IBUFGDS",
@@ -69,7 +78,9 @@ class RemoteLEDRX(Module):
         gtx = GTXReceiver(
             clock_pads=platform.request("sgmii_clock"),
             rx_pads=platform.request("sfp_rx"),
-            sys_clk_freq=156000000
+            sys_clk_freq=156000000,
+            line_rate=line_rate,
+            data_width=data_width
         )
         self.submodules += gtx
         
@@ -77,16 +88,16 @@ class RemoteLEDRX(Module):
             self.comb += platform.request("user_led").eq(gtx.decoders[1].d[i])
 
 
-def build_tx():
+def build_tx(line_rate=1.25e9, data_width=20, cache=True):
     platform = kc705.Platform()
-    top = RemoteLEDTX(platform)
-    platform.build(top, build_dir="remote_led_tx")
+    top = RemoteLEDTX(platform, line_rate, data_width)
+    build_cache.build(platform, top, "remote_led_tx", cache=cache)
 
 
-def build_rx():
+def build_rx(line_rate=1.25e9, data_width=20, cache=True):
     platform = kc705.Platform()
-    top = RemoteLEDRX(platform)
-    platform.build(top, build_dir="remote_led_rx")
+    top = RemoteLEDRX(platform, line_rate, data_width)
+    build_cache.build(platform, top, "remote_led_rx", cache=cache)
 
 
 def main():
@@ -95,11 +106,28 @@ def main():
                         help="do not build TX bitstream")
     parser.add_argument("--no-rx", default=False, action="store_true",
                         help="do not build RX bitstream")
+    parser.add_argument("--no-cache", default=False, action="store_true",
+                        help="run Vivado even if the design is unchanged")
+    parser.add_argument("--line-rate", default=1.25, type=float,
+                        help="transceiver line rate in Gb/s "
+                             "(default: %(default)s)")
+    parser.add_argument("--data-width", default=20, type=int, choices=(20, 40),
+                        help="transceiver datapath width "
+                             "(default: %(default)s)")
     args = parser.parse_args()
+    line_rate = args.line_rate*1e9
+    try:
+        gtx_config(line_rate, data_width=args.data_width)
+    except ValueError as e:
+        parser.error(str(e))
+    builds = []
     if not args.no_tx:
-        build_tx()
+        builds.append((build_tx, (line_rate, args.data_width,
+                                  not args.no_cache)))
     if not args.no_rx:
-        build_rx()
+        builds.append((build_rx, (line_rate, args.data_width,
+                                  not args.no_cache)))
+    build_cache.run_parallel(builds)
 
 
 if __name__ == "__main__":
@@ -3,207 +3,339 @@
 from migen import *
 from migen.genlib.resetsync import AsyncResetSynchronizer
 
-from gtx_init import GTXInit, BruteforceClockAligner
+from gtx_init import GTXInit, BruteforceClockAligner, CommaAligner
+from gtx_config import gtx_config
 from line_coding import Encoder, Decoder
 
 
-class GTXTransmitter(Module):
-    def __init__(self, clock_pads, tx_pads, sys_clk_freq):
-        refclk_div2 = Signal()
-        self.specials += Instance("IBUFDS_GTE2",
-            i_CEB=0,
-            i_I=clock_pads.p,
-            i_IB=clock_pads.n,
-            o_ODIV2=refclk_div2
+# Returns the GTXE2_CHANNEL parameters selecting the PLL of the
+# configuration, and instantiates the GTXE2_COMMON of the QPLL if needed.
+def _pll_params(module, config, refclk, plllock):
+    if config.pll == "cpll":
+        return dict(
+            p_CPLL_CFG=0xBC07DC,
+            p_CPLL_FBDIV=config.n2,
+            p_CPLL_FBDIV_45=config.n1,
+            p_CPLL_REFCLK_DIV=config.m,
+            o_CPLLLOCK=plllock,
+            i_CPLLLOCKEN=1,
+            i_CPLLREFCLKSEL=0b001,
+            i_TXSYSCLKSEL=0b00,
+            i_RXSYSCLKSEL=0b00
         )
+    else:
+        qpllclk = Signal()
+        qpllrefclk = Signal()
+        module.specials += \
+            Instance("GTXE2_COMMON",
+                p_QPLL_CFG=config.qpll_cfg,
+                p_QPLL_FBDIV=config.qpll_fbdiv,
+                p_QPLL_FBDIV_RATIO=config.qpll_fbdiv_ratio,
+                p_QPLL_REFCLK_DIV=config.m,
+                o_QPLLLOCK=plllock,
+                i_QPLLLOCKEN=1,
+                i_QPLLPD=0,
+                i_QPLLRESET=0,
+                i_QPLLREFCLKSEL=0b001,
+                i_GTREFCLK0=refclk,
+                o_QPLLOUTCLK=qpllclk,
+                o_QPLLOUTREFCLK=qpllrefclk,
 
-        self.submodules.gtx_init = GTXInit(sys_clk_freq, False)
+                i_BGBYPASSB=1,
+                i_BGMONITORENB=1,
+                i_BGPDB=1,
+                i_BGRCALOVRD=0b11111,
+                i_RCALENB=1
+            )
+        return dict(
+            i_CPLLPD=1,
+            i_QPLLCLK=qpllclk,
+            i_QPLLREFCLK=qpllrefclk,
+            i_TXSYSCLKSEL=0b11,
+            i_RXSYSCLKSEL=0b11
+        )
 
-        txoutclk = Signal()
-        txdata = Signal(20)
-        self.specials += \
-            Instance("GTXE2_CHANNEL",
-                # PMA Attributes
-                p_PMA_RSV=0x00018480,
-                p_PMA_RSV2=0x2050,
-                p_PMA_RSV3=0,
-                p_PMA_RSV4=0,
-                p_RX_BIAS_CFG=0b100,
-                p_RX_CM_TRIM=0b010,
-                p_RX_OS_CFG=0b10000000,
-                p_RX_CLK25_DIV=5,
-                p_TX_CLK25_DIV=5,
-
-                # Power-Down Attributes
-                p_PD_TRANS_TIME_FROM_P2=0x3c,
-                p_PD_TRANS_TIME_NONE_P2=0x3c,
-                p_PD_TRANS_TIME_TO_P2=0x64,
-
-                # CPLL
-                p_CPLL_CFG=0xBC07DC,
-                p_CPLL_FBDIV=4,
-                p_CPLL_FBDIV_45=5,
-                p_CPLL_REFCLK_DIV=1,
-                p_RXOUT_DIV=2,
-                p_TXOUT_DIV=2,
-                o_CPLLLOCK=self.gtx_init.cplllock,
-                i_CPLLLOCKEN=1,
-                i_CPLLREFCLKSEL=0b001,
-                i_TSTIN=2**20-1,
-                i_GTREFCLK0=refclk_div2,
-
-                # TX clock
-                p_TXBUF_EN="FALSE",
-                p_TX_XCLK_SEL="TXUSR",
-                o_TXOUTCLK=txoutclk,
-                i_TXSYSCLKSEL=0b00,
-                i_TXOUTCLKSEL=0b11,
 
-                # disable RX
-                i_RXPD=0b11,
+def _refclk(module, clock_pads):
+    refclk = Signal()
+    module.specials += Instance("IBUFDS_GTE2",
+        i_CEB=0,
+        i_I=clock_pads.p,
+        i_IB=clock_pads.n,
+        o_O=refclk
+    )
+    return refclk
 
-                # Startup/Reset
-                i_GTTXRESET=self.gtx_init.gtXxreset,
-                o_TXRESETDONE=self.gtx_init.Xxresetdone,
-                i_TXDLYSRESET=self.gtx_init.Xxdlysreset,
-                o_TXDLYSRESETDONE=self.gtx_init.Xxdlysresetdone,
-                o_TXPHALIGNDONE=self.gtx_init.Xxphaligndone,
-                i_TXUSERRDY=self.gtx_init.Xxuserrdy,
-
-                # TX data
-                p_TX_DATA_WIDTH=20,
-                p_TX_INT_DATAWIDTH=0,
-                i_TXCHARDISPMODE=Cat(txdata[9], txdata[19]),
-                i_TXCHARDISPVAL=Cat(txdata[8], txdata[18]),
-                i_TXDATA=Cat(txdata[:8], txdata[10:18]),
-                i_TXUSRCLK=ClockSignal("tx"),
-                i_TXUSRCLK2=ClockSignal("tx"),
-
-                # TX electrical
-                i_TXBUFDIFFCTRL=0b100,
-                i_TXDIFFCTRL=0b1000,
-
-                # Pads
-                o_GTXTXP=tx_pads.p,
-                o_GTXTXN=tx_pads.n,
-            )
 
-        self.clock_domains.cd_tx = ClockDomain()
-        self.specials += Instance("BUFG",
-            i_I=txoutclk, o_O=self.cd_tx.clk)
-        self.specials += AsyncResetSynchronizer(
-            self.cd_tx, ~self.gtx_init.done)
+drp_layout = [
+    ("addr", 9),
+    ("di", 16),
+    ("do", 16),
+    ("en", 1),
+    ("we", 1),
+    ("rdy", 1)
+]
 
-        self.submodules.encoder = ClockDomainsRenamer("tx")(Encoder(2, True))
-        self.comb += txdata.eq(Cat(self.encoder.output[0], self.encoder.output[1]))
 
+# GTXE2_CHANNEL parameters common to both directions. Creates the DRP
+# interface of the channel (in the sys domain).
+def _channel_params(module, config, refclk, plllock):
+    module.drp = drp = Record(drp_layout)
+    return dict(
+        # DRP
+        i_DRPCLK=ClockSignal(),
+        i_DRPADDR=drp.addr,
+        i_DRPDI=drp.di,
+        o_DRPDO=drp.do,
+        i_DRPEN=drp.en,
+        i_DRPWE=drp.we,
+        o_DRPRDY=drp.rdy,
 
-class GTXReceiver(Module):
-    def __init__(self, clock_pads, rx_pads, sys_clk_freq):
-        refclk_div2 = Signal()
-        self.specials += Instance("IBUFDS_GTE2",
-            i_CEB=0,
-            i_I=clock_pads.p,
-            i_IB=clock_pads.n,
-            o_ODIV2=refclk_div2
-        )
+        # PMA Attributes
+        p_PMA_RSV=0x00018480,
+        p_PMA_RSV2=0x2050,
+        p_PMA_RSV3=0,
+        p_PMA_RSV4=0,
+        p_RX_BIAS_CFG=0b100,
+        p_RX_CM_TRIM=0b010,
+        p_RX_OS_CFG=0b10000000,
+        p_RX_CLK25_DIV=config.clk25_div,
+        p_TX_CLK25_DIV=config.clk25_div,
+
+        # Power-Down Attributes
+        p_PD_TRANS_TIME_FROM_P2=0x3c,
+        p_PD_TRANS_TIME_NONE_P2=0x3c,
+        p_PD_TRANS_TIME_TO_P2=0x64,
+
+        # PLL
+        p_RXOUT_DIV=config.out_div,
+        p_TXOUT_DIV=config.out_div,
+        i_TSTIN=2**20-1,
+        i_GTREFCLK0=refclk,
+        **_pll_params(module, config, refclk, plllock)
+    )
+
+
+# Creates the "tx" clock domain, the initialization FSM and the encoder,
+# and returns the TX parameters of the GTXE2_CHANNEL.
+def _tx(module, config, sys_clk_freq, tx_pads):
+    nwords = config.nwords
+
+    module.submodules.tx_init = tx_init = GTXInit(sys_clk_freq, False)
+    module.tx_restart = Signal()
+    module.comb += tx_init.restart.eq(module.tx_restart)
+
+    # TX driver settings, see UG476
+    module.txdiffctrl = Signal(4, reset=0b1000)
+    module.txprecursor = Signal(5)
+    module.txpostcursor = Signal(5)
+
+    txoutclk = Signal()
+    txdata = Signal(config.data_width)
+    module.clock_domains.cd_tx = ClockDomain()
+    module.specials += Instance("BUFG",
+        i_I=txoutclk, o_O=module.cd_tx.clk)
+    module.specials += AsyncResetSynchronizer(
+        module.cd_tx, ~tx_init.done)
+
+    module.submodules.encoder = ClockDomainsRenamer("tx")(Encoder(nwords, True))
+    module.comb += txdata.eq(Cat(*module.encoder.output))
+
+    return dict(
+        # TX clock
+        p_TXBUF_EN="FALSE",
+        p_TX_XCLK_SEL="TXUSR",
+        o_TXOUTCLK=txoutclk,
+        i_TXOUTCLKSEL=config.outclksel,
+
+        # Startup/Reset
+        i_GTTXRESET=tx_init.gtXxreset,
+        o_TXRESETDONE=tx_init.Xxresetdone,
+        i_TXDLYSRESET=tx_init.Xxdlysreset,
+        o_TXDLYSRESETDONE=tx_init.Xxdlysresetdone,
+        o_TXPHALIGNDONE=tx_init.Xxphaligndone,
+        i_TXUSERRDY=tx_init.Xxuserrdy,
+
+        # TX data
+        p_TX_DATA_WIDTH=config.data_width,
+        p_TX_INT_DATAWIDTH=int(config.int_data_width == 40),
+        i_TXCHARDISPMODE=Cat(*[txdata[10*i+9] for i in range(nwords)]),
+        i_TXCHARDISPVAL=Cat(*[txdata[10*i+8] for i in range(nwords)]),
+        i_TXDATA=Cat(*[txdata[10*i:10*i+8] for i in range(nwords)]),
+        i_TXUSRCLK=ClockSignal("tx"),
+        i_TXUSRCLK2=ClockSignal("tx"),
+
+        # TX electrical
+        i_TXBUFDIFFCTRL=0b100,
+        i_TXDIFFCTRL=module.txdiffctrl,
+        i_TXPRECURSOR=module.txprecursor,
+        i_TXPOSTCURSOR=module.txpostcursor,
+
+        # Pads
+        o_GTXTXP=tx_pads.p,
+        o_GTXTXN=tx_pads.n
+    )
+
+
+# Creates the "rx" clock domain, the initialization FSM, the clock aligner
+# and the decoders, and returns the RX parameters of the GTXE2_CHANNEL.
+def _rx(module, config, sys_clk_freq, rx_pads, comma_aligner, adaptive):
+    nwords = config.nwords
+
+    module.submodules.rx_init = rx_init = GTXInit(sys_clk_freq, True)
+    module.rx_restart = Signal()
+
+    # RX equalizer settings (in the rx domain), see UG476
+    module.rxlpmen = Signal()
+    module.rxlpmhfhold = Signal()
+    module.rxlpmlfhold = Signal()
+    module.rxdfeagchold = Signal()
+    module.rxdfelfhold = Signal()
+
+    rxoutclk = Signal()
+    rxdata = Signal(config.data_width)
+    module.clock_domains.cd_rx = ClockDomain()
+    module.specials += Instance("BUFG",
+        i_I=rxoutclk, o_O=module.cd_rx.clk)
 
-        self.submodules.gtx_init = GTXInit(sys_clk_freq, True)
+    if comma_aligner == "bruteforce":
+        module.submodules.clock_aligner = BruteforceClockAligner(
+            0b0101111100, sys_clk_freq, data_width=config.data_width,
+            adaptive=adaptive)
+        module.comb += [
+            module.clock_aligner.rxdata.eq(rxdata),
+            rx_init.restart.eq(module.clock_aligner.restart | module.rx_restart)
+        ]
+        if adaptive:
+            module.comb += module.clock_aligner.ready.eq(rx_init.done)
+        aligned = rxdata
+    elif comma_aligner == "fabric":
+        module.submodules.comma_aligner = ClockDomainsRenamer("rx")(
+            CommaAligner(0b0101111100, config.data_width))
+        module.comb += [
+            module.comma_aligner.rxdata.eq(rxdata),
+            rx_init.restart.eq(module.rx_restart)
+        ]
+        aligned = module.comma_aligner.o
+    else:
+        raise ValueError("unknown comma aligner {}".format(comma_aligner))
+
+    module.decoders = [ClockDomainsRenamer("rx")(Decoder(True)) for _ in range(nwords)]
+    module.submodules += module.decoders
+    module.comb += [decoder.input.eq(aligned[10*i:10*(i+1)])
+                    for i, decoder in enumerate(module.decoders)]
+
+    return dict(
+        # Startup/Reset
+        i_GTRXRESET=rx_init.gtXxreset,
+        o_RXRESETDONE=rx_init.Xxresetdone,
+        i_RXDLYSRESET=rx_init.Xxdlysreset,
+        o_RXDLYSRESETDONE=rx_init.Xxdlysresetdone,
+        o_RXPHALIGNDONE=rx_init.Xxphaligndone,
+        i_RXUSERRDY=rx_init.Xxuserrdy,
+
+        # RX AFE
+        p_RX_DFE_XYD_CFG=0,
+        i_RXDFEXYDEN=1,
+        i_RXDFEXYDHOLD=0,
+        i_RXDFEXYDOVRDEN=0,
+        i_RXLPMEN=module.rxlpmen,
+        i_RXLPMHFHOLD=module.rxlpmhfhold,
+        i_RXLPMLFHOLD=module.rxlpmlfhold,
+        i_RXDFEAGCHOLD=module.rxdfeagchold,
+        i_RXDFELFHOLD=module.rxdfelfhold,
+
+        # RX clock
+        p_RXBUF_EN="FALSE",
+        p_RX_XCLK_SEL="RXUSR",
+        i_RXDDIEN=1,
+        i_RXOUTCLKSEL=0b010,
+        o_RXOUTCLK=rxoutclk,
+        i_RXUSRCLK=ClockSignal("rx"),
+        i_RXUSRCLK2=ClockSignal("rx"),
+        p_RXCDR_CFG=config.rxcdr_cfg,
+
+        # RX Clock Correction Attributes
+        p_CLK_CORRECT_USE="FALSE",
+        p_CLK_COR_SEQ_1_1=0b0100000000,
+        p_CLK_COR_SEQ_2_1=0b0100000000,
+        p_CLK_COR_SEQ_1_ENABLE=0b1111,
+        p_CLK_COR_SEQ_2_ENABLE=0b1111,
 
-        rxoutclk = Signal()
-        rxdata = Signal(20)
+        # RX data
+        p_RX_DATA_WIDTH=config.data_width,
+        p_RX_INT_DATAWIDTH=int(config.int_data_width == 40),
+        o_RXDISPERR=Cat(*[rxdata[10*i+9] for i in range(nwords)]),
+        o_RXCHARISK=Cat(*[rxdata[10*i+8] for i in range(nwords)]),
+        o_RXDATA=Cat(*[rxdata[10*i:10*i+8] for i in range(nwords)]),
+
+        # Pads
+        i_GTXRXP=rx_pads.p,
+        i_GTXRXN=rx_pads.n
+    )
+
+
+# line_rate is in bits per second, refclk_freq is the frequency of
+# clock_pads, data_width is 20 or 40 (see gtx_config.py).
+class GTXTransmitter(Module):
+    def __init__(self, clock_pads, tx_pads, sys_clk_freq,
+                 line_rate=1.25e9, data_width=20, refclk_freq=125e6):
+        self.config = config = gtx_config(line_rate, refclk_freq, data_width)
+
+        refclk = _refclk(self, clock_pads)
+        tx_params = _tx(self, config, sys_clk_freq, tx_pads)
         self.specials += \
             Instance("GTXE2_CHANNEL",
-                # PMA Attributes
-                p_PMA_RSV=0x00018480,
-                p_PMA_RSV2=0x2050,
-                p_PMA_RSV3=0,
-                p_PMA_RSV4=0,
-                p_RX_BIAS_CFG=0b100,
-                p_RX_CM_TRIM=0b010,
-                p_RX_OS_CFG=0b10000000,
-                p_RX_CLK25_DIV=5,
-                p_TX_CLK25_DIV=5,
-
-                # Power-Down Attributes
-                p_PD_TRANS_TIME_FROM_P2=0x3c,
-                p_PD_TRANS_TIME_NONE_P2=0x3c,
-                p_PD_TRANS_TIME_TO_P2=0x64,
-
-                # CPLL
-                p_CPLL_CFG=0xBC07DC,
-                p_CPLL_FBDIV=4,
-                p_CPLL_FBDIV_45=5,
-                p_CPLL_REFCLK_DIV=1,
-                p_RXOUT_DIV=2,
-                p_TXOUT_DIV=2,
-                o_CPLLLOCK=self.gtx_init.cplllock,
-                i_CPLLLOCKEN=1,
-                i_CPLLREFCLKSEL=0b001,
-                i_TSTIN=2**20-1,
-                i_GTREFCLK0=refclk_div2,
-
-                # Startup/Reset
-                i_GTRXRESET=self.gtx_init.gtXxreset,
-                o_RXRESETDONE=self.gtx_init.Xxresetdone,
-                i_RXDLYSRESET=self.gtx_init.Xxdlysreset,
-                o_RXDLYSRESETDONE=self.gtx_init.Xxdlysresetdone,
-                o_RXPHALIGNDONE=self.gtx_init.Xxphaligndone,
-                i_RXUSERRDY=self.gtx_init.Xxuserrdy,
-
-                # RX AFE
-                p_RX_DFE_XYD_CFG=0,
-                i_RXDFEXYDEN=1,
-                i_RXDFEXYDHOLD=0,
-                i_RXDFEXYDOVRDEN=0,
-                i_RXLPMEN=0,
-
-                # RX clock
-                p_RXBUF_EN="FALSE",
-                p_RX_XCLK_SEL="RXUSR",
-                i_RXDDIEN=1,
-                i_RXSYSCLKSEL=0b00,
-                i_RXOUTCLKSEL=0b010,
-                o_RXOUTCLK=rxoutclk,
-                i_RXUSRCLK=ClockSignal("rx"),
-                i_RXUSRCLK2=ClockSignal("rx"),
-                p_RXCDR_CFG=0x03000023FF10100020,
-
-                # RX Clock Correction Attributes
-                p_CLK_CORRECT_USE="FALSE",
-                p_CLK_COR_SEQ_1_1=0b0100000000,
-                p_CLK_COR_SEQ_2_1=0b0100000000,
-                p_CLK_COR_SEQ_1_ENABLE=0b1111,
-                p_CLK_COR_SEQ_2_ENABLE=0b1111,
-
-                # RX data
-                p_RX_DATA_WIDTH=20,
-                p_RX_INT_DATAWIDTH=0,
-                o_RXDISPERR=Cat(rxdata[9], rxdata[19]),
-                o_RXCHARISK=Cat(rxdata[8], rxdata[18]),
-                o_RXDATA=Cat(rxdata[:8], rxdata[10:18]),
+                # disable RX
+                i_RXPD=0b11,
+                **_channel_params(self, config, refclk, self.tx_init.cplllock),
+                **tx_params
+            )
+
+
+# Parameters as for GTXTransmitter. comma_aligner is "bruteforce" to restart
+# the receiver until the comma is aligned (BruteforceClockAligner, fixed
+# latency), or "fabric" to align it with a barrel shifter (CommaAligner,
+# faster, the latency depends on comma_aligner.offset). adaptive enables the
+# adaptive mode of BruteforceClockAligner, which locks faster but requires
+# the transmitter to send commas in its first symbol only.
+class GTXReceiver(Module):
+    def __init__(self, clock_pads, rx_pads, sys_clk_freq,
+                 line_rate=1.25e9, data_width=20, refclk_freq=125e6,
+                 comma_aligner="bruteforce", adaptive=False):
+        self.config = config = gtx_config(line_rate, refclk_freq, data_width)
 
+        refclk = _refclk(self, clock_pads)
+        rx_params = _rx(self, config, sys_clk_freq, rx_pads,
+                        comma_aligner, adaptive)
+        self.specials += \
+            Instance("GTXE2_CHANNEL",
                 # disable TX
                 i_TXPD=0b11,
-
-                # Pads
-                i_GTXRXP=rx_pads.p,
-                i_GTXRXN=rx_pads.n,
+                **_channel_params(self, config, refclk, self.rx_init.cplllock),
+                **rx_params
             )
-        self.clock_domains.cd_rx = ClockDomain()
-        self.specials += Instance("BUFG",
-            i_I=rxoutclk, o_O=self.cd_rx.clk)
-
-        self.submodules.clock_aligner = BruteforceClockAligner(
-            0b0101111100, sys_clk_freq)
-        self.comb += [
-            self.clock_aligner.rxdata.eq(rxdata),
-            self.gtx_init.restart.eq(self.clock_aligner.restart)
-        ]
 
-        self.decoders = [ClockDomainsRenamer("rx")(Decoder(True)) for _ in range(2)]
-        self.submodules += self.decoders
-        self.comb += [
-            self.decoders[0].input.eq(rxdata[:10]),
-            self.decoders[1].input.eq(rxdata[10:]),
-        ]
+
+# Full-duplex link on a single GTXE2_CHANNEL. TX and RX share the PLL but
+# have their own initialization FSMs, so that the clock aligner restarting
+# the receiver does not disturb the transmitter. Provides the interfaces
+# of both GTXTransmitter (encoder, "tx" domain) and GTXReceiver (decoders,
+# "rx" domain). Parameters as for GTXReceiver.
+class GTXTransceiver(Module):
+    def __init__(self, clock_pads, tx_pads, rx_pads, sys_clk_freq,
+                 line_rate=1.25e9, data_width=20, refclk_freq=125e6,
+                 comma_aligner="bruteforce", adaptive=False):
+        self.config = config = gtx_config(line_rate, refclk_freq, data_width)
+
+        refclk = _refclk(self, clock_pads)
+        tx_params = _tx(self, config, sys_clk_freq, tx_pads)
+        rx_params = _rx(self, config, sys_clk_freq, rx_pads,
+                        comma_aligner, adaptive)
+        self.comb += self.rx_init.cplllock.eq(self.tx_init.cplllock)
+        self.specials += \
+            Instance("GTXE2_CHANNEL",
+                **_channel_params(self, config, refclk, self.tx_init.cplllock),
+                **tx_params,
+                **rx_params
+            )
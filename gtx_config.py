@@ -0,0 +1,139 @@
+from collections import namedtuple
+from math import ceil
+
+
+__all__ = ["GTXConfig", "gtx_config"]
+
+
+# Ranges from DS182 (Kintex-7, -2 speed grade) and UG476
+_cpll_vco_range = (1.6e9, 3.3e9)
+_cpll_n1 = (5, 4)
+_cpll_n2 = (1, 2, 3, 4, 5)
+_cpll_m = (1, 2)
+
+# QPLL_FBDIV attribute encodings
+_qpll_n = {
+    16: 0b0000100000,
+    20: 0b0000110000,
+    32: 0b0001100000,
+    40: 0b0010000000,
+    64: 0b0011100000,
+    66: 0b0101000000,
+    80: 0b0100100000,
+    100: 0b0101110000,
+}
+_qpll_m = (1, 2, 3, 4)
+_qpll_bands = [
+    ((5.93e9, 8.0e9), 0x06801c1),
+    ((9.8e9, 12.5e9), 0x0680181),
+]
+
+_out_divs = (1, 2, 4, 8, 16)
+
+_rxcdr_cfgs = {
+    1: 0x03000023ff10400020,
+    2: 0x03000023ff10200020,
+    4: 0x03000023ff10100020,
+    8: 0x03000023ff10080020,
+    16: 0x03000023ff10080020
+}
+
+# Line rates above this require the 4-byte internal datapath
+_max_2byte_line_rate = 6.6e9
+# Highest user clock that the fabric logic (8b10b coding, checkers) is
+# expected to meet timing at
+_max_word_clk_freq = 250e6
+
+
+# pll is "cpll" or "qpll". For the CPLL, the VCO runs at
+# refclk_freq*n1*n2/m; for the QPLL, at refclk_freq*n1/m (n2 is None).
+# The line rate is 2*vco_freq/out_div for the CPLL, vco_freq/out_div for
+# the QPLL (whose output clock runs at half the VCO frequency).
+GTXConfig = namedtuple("GTXConfig", [
+    "line_rate", "refclk_freq", "data_width",
+    "pll", "n1", "n2", "m", "out_div", "vco_freq",
+    "qpll_fbdiv", "qpll_fbdiv_ratio", "qpll_cfg",
+    "word_clk_freq", "nwords", "int_data_width",
+    "outclksel", "clk25_div", "rxcdr_cfg"
+])
+
+
+def _close(a, b):
+    return abs(a - b) <= 1e-9*b
+
+
+def _cpll_solutions(line_rate, refclk_freq):
+    for m in _cpll_m:
+        for out_div in _out_divs:
+            for n1 in _cpll_n1:
+                for n2 in _cpll_n2:
+                    vco_freq = refclk_freq*n1*n2/m
+                    if not (_cpll_vco_range[0] <= vco_freq <= _cpll_vco_range[1]):
+                        continue
+                    if _close(2*vco_freq/out_div, line_rate):
+                        yield n1, n2, m, out_div, vco_freq
+
+
+def _qpll_solutions(line_rate, refclk_freq):
+    for m in _qpll_m:
+        for out_div in _out_divs:
+            for n in sorted(_qpll_n):
+                vco_freq = refclk_freq*n/m
+                for (low, high), cfg in _qpll_bands:
+                    if (low <= vco_freq <= high
+                            and _close(vco_freq/out_div, line_rate)):
+                        yield n, m, out_div, vco_freq, cfg
+
+
+# Computes the GTX settings for the given line rate (in bits per second),
+# reference clock frequency (the GTREFCLK0 pin of the channel) and user
+# datapath width (20 or 40 bits, i.e. 2 or 4 8b10b words per cycle).
+# The CPLL is used whenever it can generate the line rate, the QPLL
+# otherwise. Raises ValueError for unsupported combinations.
+def gtx_config(line_rate, refclk_freq=125e6, data_width=20):
+    if data_width not in (20, 40):
+        raise ValueError("data width must be 20 or 40 bits")
+    int_data_width = 20 if data_width == 20 else 40
+    if int_data_width == 20 and line_rate > _max_2byte_line_rate:
+        raise ValueError("line rates above {} Gb/s require a 40-bit "
+                         "datapath".format(_max_2byte_line_rate/1e9))
+    word_clk_freq = line_rate/data_width
+    if word_clk_freq > _max_word_clk_freq:
+        raise ValueError("user clock of {} MHz is too fast, use a wider "
+                         "datapath".format(word_clk_freq/1e6))
+
+    qpll_fbdiv = qpll_fbdiv_ratio = qpll_cfg = None
+    n2 = None
+    for n1, n2, m, out_div, vco_freq in _cpll_solutions(line_rate, refclk_freq):
+        pll = "cpll"
+        break
+    else:
+        for n1, m, out_div, vco_freq, qpll_cfg in _qpll_solutions(line_rate, refclk_freq):
+            pll = "qpll"
+            qpll_fbdiv = _qpll_n[n1]
+            qpll_fbdiv_ratio = 0 if n1 == 66 else 1
+            break
+        else:
+            raise ValueError("no PLL setting generates {} Gb/s from a {} MHz "
+                             "reference clock".format(line_rate/1e9,
+                                                      refclk_freq/1e6))
+
+    # TX/RXOUTCLKSEL: use the reference clock directly if it has the right
+    # frequency, the PMA parallel clock otherwise
+    if _close(word_clk_freq, refclk_freq):
+        outclksel = 0b011
+    elif _close(word_clk_freq, refclk_freq/2):
+        outclksel = 0b100
+    else:
+        outclksel = 0b010
+
+    return GTXConfig(
+        line_rate=line_rate, refclk_freq=refclk_freq, data_width=data_width,
+        pll=pll, n1=n1, n2=n2, m=m, out_div=out_div, vco_freq=vco_freq,
+        qpll_fbdiv=qpll_fbdiv, qpll_fbdiv_ratio=qpll_fbdiv_ratio,
+        qpll_cfg=qpll_cfg,
+        word_clk_freq=word_clk_freq, nwords=data_width//10,
+        int_data_width=int_data_width,
+        outclksel=outclksel,
+        clk25_div=ceil(refclk_freq/25e6),
+        rxcdr_cfg=_rxcdr_cfgs[out_div])
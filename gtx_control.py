@@ -0,0 +1,150 @@
+from migen import *
+from migen.genlib.cdc import MultiReg
+from misoc.interconnect import wishbone
+
+from gtx_registers import *
+
+
+__all__ = ["GTXControl"]
+
+
+# Wishbone access to the analog settings and the DRP of a GTXTransmitter,
+# GTXReceiver or GTXTransceiver (see gtx_registers.py for the register map).
+# The registers of a direction the transceiver does not have read as 0 and
+# ignore writes. Attributes changed through the DRP generally take effect
+# only after the corresponding direction is restarted.
+#
+# Registers:
+# txdiffctrl   4 bits, TXDIFFCTRL
+# txprecursor  5 bits, TXPRECURSOR
+# txpostcursor 5 bits, TXPOSTCURSOR
+# rxeq = Record([
+#     ("lpmen",     1),
+#     ("lpmhfhold", 1),
+#     ("lpmlfhold", 1),
+#     ("dfeagchold", 1),
+#     ("dfelfhold", 1),
+# ])
+# restart = Record([
+#     ("tx", 1),
+#     ("rx", 1),
+# ])  (write only)
+# stats_clear  write only, clears the bring-up statistics
+# The bring-up statistics of the initialization FSMs and of the clock
+# aligner, and the offset of the fabric comma aligner follow (read only).
+class GTXControl(Module):
+    def __init__(self, gtx, bus=None):
+        if bus is None:
+            bus = wishbone.Interface(data_width=32)
+        self.bus = bus
+
+        # # #
+
+        tx = hasattr(gtx, "txdiffctrl")
+        rx = hasattr(gtx, "rxlpmen")
+
+        txdiffctrl = Signal(4, reset=0b1000)
+        txprecursor = Signal(5)
+        txpostcursor = Signal(5)
+        rxeq = Signal(5)
+        if tx:
+            self.comb += [
+                gtx.txdiffctrl.eq(txdiffctrl),
+                gtx.txprecursor.eq(txprecursor),
+                gtx.txpostcursor.eq(txpostcursor)
+            ]
+        if rx:
+            self.specials += MultiReg(rxeq,
+                Cat(gtx.rxlpmen, gtx.rxlpmhfhold, gtx.rxlpmlfhold,
+                    gtx.rxdfeagchold, gtx.rxdfelfhold),
+                "rx")
+        registers = {
+            GTX_TXDIFFCTRL_ADDR: (txdiffctrl, tx),
+            GTX_TXPRECURSOR_ADDR: (txprecursor, tx),
+            GTX_TXPOSTCURSOR_ADDR: (txpostcursor, tx),
+            GTX_RXEQ_ADDR: (rxeq, rx)
+        }
+
+        tx_restart = Signal()
+        rx_restart = Signal()
+        if tx:
+            self.comb += gtx.tx_restart.eq(tx_restart)
+        if rx:
+            self.comb += gtx.rx_restart.eq(rx_restart)
+
+        stats_clear = Signal()
+        stats = dict()
+        if tx:
+            self.comb += gtx.tx_init.clear_stats.eq(stats_clear)
+            for i, counter in enumerate(gtx.tx_init.state_cycles
+                                        + [gtx.tx_init.total_cycles]):
+                stats[GTX_TX_INIT_STATS_ADDR + i] = counter
+        if rx:
+            self.comb += gtx.rx_init.clear_stats.eq(stats_clear)
+            for i, counter in enumerate(gtx.rx_init.state_cycles
+                                        + [gtx.rx_init.total_cycles]):
+                stats[GTX_RX_INIT_STATS_ADDR + i] = counter
+        if hasattr(gtx, "clock_aligner"):
+            self.comb += gtx.clock_aligner.clear_stats.eq(stats_clear)
+            stats[GTX_ALIGNER_RESTARTS_ADDR] = gtx.clock_aligner.restarts
+            stats[GTX_ALIGNER_LOCK_TIME_ADDR] = gtx.clock_aligner.lock_time
+        if hasattr(gtx, "comma_aligner"):
+            offset = Signal(len(gtx.comma_aligner.offset))
+            locked = Signal()
+            self.specials += [
+                MultiReg(gtx.comma_aligner.offset, offset),
+                MultiReg(gtx.comma_aligner.locked, locked)
+            ]
+            stats[GTX_ALIGNER_OFFSET_ADDR] = Cat(
+                offset, Replicate(0, 8 - len(offset)), locked)
+
+        register_cases = {}
+        for address, (register, present) in registers.items():
+            if present:
+                register_cases[address] = [
+                    bus.dat_r.eq(register),
+                    If(bus.we, register.eq(bus.dat_w))
+                ]
+        register_cases[GTX_RESTART_ADDR] = \
+            If(bus.we,
+                tx_restart.eq(bus.dat_w[0]),
+                rx_restart.eq(bus.dat_w[1])
+            )
+        register_cases[GTX_STATS_CLEAR_ADDR] = \
+            If(bus.we, stats_clear.eq(1))
+        for address, counter in stats.items():
+            register_cases[address] = bus.dat_r.eq(counter)
+
+        # DRP transactions hold the bus until DRPRDY
+        drp = gtx.drp
+        drp_pending = Signal()
+        self.comb += [
+            drp.addr.eq(bus.adr[:9]),
+            drp.di.eq(bus.dat_w[:16])
+        ]
+
+        self.sync += [
+            bus.ack.eq(0),
+            drp.en.eq(0),
+            drp.we.eq(0),
+            tx_restart.eq(0),
+            rx_restart.eq(0),
+            stats_clear.eq(0),
+            If(bus.cyc & bus.stb & ~bus.ack,
+                If(bus.adr[9],
+                    If(~drp_pending,
+                        drp.en.eq(1),
+                        drp.we.eq(bus.we),
+                        drp_pending.eq(1)
+                    ).Elif(drp.rdy,
+                        bus.dat_r.eq(drp.do),
+                        bus.ack.eq(1),
+                        drp_pending.eq(0)
+                    )
+                ).Else(
+                    bus.dat_r.eq(0),
+                    Case(bus.adr[:5], register_cases),
+                    bus.ack.eq(1)
+                )
+            )
+        ]
@@ -1,10 +1,24 @@
 from math import ceil
+from functools import reduce
+from operator import or_
 
 from migen import *
 from migen.genlib.cdc import MultiReg, PulseSynchronizer
 from migen.genlib.misc import WaitTimer
 from migen.genlib.fsm import FSM
 
+from gtx_registers import GTX_INIT_STATES
+
+
+# Counts the cycles during which ce is asserted, saturating
+def _count(module, counter, clear, ce):
+    module.sync += \
+        If(clear,
+            counter.eq(0)
+        ).Elif(ce & (counter != 2**32-1),
+            counter.eq(counter + 1)
+        )
+
 
 class GTXInit(Module):
     # Based on LiteSATA by Enjoy-Digital
@@ -12,6 +26,11 @@ class GTXInit(Module):
         self.done = Signal()
         self.restart = Signal()
 
+        # Bring-up statistics, see gtx_registers.py
+        self.clear_stats = Signal()
+        self.state_cycles = [Signal(32) for state in GTX_INIT_STATES]
+        self.total_cycles = Signal(32)
+
         # GTX signals
         self.cplllock = Signal()
         self.gtXxreset = Signal()
@@ -116,6 +135,10 @@ class GTXInit(Module):
             If(self.restart, NextState("RESET_GTX"))
         )
 
+        for state, counter in zip(GTX_INIT_STATES, self.state_cycles):
+            _count(self, counter, self.clear_stats, startup_fsm.ongoing(state))
+        _count(self, self.total_cycles, self.clear_stats, ~self.done)
+
 
 # Changes the phase of the transceiver RX clock to align the comma to
 # the MSBs of RXDATA, fixing the latency.
@@ -130,10 +153,34 @@ class GTXInit(Module):
 #  * RXSLIDE_MODE=PMA cannot be used with the RX buffer bypassed.
 # Those design flaws make RXSLIDE_MODE=PMA yet another broken and useless
 # transceiver "feature".
+#
+# In the default mode, the comma is checked for every check_period and the
+# transceiver is restarted if it was not seen, so that every attempt takes
+# a full check period. In the adaptive mode, a decision is made as soon as
+# commas commas have been seen, either aligned to the MSBs of RXDATA (lock)
+# or at any other offset (restart right away); check_period then only
+# bounds the time without any comma before restarting. Attempts start when
+# ready (the done output of the RX GTXInit) is asserted. Once locked, the
+# comma is checked every check_period as in the default mode. The transmitter
+# must send commas in its first symbol only. See aligner_model.py for the
+# lock times of both modes.
+#
+# locked is asserted from the lock until the next restart. restarts counts
+# the restarts, and lock_time is the time of the last lock
+# after a restart (or after clear_stats), in sys clock cycles since
+# clear_stats.
 class BruteforceClockAligner(Module):
-    def __init__(self, comma, sys_clk_freq, check_period=6e-3):
-        self.rxdata = Signal(20)
+    def __init__(self, comma, sys_clk_freq, check_period=6e-3, data_width=20,
+                 adaptive=False, commas=4):
+        self.rxdata = Signal(data_width)
         self.restart = Signal()
+        self.locked = Signal()
+        if adaptive:
+            self.ready = Signal()
+
+        self.clear_stats = Signal()
+        self.restarts = Signal(32)
+        self.lock_time = Signal(32)
 
         check_max_val = ceil(check_period*sys_clk_freq)
         check_counter = Signal(max=check_max_val+1)
@@ -149,6 +196,9 @@ class BruteforceClockAligner(Module):
         ]
 
         comma_n = ~comma & 0b1111111111
+        def is_comma(symbol):
+            return (symbol == comma) | (symbol == comma_n)
+
         comma_seen_rxclk = Signal()
         comma_seen = Signal()
         self.specials += MultiReg(comma_seen_rxclk, comma_seen)
@@ -157,12 +207,175 @@ class BruteforceClockAligner(Module):
         self.sync.rx += \
             If(comma_seen_reset.o,
                 comma_seen_rxclk.eq(0)
-            ).Elif((self.rxdata[:10] == comma) | (self.rxdata[:10] == comma_n),
+            ).Elif(is_comma(self.rxdata[:10]),
                 comma_seen_rxclk.eq(1)
             )
 
-        self.comb += \
-            If(check,
-                If(~comma_seen, self.restart.eq(1)),
-                comma_seen_reset.i.eq(1)
+        lock = Signal()
+        if adaptive:
+            self._adaptive(check_max_val, check, comma_seen, comma_seen_reset,
+                           is_comma, data_width, commas, lock)
+        else:
+            self.comb += \
+                If(check,
+                    If(~comma_seen, self.restart.eq(1)),
+                    comma_seen_reset.i.eq(1)
+                )
+            self.sync += \
+                If(self.restart,
+                    self.locked.eq(0)
+                ).Elif(check & ~self.locked,
+                    self.locked.eq(1)
+                )
+            self.comb += lock.eq(check & ~self.locked & ~self.restart)
+
+        _count(self, self.restarts, self.clear_stats, self.restart)
+        time = Signal(32)
+        _count(self, time, self.clear_stats, 1)
+        self.sync += [
+            If(self.clear_stats, self.lock_time.eq(0)),
+            If(lock, self.lock_time.eq(time))
+        ]
+
+    def _adaptive(self, check_max_val, check, comma_seen, comma_seen_reset,
+                  is_comma, data_width, commas, lock):
+        # Count the aligned and misaligned commas in the rx domain, while
+        # the sys domain is checking
+        checking = Signal()
+        checking_rxclk = Signal()
+        self.specials += MultiReg(checking, checking_rxclk, "rx")
+
+        rxdata_r = Signal(data_width)
+        history = Cat(rxdata_r, self.rxdata)
+        aligned = Signal()
+        misaligned = Signal()
+        self.sync.rx += rxdata_r.eq(self.rxdata)
+        self.comb += [
+            aligned.eq(is_comma(self.rxdata[:10])),
+            misaligned.eq(reduce(or_, [is_comma(history[i:i+10])
+                                       for i in range(1, data_width)]))
+        ]
+
+        aligned_count = Signal(max=commas+1)
+        misaligned_count = Signal(max=commas+1)
+        success = PulseSynchronizer("rx", "sys")
+        failure = PulseSynchronizer("rx", "sys")
+        self.submodules += success, failure
+        self.sync.rx += \
+            If(~checking_rxclk,
+                aligned_count.eq(0),
+                misaligned_count.eq(0)
+            ).Else(
+                If(aligned & (aligned_count != commas),
+                    aligned_count.eq(aligned_count + 1)),
+                If(misaligned & (misaligned_count != commas),
+                    misaligned_count.eq(misaligned_count + 1))
+            )
+        self.comb += [
+            success.i.eq(checking_rxclk & aligned
+                         & (aligned_count == commas - 1)),
+            failure.i.eq(checking_rxclk & misaligned
+                         & (misaligned_count == commas - 1)),
+            comma_seen_reset.i.eq(check)
+        ]
+
+        timeout = WaitTimer(check_max_val)
+        fsm = FSM(reset_state="WAIT_READY")
+        self.submodules += timeout, fsm
+
+        fsm.act("WAIT_READY",
+            If(self.ready, NextState("CHECK"))
+        )
+        fsm.act("CHECK",
+            checking.eq(1),
+            timeout.wait.eq(1),
+            If(~self.ready,
+                NextState("WAIT_READY")
+            ).Elif(failure.o | timeout.done,
+                self.restart.eq(1),
+                NextState("WAIT_RESET")
+            ).Elif(success.o,
+                lock.eq(1),
+                NextState("LOCKED")
             )
+        )
+        # the restart is taken into account one cycle later
+        fsm.act("WAIT_RESET",
+            If(~self.ready, NextState("WAIT_READY"))
+        )
+        # the comma seen flag is reset at every check, the first check
+        # after locking only tells that a check period has started
+        fsm.act("LOCKED",
+            If(~self.ready,
+                NextState("WAIT_READY")
+            ).Elif(check,
+                NextState("MONITOR")
+            )
+        )
+        fsm.act("MONITOR",
+            If(~self.ready,
+                NextState("WAIT_READY")
+            ).Elif(check & ~comma_seen,
+                self.restart.eq(1),
+                NextState("WAIT_RESET")
+            )
+        )
+        self.comb += self.locked.eq(fsm.ongoing("LOCKED")
+                                    | fsm.ongoing("MONITOR"))
+
+
+# Aligns the comma to the MSBs of the output word with a barrel shifter,
+# as an alternative to BruteforceClockAligner that locks within a few words
+# of the receiver becoming ready. The latency then depends on the phase of
+# the recovered clock, and increases by data_width - offset bit periods
+# (plus one word) when offset is not zero; offset must therefore be
+# compensated where a fixed latency is needed.
+#
+# The first comma found at any bit position locks the shifter. It is
+# unlocked, and the search resumes, when commas commas have been seen at
+# another position without any at the locked one in between. The
+# transmitter must send commas in its first symbol only.
+class CommaAligner(Module):
+    def __init__(self, comma, data_width=20, commas=4):
+        self.rxdata = Signal(data_width)
+        self.o = Signal(data_width)
+        self.locked = Signal()
+        self.offset = Signal(max=data_width)
+
+        # # #
+
+        comma_n = ~comma & 0b1111111111
+        rxdata_r = Signal(data_width)
+        history = Cat(rxdata_r, self.rxdata)
+        self.sync += rxdata_r.eq(self.rxdata)
+
+        found = Signal(data_width)
+        self.comb += [found[i].eq((history[i:i+10] == comma)
+                                  | (history[i:i+10] == comma_n))
+                      for i in range(data_width)]
+        first = Signal(max=data_width)
+        self.comb += [If(found[i], first.eq(i))
+                      for i in reversed(range(data_width))]
+
+        found_locked = Signal()
+        misaligned_count = Signal(max=commas+1)
+        self.comb += found_locked.eq((found >> self.offset)[0])
+        self.sync += \
+            If(~self.locked,
+                If(found != 0,
+                    self.locked.eq(1),
+                    self.offset.eq(first),
+                    misaligned_count.eq(0)
+                )
+            ).Elif(found_locked,
+                misaligned_count.eq(0)
+            ).Elif(found != 0,
+                If(misaligned_count == commas - 1,
+                    self.locked.eq(0)
+                ).Else(
+                    misaligned_count.eq(misaligned_count + 1)
+                )
+            )
+
+        self.sync += Case(self.offset, {i: self.o.eq(history[i:i+data_width])
+                                        for i in range(data_width)})
@@ -0,0 +1,62 @@
+# Register map of gtx_control.GTXControl, importable by host-side tools
+# without Migen and MiSoC
+
+
+__all__ = [
+    "GTX_TXDIFFCTRL_ADDR", "GTX_TXPRECURSOR_ADDR", "GTX_TXPOSTCURSOR_ADDR",
+    "GTX_RXEQ_ADDR", "GTX_RESTART_ADDR", "GTX_STATS_CLEAR_ADDR",
+    "GTX_TX_INIT_STATS_ADDR", "GTX_RX_INIT_STATS_ADDR",
+    "GTX_ALIGNER_RESTARTS_ADDR", "GTX_ALIGNER_LOCK_TIME_ADDR",
+    "GTX_ALIGNER_OFFSET_ADDR", "GTX_ALIGNER_LOCKED",
+    "GTX_DRP_ADDR", "GTX_INIT_STATES",
+    "GTX_RXLPMEN", "GTX_RXLPMHFHOLD", "GTX_RXLPMLFHOLD",
+    "GTX_RXDFEAGCHOLD", "GTX_RXDFELFHOLD",
+    "GTX_RESTART_TX", "GTX_RESTART_RX",
+]
+
+
+(
+    GTX_TXDIFFCTRL_ADDR,
+    GTX_TXPRECURSOR_ADDR,
+    GTX_TXPOSTCURSOR_ADDR,
+    GTX_RXEQ_ADDR,
+    GTX_RESTART_ADDR,
+    GTX_STATS_CLEAR_ADDR,
+) = range(6)
+
+# Bring-up statistics (read only, in sys clock cycles since the last write
+# to GTX_STATS_CLEAR_ADDR, saturating at 2**32-1). The initialization FSM
+# statistics are the time spent in each of GTX_INIT_STATES, in that order,
+# followed by the total time spent not ready.
+GTX_INIT_STATES = [
+    "INITIAL", "RESET_GTX", "WAIT_CPLL", "RELEASE_RESET", "ALIGN",
+    "WAIT_ALIGN", "WAIT_FIRST_ALIGN_DONE", "WAIT_SECOND_ALIGN_DONE", "READY"
+]
+GTX_TX_INIT_STATS_ADDR = 8
+GTX_RX_INIT_STATS_ADDR = GTX_TX_INIT_STATS_ADDR + len(GTX_INIT_STATES) + 1
+# number of restarts of the clock aligner, and time of the last lock
+GTX_ALIGNER_RESTARTS_ADDR = GTX_RX_INIT_STATS_ADDR + len(GTX_INIT_STATES) + 1
+GTX_ALIGNER_LOCK_TIME_ADDR = GTX_ALIGNER_RESTARTS_ADDR + 1
+
+# Bit offset of the comma with the fabric comma aligner (read only), ORed
+# with GTX_ALIGNER_LOCKED when it is locked. Reads as 0 with the bruteforce
+# clock aligner, which keeps no statistics with the fabric comma aligner.
+GTX_ALIGNER_OFFSET_ADDR = GTX_ALIGNER_LOCK_TIME_ADDR + 1
+
+# DRP register n is at word address GTX_DRP_ADDR + n
+GTX_DRP_ADDR = 0x200
+
+# GTX_RXEQ_ADDR
+(
+    GTX_RXLPMEN,
+    GTX_RXLPMHFHOLD,
+    GTX_RXLPMLFHOLD,
+    GTX_RXDFEAGCHOLD,
+    GTX_RXDFELFHOLD,
+) = (1 << i for i in range(5))
+
+# GTX_RESTART_ADDR
+GTX_RESTART_TX, GTX_RESTART_RX = 1, 2
+
+# GTX_ALIGNER_OFFSET_ADDR
+GTX_ALIGNER_LOCKED = 1 << 8
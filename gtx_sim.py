@@ -0,0 +1,277 @@
+# Behavioral simulation models of the GTXE2_CHANNEL, GTXE2_COMMON,
+# IBUFDS_GTE2 and BUFG instances of gtx.py, so that GTXTransmitter,
+# GTXReceiver and GTXTransceiver can be simulated with Migen:
+#
+#   run_simulation(top, generators, clocks=sim_clocks(),
+#                  special_overrides=special_overrides(seed=1))
+#
+# The models cover what the gateware relies on, not the analog behavior:
+#  * the PLLs lock pll_lock_cycles (sys clock) after the start;
+#  * TX/RXRESETDONE rise reset_done_cycles after GTTX/RXRESET is released,
+#    and TX/RXDLYSRESET is followed, every align_cycles, by DLYSRESETDONE
+#    and the two rising edges of PHALIGNDONE;
+#  * the TX data (with the 8b10b encoder bypassed) goes to the receivers
+#    whose RX pads are the TX pads of the transmitter, one word per TXUSRCLK
+#    cycle: the serial line is modeled at the word level, first bit in the
+#    LSB, to keep simulations fast;
+#  * the word boundary of the receiver slips by a random number of bits
+#    (one of slips, in turn, or random with seed) at every GTRXRESET, as
+#    the phase of the recovered clock would: with a slip of s bits, a comma
+#    sent in the first symbol lands at bit s of RXDATA;
+#  * the DRP is a register file.
+# The buffers are left out: the simulator drives the "tx" and "rx" clocks,
+# at the periods given by sim_clocks. The transmitter and the receiver of a
+# link must be in the same simulation.
+
+import random
+
+from migen import *
+
+from gtx import GTXTransceiver
+
+
+class _ChannelModel(Module):
+    def __init__(self, instance, line, slips, pll_lock_cycles,
+                 reset_done_cycles, align_cycles):
+        parameters = {item.name: item.value for item in instance.items
+                      if isinstance(item, Instance.Parameter)}
+        port = instance.get_io
+
+        # DRP
+        drp = Array(Signal(16) for _ in range(512))
+        self.sync += [
+            port("DRPRDY").eq(port("DRPEN")),
+            If(port("DRPEN"),
+                If(port("DRPWE"),
+                    drp[port("DRPADDR")].eq(port("DRPDI"))
+                ),
+                port("DRPDO").eq(drp[port("DRPADDR")])
+            )
+        ]
+
+        if port("CPLLLOCK") is not None:
+            self.submodules += _PLLModel(port("CPLLLOCK"), pll_lock_cycles)
+
+        for direction in "TX", "RX":
+            reset = port("GT{}RESET".format(direction))
+            if reset is None:
+                continue
+            resetdone = Signal()
+            self.comb += port(direction + "RESETDONE").eq(resetdone)
+            self._handshakes(reset, resetdone,
+                             port(direction + "DLYSRESET"),
+                             port(direction + "DLYSRESETDONE"),
+                             port(direction + "PHALIGNDONE"),
+                             reset_done_cycles, align_cycles)
+            if direction == "TX":
+                self._serializer(port, parameters["TX_DATA_WIDTH"].value,
+                                 line(port("GTXTXP")))
+            else:
+                self._deserializer(port, parameters["RX_DATA_WIDTH"].value,
+                                   line(port("GTXRXP")), reset, resetdone,
+                                   slips)
+
+    def _handshakes(self, reset, resetdone, dlysreset, dlysresetdone,
+                    phaligndone, reset_done_cycles, align_cycles):
+        reset_timer = Signal(max=reset_done_cycles+1)
+        self.sync += \
+            If(reset,
+                resetdone.eq(0),
+                reset_timer.eq(reset_done_cycles)
+            ).Elif(reset_timer != 0,
+                reset_timer.eq(reset_timer - 1)
+            ).Else(
+                resetdone.eq(1)
+            )
+
+        # steps 0 to 3: DLYSRESETDONE, PHALIGNDONE high, low and high again
+        align_step = Signal(max=5, reset=4)
+        align_timer = Signal(max=align_cycles+1)
+        self.sync += \
+            If(reset | dlysreset,
+                dlysresetdone.eq(0),
+                phaligndone.eq(0),
+                align_step.eq(Mux(reset, 4, 0)),
+                align_timer.eq(align_cycles)
+            ).Elif(align_step != 4,
+                If(align_timer != 0,
+                    align_timer.eq(align_timer - 1)
+                ).Else(
+                    align_timer.eq(align_cycles),
+                    align_step.eq(align_step + 1),
+                    Case(align_step, {
+                        0: dlysresetdone.eq(1),
+                        1: phaligndone.eq(1),
+                        2: phaligndone.eq(0),
+                        3: phaligndone.eq(1)
+                    })
+                )
+            )
+
+    def _serializer(self, port, data_width, line):
+        nwords = data_width//10
+        tx_sync = getattr(self.sync, port("TXUSRCLK2").cd)
+        tx_sync += line.eq(Cat(*[Cat(port("TXDATA")[8*i:8*i+8],
+                                     port("TXCHARDISPVAL")[i],
+                                     port("TXCHARDISPMODE")[i])
+                                 for i in range(nwords)]))
+
+    def _deserializer(self, port, data_width, line, reset, resetdone, slips):
+        nwords = data_width//10
+
+        slip_table = Array(Constant(s, bits_for(data_width - 1)) for s in slips)
+        reset_count = Signal(max=len(slips) + 1)
+        slip = Signal(max=data_width)
+        reset_r = Signal()
+        self.sync += [
+            reset_r.eq(reset),
+            If(reset & ~reset_r,
+                slip.eq(slip_table[reset_count]),
+                If(reset_count == len(slips) - 1,
+                    reset_count.eq(0)
+                ).Else(
+                    reset_count.eq(reset_count + 1)
+                )
+            )
+        ]
+
+        line_r = Signal(data_width)
+        history = Cat(line_r, line)
+        rxdata = Signal(data_width)
+        rx_sync = getattr(self.sync, port("RXUSRCLK2").cd)
+        rx_sync += [
+            line_r.eq(line),
+            If(resetdone,
+                Case(slip, {s: rxdata.eq(history[data_width-s:2*data_width-s])
+                            for s in range(data_width)})
+            ).Else(
+                rxdata.eq(0)
+            )
+        ]
+        self.comb += [
+            port("RXDATA").eq(Cat(*[rxdata[10*i:10*i+8] for i in range(nwords)])),
+            port("RXCHARISK").eq(Cat(*[rxdata[10*i+8] for i in range(nwords)])),
+            port("RXDISPERR").eq(Cat(*[rxdata[10*i+9] for i in range(nwords)]))
+        ]
+
+
+class _PLLModel(Module):
+    def __init__(self, lock, lock_cycles):
+        timer = Signal(max=lock_cycles+1, reset=lock_cycles)
+        self.sync += \
+            If(timer != 0,
+                timer.eq(timer - 1)
+            ).Else(
+                lock.eq(1)
+            )
+
+
+# Returns the special_overrides argument of run_simulation. slips is the
+# sequence of bit slips of the receivers, one per GTRXRESET (including the
+# first one, after the start); it is drawn at random (with seed) if None.
+def special_overrides(slips=None, seed=None, data_width=20, pll_lock_cycles=200,
+                      reset_done_cycles=100, align_cycles=50):
+    if slips is None:
+        rng = random.Random(seed)
+        slips = [rng.randrange(data_width) for _ in range(256)]
+
+    # the words on the line, by P pad
+    lines = dict()
+    def line(pad):
+        return lines.setdefault(pad.duid, Signal(data_width))
+
+    class SimInstance:
+        @staticmethod
+        def lower(instance):
+            if instance.of == "GTXE2_CHANNEL":
+                return _ChannelModel(instance, line, slips, pll_lock_cycles,
+                                     reset_done_cycles, align_cycles)
+            elif instance.of == "GTXE2_COMMON":
+                return _PLLModel(instance.get_io("QPLLLOCK"), pll_lock_cycles)
+            elif instance.of in ("IBUFDS_GTE2", "BUFG"):
+                return Module()
+            else:
+                return None
+
+    return {Instance: SimInstance}
+
+
+# Returns the clocks argument of run_simulation, in units of half a bit
+# period. sys_clk_freq must be such that the sys clock period is a whole
+# number of units.
+def sim_clocks(line_rate=1.25e9, data_width=20, sys_clk_freq=125e6):
+    sys_period = 2*line_rate/sys_clk_freq
+    if sys_period != int(sys_period):
+        raise ValueError("sys clock period not a multiple of half a bit period")
+    return {
+        "sys": int(sys_period),
+        "tx": 2*data_width,
+        "rx": 2*data_width
+    }
+
+
+# GTXTransceiver whose TX pads are looped back to its RX pads, sending a
+# comma in the first symbol every comma_interval words and a count in the
+# other symbols.
+class Loopback(Module):
+    def __init__(self, sys_clk_freq=125e6, line_rate=1.25e9, data_width=20,
+                 comma_aligner="bruteforce", comma_interval=16):
+        line = Record([("p", 1), ("n", 1)])
+        clock_pads = Record([("p", 1), ("n", 1)])
+        self.submodules.gtx = gtx = GTXTransceiver(
+            clock_pads, line, line, sys_clk_freq, line_rate, data_width,
+            comma_aligner=comma_aligner, adaptive=True)
+        if comma_aligner == "bruteforce":
+            self.locked = gtx.clock_aligner.locked
+        else:
+            self.locked = gtx.comma_aligner.locked
+
+        # # #
+
+        count = Signal(8)
+        self.sync.tx += \
+            If(count == comma_interval - 1,
+                count.eq(0)
+            ).Else(
+                count.eq(count + 1)
+            )
+        self.comb += [
+            If(count == 0,
+                gtx.encoder.k[0].eq(1),
+                gtx.encoder.d[0].eq((5 << 5) | 28)
+            ).Else(
+                gtx.encoder.d[0].eq(count)
+            ),
+            [gtx.encoder.d[i].eq(count + i)
+             for i in range(1, gtx.config.nwords)]
+        ]
+
+
+# Simulates the bring-up of a Loopback and returns the sys clock cycles
+# until the transmitter and the receiver are ready and until the comma
+# aligner locks (None if that takes more than max_cycles).
+def time_to_ready(comma_aligner="bruteforce", line_rate=1.25e9, data_width=20,
+                  sys_clk_freq=125e6, slips=None, seed=None, max_cycles=100000,
+                  **kwargs):
+    dut = Loopback(sys_clk_freq, line_rate, data_width, comma_aligner)
+    events = {
+        "tx_ready": dut.gtx.tx_init.done,
+        "rx_ready": dut.gtx.rx_init.done,
+        "locked": dut.locked
+    }
+    times = {event: None for event in events}
+
+    def monitor():
+        for cycle in range(max_cycles):
+            for event, signal in events.items():
+                if times[event] is None and (yield signal):
+                    times[event] = cycle
+            if None not in times.values():
+                break
+            yield
+
+    run_simulation(dut, monitor(),
+                   clocks=sim_clocks(line_rate, data_width, sys_clk_freq),
+                   special_overrides=special_overrides(
+                       slips, seed, data_width, **kwargs))
+    return times
@@ -0,0 +1,305 @@
+#!/usr/bin/env python3.5
+
+# Tunes the analog settings of the transceivers of the PRBS demonstration
+# (demo_prbs.py) for the lowest bit error ratio. Every combination of the
+# given settings is applied in turn; after letting the receiver adapt (and
+# lock again if it lost the link), the error and word counters of the
+# receiver are sampled over a dwell time. Combinations are ranked by the
+# upper bound of the confidence interval of their BER, and the best one is
+# left applied.
+#
+# TX settings are changed on the transmitter board and RX settings on the
+# receiver board, each through its own RS232 link. The DRP of either
+# transceiver can also be read and written, e.g. to try other values of
+# the RXCDR_CFG or RX_DFE_XYD_CFG attributes; the transceiver must then
+# usually be restarted (--restart) for them to take effect.
+#
+# --stats summarizes the bring-up statistics of the transceivers: the time
+# spent in each state of the initialization FSMs and until ready, and the
+# number of restarts and time of the last lock of the receiver clock
+# aligner, since they were last cleared (--clear-stats).
+
+import argparse
+import itertools
+import time
+from collections import namedtuple
+
+from comm_uart import CommUART
+from gtx_registers import *
+import ber_monitor
+
+
+# Byte addresses of gtx_control.GTXControl on the bridges of PRBSTX and
+# PRBSRX
+GTX_CONTROL_BASE = 0x80
+GTX_DRP_BASE = 4*GTX_DRP_ADDR
+
+# name: (board, register, mask)
+settings = {
+    "txdiffctrl": ("tx", GTX_TXDIFFCTRL_ADDR, 0xf),
+    "txprecursor": ("tx", GTX_TXPRECURSOR_ADDR, 0x1f),
+    "txpostcursor": ("tx", GTX_TXPOSTCURSOR_ADDR, 0x1f),
+    "rxlpmen": ("rx", GTX_RXEQ_ADDR, GTX_RXLPMEN),
+    "rxlpmhfhold": ("rx", GTX_RXEQ_ADDR, GTX_RXLPMHFHOLD),
+    "rxlpmlfhold": ("rx", GTX_RXEQ_ADDR, GTX_RXLPMLFHOLD),
+    "rxdfeagchold": ("rx", GTX_RXEQ_ADDR, GTX_RXDFEAGCHOLD),
+    "rxdfelfhold": ("rx", GTX_RXEQ_ADDR, GTX_RXDFELFHOLD),
+}
+
+
+def _shift(mask):
+    return (mask & -mask).bit_length() - 1
+
+
+def drp_read(comm, address):
+    return comm.read(GTX_DRP_BASE + 4*address)
+
+
+def drp_write(comm, address, value):
+    comm.write(GTX_DRP_BASE + 4*address, value)
+
+
+def restart(comm, tx=False, rx=False):
+    comm.write(GTX_CONTROL_BASE + 4*GTX_RESTART_ADDR,
+               (GTX_RESTART_TX if tx else 0) | (GTX_RESTART_RX if rx else 0))
+
+
+def clear_stats(comm):
+    comm.write(GTX_CONTROL_BASE + 4*GTX_STATS_CLEAR_ADDR, 1)
+
+
+Stats = namedtuple("Stats",
+    "tx_init rx_init aligner_restarts aligner_lock_time aligner_offset")
+
+
+# Returns the bring-up statistics, in sys clock cycles. The initialization
+# FSM statistics are dictionaries keyed by state, plus "total". aligner_offset
+# is the offset of the fabric comma aligner, None if it is not locked.
+def read_stats(comm):
+    first = GTX_TX_INIT_STATS_ADDR
+    values = comm.read(GTX_CONTROL_BASE + 4*first,
+                       GTX_ALIGNER_OFFSET_ADDR - first + 1)
+    offset = values[GTX_ALIGNER_OFFSET_ADDR - first]
+    def init_stats(address):
+        offset = address - first
+        counters = values[offset:offset + len(GTX_INIT_STATES) + 1]
+        return dict(zip(GTX_INIT_STATES + ["total"], counters))
+    return Stats(init_stats(GTX_TX_INIT_STATS_ADDR),
+                 init_stats(GTX_RX_INIT_STATS_ADDR),
+                 values[GTX_ALIGNER_RESTARTS_ADDR - first],
+                 values[GTX_ALIGNER_LOCK_TIME_ADDR - first],
+                 offset & 0xff if offset & GTX_ALIGNER_LOCKED else None)
+
+
+def _format_cycles(cycles, sys_clk_freq):
+    if cycles == 2**32 - 1:
+        return "overflow"
+    return "{:.3f}ms".format(1e3*cycles/sys_clk_freq)
+
+
+# Returns the lines of a summary of read_stats. Directions the transceiver
+# does not have (whose counters are all zero) are left out.
+def format_stats(stats, sys_clk_freq=156e6):
+    lines = []
+    for name, init_stats in ("TX", stats.tx_init), ("RX", stats.rx_init):
+        if not any(init_stats.values()):
+            continue
+        lines.append("{} initialization: {} not ready".format(
+            name, _format_cycles(init_stats["total"], sys_clk_freq)))
+        for state in GTX_INIT_STATES:
+            lines.append("  {:24} {}".format(
+                state, _format_cycles(init_stats[state], sys_clk_freq)))
+    if stats.aligner_offset is not None:
+        lines.append("RX comma aligner: locked at offset {}".format(
+            stats.aligner_offset))
+    elif any(stats.rx_init.values()):
+        if stats.aligner_lock_time:
+            lock = "last lock at {}".format(
+                _format_cycles(stats.aligner_lock_time, sys_clk_freq))
+        else:
+            lock = "no lock"
+        lines.append("RX clock aligner: {} restarts, {}".format(
+            stats.aligner_restarts, lock))
+    return lines
+
+
+Result = namedtuple("Result", "settings errors words ber")
+
+
+def _rank(result):
+    high = result.ber.high
+    return (float("inf") if high is None else high, result.errors)
+
+
+def format_result(result):
+    return "{}: errors={} words={} BER={} [{}, {}]".format(
+        " ".join("{}={}".format(name, value)
+                 for name, value in sorted(result.settings.items())),
+        result.errors, result.words,
+        *("" if value is None else "{:.6g}".format(value)
+          for value in result.ber))
+
+
+class GTXTuner:
+    def __init__(self, rx_comm, tx_comm=None, bits_per_word=16,
+                 confidence=0.95):
+        self.comms = {"rx": rx_comm, "tx": tx_comm}
+        self.monitor = ber_monitor.BERMonitor(rx_comm, True, confidence,
+                                              bits_per_word)
+
+    def _setting(self, name):
+        try:
+            board, register, mask = settings[name]
+        except KeyError:
+            raise ValueError("unknown setting {}".format(name))
+        comm = self.comms[board]
+        if comm is None:
+            raise ValueError("setting {} requires a connection to the "
+                             "transmitter".format(name))
+        return comm, GTX_CONTROL_BASE + 4*register, mask
+
+    def get(self, name):
+        comm, address, mask = self._setting(name)
+        return (comm.read(address) & mask) >> _shift(mask)
+
+    def set(self, name, value):
+        comm, address, mask = self._setting(name)
+        value <<= _shift(mask)
+        if value & ~mask:
+            raise ValueError("value out of range for {}".format(name))
+        comm.write(address, (comm.read(address) & ~mask) | value)
+
+    def apply(self, settings):
+        for name, value in sorted(settings.items()):
+            self.set(name, value)
+
+    def measure(self, settings, dwell=1.0, settle=0.1, sleep=time.sleep):
+        self.apply(settings)
+        sleep(settle)
+        first = self.monitor.sample()
+        sleep(dwell)
+        last = self.monitor.sample()
+        return Result(dict(settings),
+                      last.errors - first.errors, last.words - first.words,
+                      self.monitor.interval_ber(first, last))
+
+    # grid maps setting names to the values to try. Returns the results of
+    # all combinations, best first.
+    def sweep(self, grid, dwell=1.0, settle=0.1, sleep=time.sleep, out=None):
+        names = sorted(grid)
+        results = []
+        for values in itertools.product(*[grid[name] for name in names]):
+            result = self.measure(dict(zip(names, values)), dwell, settle, sleep)
+            if out is not None:
+                out(format_result(result))
+            results.append(result)
+        results.sort(key=_rank)
+        self.apply(results[0].settings)
+        return results
+
+
+# Parses NAME=VALUE, NAME=FIRST:LAST (inclusive) or NAME=V1,V2,...
+def parse_setting(text):
+    name, sep, values = text.partition("=")
+    if not sep or name not in settings:
+        raise argparse.ArgumentTypeError(
+            "expected NAME=VALUES with NAME among {}".format(
+                ", ".join(sorted(settings))))
+    try:
+        if ":" in values:
+            first, last = values.split(":")
+            return name, list(range(int(first, 0), int(last, 0) + 1))
+        return name, [int(value, 0) for value in values.split(",")]
+    except ValueError:
+        raise argparse.ArgumentTypeError("invalid values {}".format(values))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="GTX settings tuner")
+    parser.add_argument("--rx", metavar="SERIAL_PORT", required=True,
+                        help="serial device of the receiver board")
+    parser.add_argument("--tx", metavar="SERIAL_PORT", default=None,
+                        help="serial device of the transmitter board, "
+                             "required for TX settings")
+    parser.add_argument("--framed", default=False, action="store_true",
+                        help="use the framed, CRC-protected bridge protocol")
+    parser.add_argument("--sweep", metavar="NAME=VALUES", nargs="+",
+                        type=parse_setting, default=[],
+                        help="settings to sweep, e.g. txdiffctrl=4:12 "
+                             "rxlpmen=0,1")
+    parser.add_argument("--set", metavar="NAME=VALUE", nargs="+",
+                        type=parse_setting, default=[],
+                        help="apply settings")
+    parser.add_argument("--get", default=False, action="store_true",
+                        help="print the current settings")
+    parser.add_argument("--dwell", default=1.0, type=float,
+                        help="measurement time per combination in seconds "
+                             "(default: %(default)s)")
+    parser.add_argument("--settle", default=0.1, type=float,
+                        help="time to wait after changing settings in seconds "
+                             "(default: %(default)s)")
+    parser.add_argument("--data-width", default=20, type=int, choices=(20, 40),
+                        help="transceiver datapath width "
+                             "(default: %(default)s)")
+    parser.add_argument("--board", default="rx", choices=("tx", "rx"),
+                        help="board for the DRP and restart commands "
+                             "(default: %(default)s)")
+    parser.add_argument("--drp-read", metavar="ADDRESS", nargs="+",
+                        type=lambda x: int(x, 0), default=[])
+    parser.add_argument("--drp-write", metavar=("ADDRESS", "VALUE"), nargs=2,
+                        type=lambda x: int(x, 0), action="append", default=[])
+    parser.add_argument("--restart", default=False, action="store_true",
+                        help="restart the transceiver of --board after the "
+                             "DRP writes")
+    parser.add_argument("--clear-stats", default=False, action="store_true",
+                        help="clear the bring-up statistics of --board "
+                             "(before --restart)")
+    parser.add_argument("--stats", default=False, action="store_true",
+                        help="print the bring-up statistics of --board")
+    parser.add_argument("--sys-clk-freq", default=156.0, type=float,
+                        help="system clock frequency of the boards in MHz "
+                             "(default: %(default)s)")
+    args = parser.parse_args()
+
+    rx_comm = CommUART(args.rx, framed=args.framed)
+    tx_comm = None
+    try:
+        if args.tx is not None:
+            tx_comm = CommUART(args.tx, framed=args.framed)
+        if args.board == "tx" and tx_comm is None:
+            parser.error("--board tx requires --tx")
+        comm = tx_comm if args.board == "tx" else rx_comm
+        for address, value in args.drp_write:
+            drp_write(comm, address, value)
+        if args.clear_stats:
+            clear_stats(comm)
+        if args.restart:
+            restart(comm, tx=args.board == "tx", rx=args.board == "rx")
+        for address in args.drp_read:
+            print("0x{:03x}: 0x{:04x}".format(address, drp_read(comm, address)))
+        if args.stats:
+            for line in format_stats(read_stats(comm), 1e6*args.sys_clk_freq):
+                print(line)
+
+        tuner = GTXTuner(rx_comm, tx_comm, 8*args.data_width//10)
+        try:
+            for name, values in args.set:
+                tuner.set(name, values[0])
+            if args.sweep:
+                results = tuner.sweep(dict(args.sweep), args.dwell, args.settle,
+                                      out=print)
+                print("best: " + format_result(results[0]))
+            if args.get:
+                for name in sorted(settings):
+                    if tuner.comms[settings[name][0]] is not None:
+                        print("{}={}".format(name, tuner.get(name)))
+        except ValueError as e:
+            parser.error(str(e))
+    finally:
+        rx_comm.close()
+        if tx_comm is not None:
+            tx_comm.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,8 @@
 from migen import *
 from misoc.interconnect import wishbone
 
+from i2c_registers import *
+
 
 __all__ = [
     "I2CMaster",
@@ -223,13 +225,3 @@ class I2CMaster(Module):
             self.sda_t.o.eq(0),
             i2c.sda_i.eq(self.sda_t.i),
         ]
-
-I2C_XFER_ADDR, I2C_CONFIG_ADDR = range(2)
-(
-    I2C_ACK,
-    I2C_READ,
-    I2C_WRITE,
-    I2C_START,
-    I2C_STOP,
-    I2C_IDLE,
-) = (1 << i for i in range(8, 14))
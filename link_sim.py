@@ -0,0 +1,457 @@
+#!/usr/bin/env python3.5
+
+# End-to-end simulation of the PRBS link of prbs_kc705.py: PRBS generator
+# and 8b10b encoder with a comma header every 16 words, serial channel,
+# fabric comma aligner (gtx_init.CommaAligner), decoders and PRBS checker.
+#
+# The channel injects random bit errors (ber, per bit), error bursts
+# (burst_rate per bit, each flipping each of burst_length bits with
+# probability 1/2), bit slips (slip_rate per bit, one bit inserted or
+# dropped) and a latency in bits, or errors at given bit positions.
+#
+# simulate() runs software models of the gateware (bit-exact with the Migen
+# modules, see test_link_sim.py) on chunks of the serial stream, which takes
+# seconds per million words. simulate_gateware() runs the Migen modules
+# themselves with the same channel, for short runs. Both report the
+# injected errors and the errors detected by the checker, in the same way
+# as the error counter of the receiver (one per word with errors).
+
+import argparse
+import random
+import re
+import time
+from collections import namedtuple
+
+from line_coding import (table_5b6b, table_5b6b_unbalanced, table_5b6b_flip,
+                         table_3b4b, table_3b4b_unbalanced, table_3b4b_flip,
+                         table_6b5b, table_4b3b, table_4b3b_kn, table_4b3b_kp)
+
+
+# K28.5, first bit first
+COMMA = "0011111010"
+_COMMA_N = "1100000101"
+_commas = re.compile("(?=({}|{}))".format(COMMA, _COMMA_N))
+
+FRAME_LENGTH = 16
+
+
+def _encode_symbol(d, k, disp_in):
+    code5b = d & 0x1f
+    code3b = d >> 5
+    if k:
+        code6b, unbalanced6b, flip6b = 0b110000, True, True
+    else:
+        code6b = table_5b6b[code5b]
+        unbalanced6b = table_5b6b_unbalanced[code5b]
+        flip6b = table_5b6b_flip[code5b]
+    code4b = table_3b4b[code3b]
+    unbalanced4b = table_3b4b_unbalanced[code3b]
+    flip4b = k or table_3b4b_flip[code3b]
+    alt7_rd0 = code3b == 7 and (k or code5b in (17, 18, 20))
+    alt7_rd1 = code3b == 7 and (k or code5b in (11, 13, 14))
+
+    disp_inter = disp_in ^ unbalanced6b
+    output_6b = ~code6b & 0x3f if not disp_in and flip6b else code6b
+    if not disp_inter and alt7_rd0:
+        disp_out, output_4b = not disp_inter, 0b0111
+    elif disp_inter and alt7_rd1:
+        disp_out, output_4b = not disp_inter, 0b1000
+    else:
+        disp_out = disp_inter ^ unbalanced4b
+        output_4b = ~code4b & 0xf if not disp_inter and flip4b else code4b
+    return format((output_6b << 4) | output_4b, "010b"), bool(disp_out)
+
+
+# [disparity][k][d]: (symbol, first bit first, disparity)
+_encode_table = [[[_encode_symbol(d, k, disp) for d in range(256)]
+                  for k in (False, True)]
+                 for disp in (False, True)]
+
+
+def _decode_symbol(symbol):
+    code6b = symbol >> 4
+    code4b = symbol & 0xf
+    k = False
+    if code6b == 0b001111:
+        k = True
+        code3b = table_4b3b_kn[code4b]
+    elif code6b == 0b110000:
+        k = True
+        code3b = table_4b3b_kp[code4b]
+    else:
+        code3b = table_4b3b[code4b]
+    return table_6b5b[code6b] | (code3b << 5), k
+
+
+# symbol, first bit first: (d, k)
+_decode_table = {format(symbol, "010b"): _decode_symbol(symbol)
+                 for symbol in range(1024)}
+
+
+# Model of line_coding.Encoder(nwords, lsb_first=True)
+class SoftEncoder:
+    def __init__(self):
+        self.disparity = False
+
+    # Returns the bits of the encoded symbols, first bit first
+    def encode(self, d, k):
+        symbols = []
+        for di, ki in zip(d, k):
+            symbol, self.disparity = _encode_table[self.disparity][ki][di]
+            symbols.append(symbol)
+        return "".join(symbols)
+
+
+def decode(symbols):
+    return _decode_table[symbols]
+
+
+# Model of prbs.PRBSGenerator with a clock enable, for two taps
+class SoftPRBSGenerator:
+    def __init__(self, n_out, n_state=23, taps=[17, 22]):
+        self.n_out = n_out
+        self.state_mask = 2**n_state - 1
+        self.taps = sorted(taps)
+        self.state = 1
+        self.o = 0
+
+    # Returns o and advances by one enabled cycle
+    def next(self):
+        o = self.o
+        low, high = self.taps
+        c = self.state
+        remaining = self.n_out
+        while remaining:
+            m = min(remaining, low + 1)
+            c = (c << m) | (((c >> (low + 1 - m)) ^ (c >> (high + 1 - m)))
+                            & (2**m - 1))
+            remaining -= m
+        self.o = c & (2**self.n_out - 1)
+        self.state = c & self.state_mask
+        return o
+
+
+# Model of prbs.PRBSChecker, for two taps
+class SoftPRBSChecker:
+    def __init__(self, n_in, n_state=23, taps=[17, 22]):
+        self.n_in = n_in
+        self.state_mask = 2**n_state - 1
+        self.taps = sorted(taps)
+        self.state = 1
+
+    # Returns the errors for the word i
+    def check(self, i):
+        low, high = self.taps
+        c = self.state
+        errors = 0
+        remaining = self.n_in
+        while remaining:
+            m = min(remaining, low + 1)
+            remaining -= m
+            bits = (i >> remaining) & (2**m - 1)
+            expected = ((c >> (low + 1 - m)) ^ (c >> (high + 1 - m))) & (2**m - 1)
+            errors = (errors << m) | (bits ^ expected)
+            c = (c << m) | bits
+        self.state = c & self.state_mask
+        return errors
+
+
+class Channel:
+    def __init__(self, ber=0.0, burst_rate=0.0, burst_length=8, slip_rate=0.0,
+                 latency=0, errors=[], seed=None):
+        self.rng = random.Random(seed)
+        self.ber = ber
+        self.burst_rate = burst_rate
+        self.burst_length = burst_length
+        self.slip_rate = slip_rate
+        self.latency = latency
+
+        self.position = 0
+        self.bit_errors = 0
+        self.bursts = 0
+        self.slips = 0
+
+        self._errors = sorted(errors, reverse=True)
+        self._next_error = self._gap(0, ber)
+        self._next_burst = self._gap(0, burst_rate)
+        self._next_slip = self._gap(0, slip_rate)
+        self._flips = []
+
+    # Returns the position of the next event after position
+    def _gap(self, position, rate):
+        if rate:
+            return position + 1 + int(self.rng.expovariate(rate))
+        else:
+            return float("inf")
+
+    # Returns the received bits for the transmitted bits, first bit first
+    def transmit(self, bits):
+        start = self.position
+        end = start + len(bits)
+        while self._errors and self._errors[-1] < end:
+            self._flips.append(self._errors.pop())
+        while self._next_error < end:
+            self._flips.append(self._next_error)
+            self._next_error = self._gap(self._next_error, self.ber)
+        while self._next_burst < end:
+            self.bursts += 1
+            self._flips += [self._next_burst + i
+                            for i in range(self.burst_length)
+                            if self.rng.random() < 0.5]
+            self._next_burst = self._gap(self._next_burst, self.burst_rate)
+        slips = []
+        while self._next_slip < end:
+            slips.append(self._next_slip)
+            self._next_slip = self._gap(self._next_slip, self.slip_rate)
+        self.position = end
+
+        received = bytearray(bits, "ascii")
+        flips = []
+        for flip in self._flips:
+            if flip < end:
+                received[flip - start] ^= 1
+                self.bit_errors += 1
+            else:
+                flips.append(flip)
+        self._flips = flips
+        for slip in reversed(slips):
+            self.slips += 1
+            i = slip - start
+            if self.rng.random() < 0.5:
+                received[i:i+1] = b""
+            else:
+                received[i:i] = received[i:i+1]
+
+        received = received.decode()
+        if start == 0:
+            received = "0"*self.latency + received
+        return received
+
+
+# Model of gtx_init.CommaAligner on a stream of received bits (at
+# consecutive deserializer words), returning the aligned words.
+class SoftCommaAligner:
+    def __init__(self, data_width=20, commas=4):
+        self.data_width = data_width
+        self.commas = commas
+        self.locked = False
+        self.offset = 0
+        self.misaligned_count = 0
+        self.relocks = 0
+
+        self._stream = ""
+        self._base = 0      # position of _stream[0]
+        self._scanned = 0   # position of the first comma start not scanned
+        self._word = 1      # last deserializer word of the history
+        self._found = []
+
+    def receive(self, bits):
+        w = self.data_width
+        self._stream += bits
+        self._found += [self._base + m.start() for m in _commas.finditer(
+            self._stream, self._scanned - self._base)]
+        self._scanned = max(self._base + len(self._stream) - 9, self._scanned)
+
+        aligned = []
+        found = self._found
+        f = 0
+        while self._base + len(self._stream) >= (self._word + 1)*w:
+            history = (self._word - 1)*w
+            q = history + self.offset - self._base
+            aligned.append(self._stream[q:q+w])
+
+            offsets = []
+            while f < len(found) and found[f] < history + w:
+                offsets.append(found[f] - history)
+                f += 1
+            if offsets:
+                if not self.locked:
+                    self.locked = True
+                    self.offset = min(offsets)
+                    self.misaligned_count = 0
+                    self.relocks += 1
+                elif self.offset in offsets:
+                    self.misaligned_count = 0
+                elif self.misaligned_count == self.commas - 1:
+                    self.locked = False
+                else:
+                    self.misaligned_count += 1
+            self._word += 1
+        self._found = found[f:]
+
+        keep = (self._word - 1)*w - self._base
+        self._stream = self._stream[keep:]
+        self._base += keep
+        return aligned
+
+
+Result = namedtuple("Result", "words checked_words bit_errors bursts slips "
+                              "error_words error_bits relocks seconds")
+
+
+def format_result(result):
+    return ("{} words ({} checked) in {:.1f}s, {:.0f} words/s\n"
+            "injected: {} bit errors, {} bursts, {} slips\n"
+            "detected: {} words with errors, {} error bits, {} locks".format(
+                result.words, result.checked_words, result.seconds,
+                result.words/result.seconds if result.seconds else 0,
+                result.bit_errors, result.bursts, result.slips,
+                result.error_words, result.error_bits, result.relocks))
+
+
+# Runs the software models for words transceiver words of nwords symbols.
+# Errors are only counted from the warmup-th checked word.
+def simulate(words, channel, nwords=2, warmup=64, chunk=4096):
+    t0 = time.monotonic()
+    generator = SoftPRBSGenerator(8*nwords)
+    encoder = SoftEncoder()
+    aligner = SoftCommaAligner(10*nwords)
+    checker = SoftPRBSChecker(8*nwords)
+    header_d = [0xbc] + [0]*(nwords - 1)
+    header_k = [True] + [False]*(nwords - 1)
+    data_k = [False]*nwords
+
+    count = 0
+    checked_words = error_words = error_bits = 0
+    for first in range(0, words, chunk):
+        bits = []
+        for i in range(first, min(first + chunk, words)):
+            if i % FRAME_LENGTH == 0:
+                bits.append(encoder.encode(header_d, header_k))
+            else:
+                o = generator.next()
+                bits.append(encoder.encode([(o >> 8*j) & 0xff
+                                            for j in range(nwords)], data_k))
+        for word in aligner.receive(channel.transmit("".join(bits))):
+            d = 0
+            k0 = False
+            for j in range(nwords):
+                dj, kj = _decode_table[word[10*j:10*j+10]]
+                if j == 0:
+                    k0 = kj
+                d |= dj << 8*j
+            if k0:
+                continue
+            errors = checker.check(d)
+            count += 1
+            if count > warmup:
+                checked_words += 1
+                if errors:
+                    error_words += 1
+                    error_bits += bin(errors).count("1")
+    return Result(words, checked_words, channel.bit_errors, channel.bursts,
+                  channel.slips, error_words, error_bits, aligner.relocks,
+                  time.monotonic() - t0)
+
+
+# Runs the Migen modules for words words, with the channel between the
+# encoder and the comma aligner.
+def simulate_gateware(words, channel, nwords=2, warmup=64):
+    from migen import (Module, Signal, Cat, If, CEInserter, run_simulation)
+    from prbs import PRBSGenerator, PRBSChecker
+    from line_coding import Encoder, Decoder
+    from gtx_init import CommaAligner
+
+    class Link(Module):
+        def __init__(self):
+            count = Signal(max=FRAME_LENGTH)
+            self.sync += count.eq(count + 1)
+            generator = CEInserter()(PRBSGenerator(8*nwords))
+            encoder = Encoder(nwords, True)
+            self.submodules += generator, encoder
+            self.comb += [
+                If(count == 0,
+                    encoder.k[0].eq(1),
+                    encoder.d[0].eq(0xbc)
+                ).Else(
+                    [encoder.d[i].eq(generator.o[8*i:8*(i+1)])
+                     for i in range(nwords)],
+                    generator.ce.eq(1)
+                )
+            ]
+            self.tx = Cat(*encoder.output)
+
+            self.submodules.aligner = CommaAligner(int(COMMA[::-1], 2),
+                                                   10*nwords)
+            decoders = [Decoder(True) for _ in range(nwords)]
+            self.submodules += decoders
+            self.comb += [decoder.input.eq(self.aligner.o[10*i:10*(i+1)])
+                          for i, decoder in enumerate(decoders)]
+
+            self.submodules.checker = CEInserter()(PRBSChecker(8*nwords))
+            self.checked = Signal()
+            self.sync += [
+                self.checker.ce.eq(~decoders[0].k),
+                self.checked.eq(self.checker.ce),
+                [self.checker.i[8*i:8*(i+1)].eq(decoder.d)
+                 for i, decoder in enumerate(decoders)]
+            ]
+
+    t0 = time.monotonic()
+    dut = Link()
+    w = 10*nwords
+    counts = dict(count=0, checked_words=0, error_words=0, error_bits=0,
+                  locks=0)
+
+    def process():
+        received = ""
+        locked = False
+        # the encoder output is valid after two cycles
+        for cycle in range(words + 2):
+            tx = yield dut.tx
+            if cycle >= 2:
+                received += channel.transmit(format(tx, "0{}b".format(w))[::-1])
+            if len(received) >= w:
+                yield dut.aligner.rxdata.eq(int(received[:w][::-1], 2))
+                received = received[w:]
+            yield
+            if (yield dut.aligner.locked) and not locked:
+                counts["locks"] += 1
+            locked = yield dut.aligner.locked
+            if (yield dut.checked):
+                counts["count"] += 1
+                if counts["count"] > warmup:
+                    errors = yield dut.checker.errors
+                    counts["checked_words"] += 1
+                    if errors:
+                        counts["error_words"] += 1
+                        counts["error_bits"] += bin(errors).count("1")
+
+    run_simulation(dut, process())
+    return Result(words, counts["checked_words"], channel.bit_errors,
+                  channel.bursts, channel.slips, counts["error_words"],
+                  counts["error_bits"], counts["locks"],
+                  time.monotonic() - t0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="PRBS link simulation")
+    parser.add_argument("--words", default=1000000, type=int,
+                        help="number of transceiver words (default: %(default)s)")
+    parser.add_argument("--data-width", default=20, type=int, choices=(20, 40),
+                        help="transceiver datapath width "
+                             "(default: %(default)s)")
+    parser.add_argument("--ber", default=1e-6, type=float,
+                        help="random bit error ratio (default: %(default)s)")
+    parser.add_argument("--burst-rate", default=0.0, type=float,
+                        help="error bursts per bit (default: %(default)s)")
+    parser.add_argument("--burst-length", default=8, type=int,
+                        help="error burst length in bits "
+                             "(default: %(default)s)")
+    parser.add_argument("--slip-rate", default=0.0, type=float,
+                        help="bit slips per bit (default: %(default)s)")
+    parser.add_argument("--latency", default=0, type=int,
+                        help="channel latency in bits (default: %(default)s)")
+    parser.add_argument("--seed", default=None, type=int)
+    parser.add_argument("--gateware", default=False, action="store_true",
+                        help="simulate the Migen modules (slow)")
+    args = parser.parse_args()
+
+    channel = Channel(args.ber, args.burst_rate, args.burst_length,
+                      args.slip_rate, args.latency, seed=args.seed)
+    run = simulate_gateware if args.gateware else simulate
+    print(format_result(run(args.words, channel, args.data_width//10)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,660 @@
+#!/usr/bin/env python3.5
+
+# Static estimate of the logic depth and of the LUT and flip-flop usage of
+# gateware, to check design choices in seconds instead of a Vivado run.
+#
+# The statements of the elaborated module are turned into a bit-level
+# netlist of AND, XOR and multiplexer gates (with constants propagated and
+# XOR trees flattened), adders, subtractors and comparators being carry
+# chains. The netlist is mapped to LUT_INPUTS-input LUTs by cut
+# enumeration: each gate gets the cut of at most LUT_INPUTS signals with the
+# earliest arrival. Depths are in LUT levels, from a register, an input or a
+# special output (memory, instance) to a register, an output or a special
+# input, with CARRY_DELAY levels per bit of carry chain. Resets are left
+# out and clock enables are mapped into the LUTs like any other logic, so
+# the estimate is pessimistic for the latter.
+#
+# Examples: logic_estimate.py all
+#           logic_estimate.py encoder_4 --paths 5
+
+import argparse
+import heapq
+import itertools
+from collections import namedtuple
+
+from migen import *
+from migen.fhdl.structure import _Operator, _Slice, _Part, _ArrayProxy, \
+                                 _Assign, Display, Finish
+from migen.fhdl.specials import Memory, SPECIAL_INPUT, SPECIAL_OUTPUT, \
+                                SPECIAL_INOUT
+from migen.fhdl.bitcontainer import value_bits_sign
+from migen.fhdl.tools import group_by_targets, list_targets, list_inputs, \
+                             list_signals, lower_specials
+from migen.fhdl.namer import build_namespace
+
+
+LUT_INPUTS = 6
+CARRY_DELAY = 1/16
+# cuts kept per gate
+_CUTS = 4
+# Case statements with tests up to this width are multiplexer trees,
+# wider ones priority chains
+_CASE_MUX_BITS = 8
+
+
+# Literals are 2*node + inverted; node 0 is the constant 0.
+class _Netlist:
+    def __init__(self, lut_inputs):
+        self.lut_inputs = lut_inputs
+        self.kinds = ["const"]
+        self.fanins = [()]
+        self.cuts = [[]]
+        self.arrival = [0]
+        self.sources = [None]
+        self._xorsets = dict()
+        self._hash = dict()
+
+    def _node(self, kind, fanins, arrival, cuts=[], source=None):
+        self.kinds.append(kind)
+        self.fanins.append(fanins)
+        self.cuts.append(cuts)
+        self.arrival.append(arrival)
+        self.sources.append(source)
+        return len(self.kinds) - 1
+
+    def leaf(self, source):
+        return 2*self._node("leaf", (), 0, source=source)
+
+    def _trivial_cuts(self, n):
+        return [cut for cut, depth in self.cuts[n]] + [frozenset([n])]
+
+    def _gate(self, op, fanins):
+        key = (op, fanins)
+        try:
+            return 2*self._hash[key]
+        except KeyError:
+            pass
+        nodes = sorted({f >> 1 for f in fanins})
+        candidates = dict()
+        for cuts in itertools.product(*[self._trivial_cuts(n) for n in nodes]):
+            cut = frozenset().union(*cuts)
+            if len(cut) <= self.lut_inputs and cut not in candidates:
+                candidates[cut] = 1 + max(self.arrival[l] for l in cut)
+        cuts = sorted(candidates.items(), key=lambda c: (c[1], len(c[0])))
+        n = self._node("gate", fanins, cuts[0][1], cuts[:_CUTS])
+        self._hash[key] = n
+        return 2*n
+
+    def _carry(self, op, fanins):
+        key = (op, fanins)
+        try:
+            return 2*self._hash[key]
+        except KeyError:
+            pass
+        n = self._node("carry", fanins, CARRY_DELAY
+                       + max(self.arrival[f >> 1] for f in fanins))
+        self._hash[key] = n
+        return 2*n
+
+    def and_(self, a, b):
+        if a == 0 or b == 0 or a == b ^ 1:
+            return 0
+        if a == 1 or a == b:
+            return b
+        if b == 1:
+            return a
+        return self._gate("and", (min(a, b), max(a, b)))
+
+    def or_(self, a, b):
+        return self.and_(a ^ 1, b ^ 1) ^ 1
+
+    def _xorset(self, n):
+        return self._xorsets.get(n, frozenset([n]))
+
+    def xor(self, a, b):
+        inverted = (a ^ b) & 1
+        terms = self._xorset(a >> 1) ^ self._xorset(b >> 1)
+        terms -= {0}
+        if not terms:
+            return inverted
+        if len(terms) == 1:
+            return 2*next(iter(terms)) ^ inverted
+        key = ("xor", terms)
+        if key not in self._hash:
+            self._hash[key] = self._tree(self._xor2, [2*t for t in terms]) >> 1
+        return 2*self._hash[key] ^ inverted
+
+    def _xor2(self, a, b):
+        n = self._gate("xor", (min(a, b), max(a, b))) >> 1
+        self._xorsets[n] = self._xorset(a >> 1) | self._xorset(b >> 1)
+        return 2*n
+
+    # Combines the literals with the associative op, LUT_INPUTS at a time
+    # starting with the earliest ones
+    def _tree(self, op, literals):
+        heap = [(self.arrival[l >> 1], l) for l in literals]
+        heapq.heapify(heap)
+        while len(heap) > 1:
+            group = [heapq.heappop(heap)[1]
+                     for _ in range(min(self.lut_inputs, len(heap)))]
+            while len(group) > 1:
+                group = [op(*group[i:i+2]) if i + 1 < len(group) else group[i]
+                         for i in range(0, len(group), 2)]
+            heapq.heappush(heap, (self.arrival[group[0] >> 1], group[0]))
+        return heap[0][1]
+
+    def all_(self, literals):
+        literals = [l for l in literals if l != 1]
+        if 0 in literals:
+            return 0
+        if not literals:
+            return 1
+        return self._tree(self.and_, literals)
+
+    def any_(self, literals):
+        return self.all_([l ^ 1 for l in literals]) ^ 1
+
+    # s ? a : b
+    def mux(self, s, a, b):
+        if s & 1:
+            s, a, b = s ^ 1, b, a
+        if s == 0 or a == b:
+            return b
+        if a == 1 and b == 0:
+            return s
+        if a == 0 and b == 1:
+            return s ^ 1
+        if a in (0, 1):
+            return self.or_(self.and_(s, a), self.and_(s ^ 1, b))
+        if b in (0, 1):
+            return self.or_(self.and_(s, a), self.and_(s ^ 1, b))
+        inverted = b & 1
+        return self._gate("mux", (s, a ^ inverted, b ^ inverted)) ^ inverted
+
+    # Returns the sum and the carry out
+    def full_add(self, a, b, c):
+        p = self.xor(a, b)
+        if c in (0, 1) or p in (0, 1):
+            return self.xor(p, c), self.mux(p, c, a)
+        # the propagate signal goes through a LUT
+        if self.kinds[p >> 1] != "gate":
+            p = self._gate("lut", (p,))
+        return self._carry("xorcy", (p, c)), self._carry("muxcy", (p, a, c))
+
+    # Returns the nodes of the LUTs and carry chain cells that implement
+    # the literals.
+    def cover(self, literals):
+        luts = set()
+        carries = set()
+        visited = set()
+        stack = [l >> 1 for l in literals]
+        while stack:
+            n = stack.pop()
+            if n in visited:
+                continue
+            visited.add(n)
+            if self.kinds[n] == "gate":
+                luts.add(n)
+                stack.extend(self.cuts[n][0][0])
+            elif self.kinds[n] == "carry":
+                carries.add(n)
+                stack.extend(f >> 1 for f in self.fanins[n])
+        return luts, carries
+
+    # Returns the nodes of the latest path to the literal, first node first
+    def critical_path(self, literal):
+        path = []
+        n = literal >> 1
+        while True:
+            path.append(n)
+            if self.kinds[n] == "gate":
+                leaves = self.cuts[n][0][0]
+            elif self.kinds[n] == "carry":
+                leaves = [f >> 1 for f in self.fanins[n]]
+            else:
+                break
+            n = max(leaves, key=lambda l: self.arrival[l])
+        return path[::-1]
+
+
+class _Builder:
+    def __init__(self, fragment, lut_inputs):
+        self.netlist = _Netlist(lut_inputs)
+        self.fragment = fragment
+
+        self.registers = set()
+        for statements in fragment.sync.values():
+            self.registers |= list_targets(statements)
+        self.comb_groups = dict()
+        for targets, statements in group_by_targets(fragment.comb):
+            for target in targets:
+                self.comb_groups[target] = (targets, statements)
+        self.values = dict()
+        self._evaluating = set()
+
+    def _leaves(self, signal):
+        return [self.netlist.leaf((signal, i)) for i in range(len(signal))]
+
+    def signal(self, signal):
+        try:
+            return self.values[signal]
+        except KeyError:
+            pass
+        if signal in self.registers or signal not in self.comb_groups:
+            self.values[signal] = self._leaves(signal)
+        else:
+            targets, statements = self.comb_groups[signal]
+            key = id(statements)
+            if key in self._evaluating:
+                raise ValueError("combinational loop through {}".format(
+                    signal.backtrace[-1][0]))
+            self._evaluating.add(key)
+            env = {target: self._constant(target.reset.value, len(target))
+                   for target in targets}
+            self.execute(statements, env, 1, True)
+            self._evaluating.remove(key)
+            self.values.update(env)
+        return self.values[signal]
+
+    # Evaluates the statements of a group, assignments being conditioned
+    # by cond. Signals assigned by the group read as assigned so far if
+    # blocking and as their current value otherwise.
+    def execute(self, statements, env, cond, blocking):
+        netlist = self.netlist
+        read_env = env if blocking else None
+        for statement in statements:
+            if isinstance(statement, _Assign):
+                bits = self._fit(statement.r, len(statement.l), read_env)
+                self._assign(statement.l, bits, env, cond, read_env)
+            elif isinstance(statement, If):
+                test = self.bool(statement.cond, read_env)
+                self.execute(statement.t, env, netlist.and_(cond, test),
+                             blocking)
+                self.execute(statement.f, env, netlist.and_(cond, test ^ 1),
+                             blocking)
+            elif isinstance(statement, Case) \
+                    and len(statement.test) <= _CASE_MUX_BITS:
+                self._case_mux(statement, env, cond, blocking)
+            elif isinstance(statement, Case):
+                test = self.value(statement.test, read_env)
+                matched = 0
+                for key, case in statement.cases.items():
+                    if isinstance(key, str):
+                        continue
+                    match = self._equal(test, key.value)
+                    self.execute(case, env, netlist.and_(cond, match),
+                                 blocking)
+                    matched = netlist.or_(matched, match)
+                if "default" in statement.cases:
+                    self.execute(statement.cases["default"], env,
+                                 netlist.and_(cond, matched ^ 1), blocking)
+            elif isinstance(statement, (Display, Finish)):
+                pass
+            elif isinstance(statement, list):
+                self.execute(statement, env, cond, blocking)
+            else:
+                raise TypeError("unsupported statement {}".format(statement))
+
+    # Executes each case on its own copy of env and selects the results
+    # with a multiplexer tree, as synthesis does for narrow tests
+    def _case_mux(self, statement, env, cond, blocking):
+        netlist = self.netlist
+        test = self.value(statement.test, env if blocking else None)
+        cases = {key.value: case for key, case in statement.cases.items()
+                 if not isinstance(key, str)}
+        default = statement.cases.get("default", [])
+        results = dict()
+        choices = []
+        for value in range(2**len(test)):
+            case = cases.get(value, default)
+            if id(case) not in results:
+                result = dict(env)
+                self.execute(case, result, 1, blocking)
+                results[id(case)] = result
+            choices.append(results[id(case)])
+        for target in env:
+            if all(result[target] is env[target]
+                   for result in results.values()):
+                continue
+            bits = [result[target] for result in choices]
+            for t in test:
+                bits = [[netlist.mux(t, b1, b0) for b0, b1 in zip(c0, c1)]
+                        for c0, c1 in zip(bits[::2], bits[1::2])]
+            env[target] = [netlist.mux(cond, new, old)
+                           for new, old in zip(bits[0], env[target])]
+
+    def _target_value(self, target, env):
+        if isinstance(target, Signal):
+            return env[target]
+        elif isinstance(target, _Slice):
+            return self._target_value(target.value, env)[target.start:target.stop]
+        elif isinstance(target, Cat):
+            return [bit for part in target.l
+                    for bit in self._target_value(part, env)]
+        else:
+            raise TypeError("unsupported target {}".format(target))
+
+    def _assign(self, target, bits, env, cond, read_env):
+        netlist = self.netlist
+        if isinstance(target, Signal):
+            env[target] = [netlist.mux(cond, new, old)
+                           for new, old in zip(bits, env[target])]
+        elif isinstance(target, _Slice):
+            old = self._target_value(target.value, env)
+            self._assign(target.value,
+                         old[:target.start] + bits + old[target.stop:],
+                         env, cond, read_env)
+        elif isinstance(target, Cat):
+            for part in target.l:
+                n = len(part)
+                self._assign(part, bits[:n], env, cond, read_env)
+                bits = bits[n:]
+        elif isinstance(target, _ArrayProxy):
+            key = self.value(target.key, read_env)
+            for i, choice in enumerate(target.choices):
+                if i == len(target.choices) - 1:
+                    match = netlist.all_([self._equal(key, j) ^ 1
+                                          for j in range(i)])
+                else:
+                    match = self._equal(key, i)
+                self._assign(choice, self._extend(bits, False, len(choice)),
+                             env, netlist.and_(cond, match), read_env)
+        elif isinstance(target, _Part):
+            offset = self.value(target.offset, read_env)
+            for i in range(len(target.value)):
+                stop = min(i + target.width, len(target.value))
+                self._assign(target.value[i:stop], bits[:stop - i], env,
+                             netlist.and_(cond, self._equal(offset, i)),
+                             read_env)
+        else:
+            raise TypeError("unsupported target {}".format(target))
+
+    def _constant(self, value, n):
+        return [(value >> i) & 1 for i in range(n)]
+
+    def _extend(self, bits, signed, n):
+        if len(bits) >= n:
+            return bits[:n]
+        fill = bits[-1] if signed and bits else 0
+        return bits + [fill]*(n - len(bits))
+
+    def _fit(self, value, n, env):
+        return self._extend(self.value(value, env),
+                            value_bits_sign(value)[1], n)
+
+    def _equal(self, bits, value):
+        if value >> len(bits):
+            return 0
+        return self.netlist.all_([bit ^ 1 ^ ((value >> i) & 1)
+                                  for i, bit in enumerate(bits)])
+
+    def bool(self, value, env):
+        return self.netlist.any_(self.value(value, env))
+
+    def _add(self, a, b, carry):
+        bits = []
+        for ai, bi in zip(a, b):
+            s, carry = self.netlist.full_add(ai, bi, carry)
+            bits.append(s)
+        return bits
+
+    def _shift(self, bits, amount, left, fill):
+        netlist = self.netlist
+        n = len(bits)
+        for i, a in enumerate(amount):
+            k = 2**i
+            if left:
+                shifted = [fill]*min(k, n) + bits[:max(n - k, 0)]
+            else:
+                shifted = bits[k:] + [fill]*min(k, n)
+            bits = [netlist.mux(a, s, b) for s, b in zip(shifted, bits)]
+        return bits
+
+    # Returns the bits of an expression, LSB first
+    def value(self, value, env=None):
+        netlist = self.netlist
+        if isinstance(value, Constant):
+            return self._constant(value.value, value.nbits)
+        elif isinstance(value, Signal):
+            if env is not None and value in env:
+                return env[value]
+            return self.signal(value)
+        elif isinstance(value, (ClockSignal, ResetSignal)):
+            key = (type(value), value.cd)
+            if key not in self.values:
+                self.values[key] = [netlist.leaf((value, 0))]
+            return self.values[key]
+        elif isinstance(value, _Slice):
+            return self.value(value.value, env)[value.start:value.stop]
+        elif isinstance(value, _Part):
+            bits = self.value(value.value, env)
+            offset = self.value(value.offset, env)
+            return self._shift(bits, offset, False, 0)[:value.width]
+        elif isinstance(value, Cat):
+            return [bit for part in value.l for bit in self.value(part, env)]
+        elif isinstance(value, Replicate):
+            return self.value(value.v, env)*value.n
+        elif isinstance(value, _ArrayProxy):
+            n = len(value)
+            choices = [self._fit(choice, n, env) for choice in value.choices]
+            key = self.value(value.key, env)
+            for k in key:
+                if len(choices) == 1:
+                    break
+                if len(choices) % 2:
+                    choices.append(choices[-1])
+                choices = [[netlist.mux(k, b1, b0) for b0, b1 in zip(c0, c1)]
+                           for c0, c1 in zip(choices[::2], choices[1::2])]
+            return choices[0]
+        elif isinstance(value, _Operator):
+            return self._operator(value, env)
+        else:
+            raise TypeError("unsupported expression {}".format(value))
+
+    def _operator(self, value, env):
+        netlist = self.netlist
+        op = value.op
+        n, signed = value_bits_sign(value)
+        operands = [(self.value(operand, env), value_bits_sign(operand)[1])
+                    for operand in value.operands]
+        def fit(i, n=n):
+            bits, signed = operands[i]
+            return self._extend(bits, signed, n)
+
+        if op == "~":
+            return [bit ^ 1 for bit in fit(0)]
+        elif op in ("&", "|", "^"):
+            gate = {"&": netlist.and_, "|": netlist.or_, "^": netlist.xor}[op]
+            return [gate(a, b) for a, b in zip(fit(0), fit(1))]
+        elif op == "+" and len(operands) == 1:
+            return fit(0)
+        elif op == "+":
+            return self._add(fit(0), fit(1), 0)
+        elif op == "-" and len(operands) == 1:
+            return self._add([0]*n, [bit ^ 1 for bit in fit(0)], 1)
+        elif op == "-":
+            return self._add(fit(0), [bit ^ 1 for bit in fit(1)], 1)
+        elif op == "*":
+            a, b = fit(0), fit(1)
+            product = [0]*n
+            for i, bi in enumerate(b):
+                partial = [0]*i + [netlist.and_(ai, bi) for ai in a[:n - i]]
+                product = self._add(product, partial, 0)
+            return product
+        elif op in ("<<<", ">>>"):
+            bits, signed = operands[0]
+            fill = bits[-1] if op == ">>>" and signed else 0
+            return self._shift(self._extend(bits, signed, n), operands[1][0],
+                               op == "<<<", fill)
+        elif op in ("==", "!="):
+            width = max(len(bits) for bits, signed in operands) + 1
+            equal = netlist.all_([netlist.xor(a, b) ^ 1 for a, b in
+                                  zip(fit(0, width), fit(1, width))])
+            return [equal if op == "==" else equal ^ 1]
+        elif op in ("<", "<=", ">", ">="):
+            width = max(len(bits) for bits, signed in operands) + 1
+            a, b = fit(0, width), fit(1, width)
+            if op in (">", "<="):
+                a, b = b, a
+            less = self._add(a, [bit ^ 1 for bit in b], 1)[-1]
+            return [less if op in ("<", ">") else less ^ 1]
+        elif op == "m":
+            select = netlist.any_(operands[0][0])
+            return [netlist.mux(select, a, b) for a, b in zip(fit(1), fit(2))]
+        else:
+            raise TypeError("unsupported operator {}".format(op))
+
+
+Path = namedtuple("Path", "depth start end through")
+Estimate = namedtuple("Estimate", "luts ffs carry memories depth paths")
+
+
+# Returns the estimate of a module. The paths are those to each endpoint
+# signal, the latest first; a path starts and ends at a signal name or at a
+# special, and goes through the named combinatorial signals of its LUTs.
+def estimate(module, lut_inputs=LUT_INPUTS):
+    fragment = module.get_fragment()
+    fragment, lowered = lower_specials(dict(), fragment)
+    builder = _Builder(fragment, lut_inputs)
+    netlist = builder.netlist
+
+    memories = 0
+    special_inputs = []
+    for special in sorted(fragment.specials, key=lambda special: special.duid):
+        if isinstance(special, Memory):
+            memories += 1
+        for obj, attr, direction in special.iter_expressions():
+            expression = getattr(obj, attr)
+            if expression is None:
+                continue
+            name = "{}.{}".format(getattr(special, "of", type(special).__name__),
+                                  attr)
+            if direction in (SPECIAL_OUTPUT, SPECIAL_INOUT):
+                for signal in list_signals(expression):
+                    builder.values[signal] = [netlist.leaf((name, i))
+                                              for i in range(len(signal))]
+            if direction in (SPECIAL_INPUT, SPECIAL_INOUT):
+                special_inputs.append((name, expression))
+
+    # endpoints: (name, literals)
+    endpoints = []
+    for domain, statements in sorted(fragment.sync.items()):
+        for targets, group in group_by_targets(statements):
+            env = {target: builder.signal(target) for target in targets}
+            builder.execute(group, env, 1, False)
+            for target in sorted(targets, key=lambda target: target.duid):
+                endpoints.append((target, env[target]))
+    ffs = sum(len(register) for register in builder.registers)
+    for name, expression in special_inputs:
+        endpoints.append((name, builder.value(expression)))
+    read = list_inputs(fragment.comb) | list_inputs(fragment.sync)
+    for name, expression in special_inputs:
+        read |= list_signals(expression)
+    for signal in sorted(set(builder.comb_groups) - read,
+                         key=lambda signal: signal.duid):
+        endpoints.append((signal, builder.signal(signal)))
+
+    # name the gates from the combinatorial signals they implement
+    names = dict()
+    for signal, bits in builder.values.items():
+        if isinstance(signal, Signal) and signal in builder.comb_groups:
+            for bit in bits:
+                names.setdefault(bit >> 1, signal)
+    signals = {signal for signal in builder.values if isinstance(signal, Signal)}
+    namespace = build_namespace(signals)
+    def name(source):
+        if isinstance(source, Signal):
+            return namespace.get_name(source)
+        elif isinstance(source, str):
+            return source
+        elif isinstance(source, (ClockSignal, ResetSignal)):
+            return "{}_{}".format(source.cd, type(source).__name__)
+        signal, bit = source
+        if isinstance(signal, Signal) and len(signal) > 1:
+            return "{}[{}]".format(name(signal), bit)
+        return name(signal)
+
+    paths = []
+    literals = []
+    for endpoint, bits in endpoints:
+        literals += bits
+        if not bits:
+            continue
+        latest = max(bits, key=lambda bit: netlist.arrival[bit >> 1])
+        path = netlist.critical_path(latest)
+        through = []
+        for n in path[1:]:
+            if n in names and names[n] is not endpoint \
+                    and names[n] not in through:
+                through.append(names[n])
+        start = netlist.sources[path[0]]
+        paths.append(Path(netlist.arrival[latest >> 1],
+                          "constant" if start is None else name(start),
+                          name(endpoint), [name(signal) for signal in through]))
+    paths.sort(key=lambda path: -path.depth)
+
+    luts, carries = netlist.cover(literals)
+    return Estimate(len(luts), ffs, len(carries), memories,
+                    paths[0].depth if paths else 0, paths)
+
+
+def _designs():
+    from line_coding import Encoder, Decoder
+    from prbs import PRBSGenerator, PRBSChecker
+    from gtx_init import BruteforceClockAligner, CommaAligner
+
+    comma = 0b0101111100
+    designs = {"decoder": lambda: Decoder(True)}
+    for nwords in 1, 2, 4:
+        designs["encoder_{}".format(nwords)] = \
+            lambda nwords=nwords: Encoder(nwords, True)
+    for width in 16, 32, 64:
+        designs["prbs_generator_{}".format(width)] = \
+            lambda width=width: PRBSGenerator(width)
+        designs["prbs_checker_{}".format(width)] = \
+            lambda width=width: PRBSChecker(width)
+    for data_width in 20, 40:
+        designs["clock_aligner_{}".format(data_width)] = \
+            lambda data_width=data_width: BruteforceClockAligner(
+                comma, 125e6, data_width=data_width, adaptive=True)
+        designs["comma_aligner_{}".format(data_width)] = \
+            lambda data_width=data_width: CommaAligner(comma, data_width)
+    return designs
+
+
+def format_path(path):
+    return "{:6.2f} {}".format(path.depth, " -> ".join(
+        [path.start] + path.through + [path.end]))
+
+
+def main():
+    designs = _designs()
+    parser = argparse.ArgumentParser(
+        description="Logic depth and resource estimator")
+    parser.add_argument("designs", metavar="DESIGN", nargs="+",
+                        help="designs to estimate, or all, among: "
+                             + ", ".join(sorted(designs)))
+    parser.add_argument("--lut-inputs", default=LUT_INPUTS, type=int,
+                        help="LUT inputs (default: %(default)s)")
+    parser.add_argument("--paths", default=0, type=int,
+                        help="print the N latest paths of each design")
+    args = parser.parse_args()
+
+    names = sorted(designs) if args.designs == ["all"] else args.designs
+    for name in names:
+        if name not in designs:
+            parser.error("unknown design {}".format(name))
+
+    print("{:20} {:>6} {:>6} {:>6} {:>6} {:>6}".format(
+        "design", "LUTs", "FFs", "carry", "memory", "depth"))
+    for name in names:
+        result = estimate(designs[name](), args.lut_inputs)
+        print("{:20} {:>6} {:>6} {:>6} {:>6} {:>6.2f}".format(
+            name, result.luts, result.ffs, result.carry, result.memories,
+            result.depth))
+        for path in result.paths[:args.paths]:
+            print("    " + format_path(path))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+from operator import or_
+from functools import reduce
+
+from migen import *
+from migen.genlib.cdc import GrayCounter, NoRetiming, MultiReg, GrayDecoder
+from migen.build.platforms import kc705
+from misoc.cores.uart import RS232PHY
+from misoc.interconnect import wishbone
+
+from gtx import GTXTransmitter, GTXReceiver
+from gtx_control import GTXControl
+from prbs import PRBSGenerator, PRBSChecker
+from i2c import *
+from sequencer import Sequencer
+from si5324_kc705 import get_i2c_program, Si5324ClockRouter
+from wishbonebridge import WishboneStreamingBridge
+import build_cache
+
+
+# The PRBS is sent in all 8b10b words of the transceiver datapath, except
+# for one header cycle out of 16 that starts with a comma.
+# The transceiver settings can be changed over RS232 (see gtx_control.py).
+class PRBSTX(Module):
+    def __init__(self, platform, framed=False, line_rate=1.25e9, data_width=20):
+        sys_clock_pads = platform.request("clk156")
+        self.clock_domains.cd_sys = ClockDomain(reset_less=True)
+        self.specials += Instance("IBUFGDS",
+            i_I=sys_clock_pads.p, i_IB=sys_clock_pads.n,
+            o_O=self.cd_sys.clk)
+        sys_clk_freq = 156000000
+        self.comb += platform.request("sfp_tx_disable_n").eq(1)
+
+        gtx = GTXTransmitter(
+            clock_pads=platform.request("sgmii_clock"),
+            tx_pads=platform.request("sfp_tx"),
+            sys_clk_freq=sys_clk_freq,
+            line_rate=line_rate,
+            data_width=data_width)
+        self.submodules += gtx
+        nwords = gtx.config.nwords
+
+        frame_counter = Signal(4)
+        header = Signal()
+        self.sync.tx += [
+            frame_counter.eq(frame_counter + 1),
+            header.eq(frame_counter == 0)
+        ]
+
+        generator = ClockDomainsRenamer("tx")(CEInserter()(PRBSGenerator(8*nwords)))
+        self.submodules += generator
+
+        self.comb += [
+            If(header,
+                gtx.encoder.k[0].eq(1),
+                gtx.encoder.d[0].eq((5 << 5) | 28),
+                [(gtx.encoder.k[i].eq(0), gtx.encoder.d[i].eq(0))
+                 for i in range(1, nwords)],
+                generator.ce.eq(0)
+            ).Else(
+                [(gtx.encoder.k[i].eq(0),
+                  gtx.encoder.d[i].eq(generator.o[8*i:8*(i+1)]))
+                 for i in range(nwords)],
+                generator.ce.eq(1)
+            )
+        ]
+
+        # Wishbone target - transceiver control
+        gtx_control = GTXControl(gtx)
+        self.submodules += gtx_control
+
+        # Wishbone master - UART bridge
+        uart_phy = RS232PHY(platform.request("serial"), sys_clk_freq, 115200)
+        bridge = WishboneStreamingBridge(uart_phy, sys_clk_freq, framed=framed)
+        self.submodules += uart_phy, bridge
+
+        self.submodules += wishbone.InterconnectPointToPoint(
+            bridge.wishbone, gtx_control.bus)
+
+
+class PRBSRX(Module):
+    def __init__(self, platform, framed=False, line_rate=1.25e9, data_width=20):
+        sys_clock_pads = platform.request("clk156")
+        self.clock_domains.cd_sys = ClockDomain(reset_less=True)
+        self.specials += Instance("IBUFGDS",
+            i_I=sys_clock_pads.p, i_IB=sys_clock_pads.n,
+            o_O=self.cd_sys.clk)
+        sys_clk_freq = 156000000
+        self.comb += platform.request("sfp_tx_disable_n").eq(1)
+
+        gtx = GTXReceiver(
+            clock_pads=platform.request("sgmii_clock"),
+            rx_pads=platform.request("sfp_rx"),
+            sys_clk_freq=sys_clk_freq,
+            line_rate=line_rate,
+            data_width=data_width,
+            adaptive=True)
+        self.submodules += gtx
+        nwords = gtx.config.nwords
+
+        # PRBS checker
+        checker = ClockDomainsRenamer("rx_clean")(CEInserter()(PRBSChecker(8*nwords)))
+        self.submodules += checker
+
+        self.sync.rx += [
+            checker.ce.eq(~gtx.decoders[0].k),
+            [checker.i[8*i:8*(i+1)].eq(decoder.d)
+             for i, decoder in enumerate(gtx.decoders)]
+        ]
+
+        error_accumulator = ClockDomainsRenamer("rx_clean")(GrayCounter(32))
+        self.submodules += error_accumulator
+        error_bits = [checker.errors[i] for i in range(len(checker.errors))]
+        self.comb += error_accumulator.ce.eq(reduce(or_, error_bits))
+
+        error_decoder = GrayDecoder(32)
+        self.submodules += error_decoder
+        self.specials += [
+            NoRetiming(error_accumulator.q),
+            MultiReg(error_accumulator.q, error_decoder.i)
+        ]
+
+        # Checked word counter, for BER computation
+        word_accumulator = ClockDomainsRenamer("rx_clean")(GrayCounter(32))
+        self.submodules += word_accumulator
+        self.comb += word_accumulator.ce.eq(checker.ce)
+
+        word_decoder = GrayDecoder(32)
+        self.submodules += word_decoder
+        self.specials += [
+            NoRetiming(word_accumulator.q),
+            MultiReg(word_accumulator.q, word_decoder.i)
+        ]
+
+        # Wishbone target - I2C
+        i2c_master = I2CMaster(platform.request("i2c"))
+        self.submodules += i2c_master
+
+        # Wishbone target - transceiver control (0x80 and DRP at 0x800)
+        gtx_control = GTXControl(gtx)
+        self.submodules += gtx_control
+
+        # Wishbone target - PRBS error count (0x40) and word count (0x44)
+        checker_wb = wishbone.Interface()
+        self.sync += [
+            checker_wb.dat_r.eq(Mux(checker_wb.adr[0],
+                                    word_decoder.o, error_decoder.o)),
+            checker_wb.ack.eq(0),
+            If(checker_wb.cyc & checker_wb.stb & ~checker_wb.ack,
+                checker_wb.ack.eq(1))
+        ]
+
+        # Wishbone master - Sequencer
+        sequencer = Sequencer(get_i2c_program(sys_clk_freq,
+                                              gtx.config.word_clk_freq))
+        self.submodules += sequencer
+
+        # Wishbone master - UART bridge
+        uart_phy = RS232PHY(platform.request("serial"), sys_clk_freq, 115200)
+        bridge = WishboneStreamingBridge(uart_phy, sys_clk_freq, framed=framed)
+        self.submodules += uart_phy, bridge
+
+        # Wishbone interconnect
+        interconnect = wishbone.InterconnectShared(
+            [sequencer.bus, bridge.wishbone],
+            [(lambda a: ~(a[5] | a[9]) & (a[4] == 0), i2c_master.bus),
+             (lambda a: ~(a[5] | a[9]) & (a[4] == 1), checker_wb),
+             (lambda a: a[5] | a[9], gtx_control.bus)],
+            register=True)
+        self.submodules += interconnect
+
+        si5324_clock_router = Si5324ClockRouter(platform, sys_clk_freq)
+        self.submodules += si5324_clock_router
+
+def build_tx(framed=False, line_rate=1.25e9, data_width=20, cache=True):
+    platform = kc705.Platform()
+    top = PRBSTX(platform, framed, line_rate, data_width)
+    build_cache.build(platform, top, "prbs_tx", cache=cache)
+
+
+def build_rx(framed=False, line_rate=1.25e9, data_width=20, cache=True):
+    platform = kc705.Platform()
+    top = PRBSRX(platform, framed, line_rate, data_width)
+    build_cache.build(platform, top, "prbs_rx", cache=cache)
@@ -0,0 +1,749 @@
+from migen import *
+from migen.genlib.cdc import MultiReg
+from migen.genlib.fifo import SyncFIFO, AsyncFIFO
+from migen.genlib.roundrobin import RoundRobin, SP_CE
+
+from crc import CRCEngine
+
+
+__all__ = ["protocols", "FrameLayout", "StateTX", "StateRX", "DeltaTX", "DeltaRX",
+           "EventQueue", "MessageTX", "MessageRX", "EventOutputs",
+           "EventTX", "EventRX", "InputTX", "InputRX",
+           "LatencyMeter", "DelayLine", "TIMESTAMP_WIDTH"]
+
+
+# Remote TTL link of the ARTIQ remote TTL demonstration (demo_artiq_ttl_tx.py
+# and demo_artiq_ttl_rx.py). The TX modules drive the k and d inputs of the
+# 8b10b encoders of a transceiver, the RX modules take the k and d outputs
+# of its decoders; all run in the default clock domain, at one transceiver
+# word per cycle.
+#
+# Protocols:
+#  * "state": the state of all channels is sent round-robin in frames of a
+#    K28.5 comma word and data words (see FrameLayout), and the receiver
+#    updates its outputs at the end of each frame. An output change therefore waits
+#    for up to a frame, and pulses shorter than a frame can be lost.
+#  * "delta": only the bytes of the state that changed are sent, one per
+#    word with its index, and the receiver updates each byte as soon as it
+#    arrives. The other words carry the bytes in turn, so that the whole
+#    state is refreshed periodically even while changes keep coming, and
+#    a K28.5 comma word is sent every interval words.
+#  * "events": each change of an output is sent as a message with the
+#    channel, the value and the time (in cycles) when it must be applied,
+#    delay cycles after the change. The transmitter also sends its time in
+#    messages that start with a K28.5 comma, whenever it has no events to
+#    send and at least every sync_interval messages, and the receiver keeps
+#    its own time in step with it. The receiver queues the events in a FIFO
+#    per channel and applies each one at its time, so that edges are
+#    neither lost nor moved with respect to each other, as long as the
+#    link keeps up with delay.
+protocols = ["state", "delta", "events"]
+
+
+K28_5 = (5 << 5) | 28
+K28_0 = (0 << 5) | 28
+
+TIMESTAMP_WIDTH = 15
+
+
+# Frames of the "state" protocol: a word with a K28.5 comma in the first
+# lane, then the channels in order, 8 per symbol and lanes symbols per word
+# (the last symbol is padded with zeros), then with crc a word with the CRC
+# of the data words (CRC-8 with one lane, CRC-16 otherwise, padded with
+# zeros). The state is refreshed every frame_words words.
+class FrameLayout:
+    def __init__(self, nchannels=32, lanes=2, crc=False):
+        if nchannels < 1:
+            raise ValueError("at least one channel")
+        if lanes < 1:
+            raise ValueError("at least one lane")
+        self.nchannels = nchannels
+        self.lanes = lanes
+        self.crc = crc
+        self.data_words = (nchannels + 8*lanes - 1)//(8*lanes)
+        self.frame_words = 1 + self.data_words + int(crc)
+        if crc:
+            self.crc_width, self.crc_polynom = (8, 0x07) if lanes == 1 \
+                                               else (16, 0x1021)
+
+    # Returns the refresh latency in seconds, at word_rate words per second.
+    def refresh_latency(self, word_rate):
+        return self.frame_words/word_rate
+
+    # Returns the slices of values carried by the lanes of a data word.
+    def _symbols(self, values, word):
+        symbols = []
+        for lane in range(self.lanes):
+            start = 8*(self.lanes*word + lane)
+            symbols.append(values[start:start+8]
+                           if start < self.nchannels else None)
+        return symbols
+
+    # Returns a CRC register, initialized at the start of the frames, and
+    # the statements that update it with the data words d.
+    def _crc(self, word, d):
+        crc = Signal(self.crc_width, reset=2**self.crc_width - 1)
+        engine = CRCEngine(8*self.lanes, self.crc_width, self.crc_polynom)
+        statements = [
+            engine.data.eq(Cat(*d)),
+            engine.last.eq(crc)
+        ]
+        update = \
+            If(word == 0,
+                crc.eq(crc.reset)
+            ).Elif(word <= self.data_words,
+                crc.eq(engine.next)
+            )
+        return crc, engine, statements, update
+
+    # Returns the statements that drive the k and d inputs of the encoders
+    # with word number word (0 for the comma) of the frame of values, and
+    # with crc the CRC of the data words before word.
+    def tx_mux(self, word, values, k, d, crc=None):
+        cases = {
+            0: [k[0].eq(1), d[0].eq(K28_5)]
+               + [k[i].eq(0) for i in range(1, self.lanes)]
+               + [d[i].eq(0) for i in range(1, self.lanes)]
+        }
+        for w in range(self.data_words):
+            cases[1 + w] = [k[i].eq(0) for i in range(self.lanes)]
+            for lane, symbol in enumerate(self._symbols(values, w)):
+                cases[1 + w].append(
+                    d[lane].eq(0 if symbol is None else symbol))
+        if self.crc:
+            cases[self.frame_words - 1] = \
+                [k[i].eq(0) for i in range(self.lanes)] \
+                + [d[i].eq(crc[8*i:8*(i+1)]) for i in range(self.lanes)]
+        return Case(word, cases)
+
+    # Returns the statements that store the d outputs of the decoders in
+    # values, for word number word of the frame.
+    def rx_demux(self, word, values, d):
+        cases = dict()
+        for w in range(self.data_words):
+            symbols = self._symbols(values, w)
+            cases[1 + w] = [symbol.eq(d[lane])
+                            for lane, symbol in enumerate(symbols)
+                            if symbol is not None]
+        return Case(word, cases)
+
+
+class StateTX(Module):
+    def __init__(self, layout=None):
+        if layout is None:
+            layout = FrameLayout()
+        self.values = Signal(layout.nchannels)
+        self.k = [Signal() for _ in range(layout.lanes)]
+        self.d = [Signal(8) for _ in range(layout.lanes)]
+
+        # # #
+
+        word = Signal(max=layout.frame_words)
+        k = [Signal() for _ in range(layout.lanes)]
+        d = [Signal(8) for _ in range(layout.lanes)]
+        crc = None
+        if layout.crc:
+            crc, engine, statements, update = layout._crc(word, d)
+            self.submodules += engine
+            self.comb += statements
+            self.sync += update
+        self.comb += layout.tx_mux(word, self.values, k, d, crc)
+        self.sync += [
+            [a.eq(b) for a, b in zip(self.k + self.d, k + d)],
+            If(word == layout.frame_words - 1,
+                word.eq(0)
+            ).Else(
+                word.eq(word + 1)
+            )
+        ]
+
+
+# values is updated with the frames that are complete, and whose CRC is
+# correct with crc in the layout. rejected counts the other frames.
+class StateRX(Module):
+    def __init__(self, layout=None):
+        if layout is None:
+            layout = FrameLayout()
+        self.k = [Signal() for _ in range(layout.lanes)]
+        self.d = [Signal(8) for _ in range(layout.lanes)]
+        self.values = Signal(layout.nchannels)
+        self.rejected = Signal(32)
+
+        # # #
+
+        # word is the number of the next word of the frame, from 1 after the
+        # comma, 0 before the first comma; frame_words + 1 marks an invalid
+        # frame
+        back_buffer = Signal(layout.nchannels)
+        word = Signal(max=layout.frame_words + 2)
+        good = Signal()
+        if layout.crc:
+            crc, engine, statements, update = layout._crc(
+                Mux(self.k[0], 0, word), self.d)
+            self.submodules += engine
+            self.comb += statements
+            self.sync += [
+                update,
+                If(word == layout.frame_words - 1,
+                    good.eq(Cat(*self.d) == crc)
+                )
+            ]
+        else:
+            self.comb += good.eq(1)
+        self.sync += [
+            If(self.k[0],
+                If((word == layout.frame_words) & good,
+                    self.values.eq(back_buffer)
+                ).Elif(word != 0,
+                    self.rejected.eq(self.rejected + 1)
+                ),
+                word.eq(1)
+            ).Elif(Cat(*self.k) != 0,
+                word.eq(layout.frame_words + 1)
+            ).Else(
+                layout.rx_demux(word, back_buffer, self.d),
+                If((word != 0) & (word != layout.frame_words + 1),
+                    word.eq(word + 1)
+                )
+            )
+        ]
+
+
+# Words are either a K28.5 comma (every interval words) or nwords//2 pairs
+# of symbols, each with the index and value of a byte of the state. With
+# two pairs, the first carries the even bytes and the second the odd
+# bytes. In each pair, the word after the comma carries the next byte to
+# refresh, which guarantees a full refresh every nbytes*interval words
+# (nbytes of the pair); the other words carry the changed bytes, in turn,
+# or the next byte to refresh if none changed.
+def _delta_pairs(nwords):
+    if nwords not in (2, 4):
+        raise ValueError("the delta protocol needs 2 or 4 symbols per word")
+    return nwords//2
+
+
+class DeltaTX(Module):
+    def __init__(self, nchannels=32, nwords=2, interval=16):
+        npairs = _delta_pairs(nwords)
+        nbytes = (nchannels + 7)//8
+        if nbytes > 256:
+            raise ValueError("at most 2048 channels")
+        if interval < 2:
+            raise ValueError("interval must be at least 2")
+        self.values = Signal(nchannels)
+        self.k = [Signal() for _ in range(nwords)]
+        self.d = [Signal(8) for _ in range(nwords)]
+
+        # # #
+
+        count = Signal(max=interval)
+        self.sync += [
+            If(count == interval - 1,
+                count.eq(0)
+            ).Else(
+                count.eq(count + 1)
+            ),
+            If(count == 0,
+                [k.eq(0) for k in self.k],
+                [d.eq(0) for d in self.d],
+                self.k[0].eq(1),
+                self.d[0].eq(K28_5)
+            ).Else(
+                [k.eq(0) for k in self.k]
+            )
+        ]
+
+        for pair in range(npairs):
+            indices = range(pair, nbytes, npairs)
+            if not indices:
+                # no byte for this pair, out of range for the receiver
+                self.sync += If(count != 0, self.d[2*pair].eq(0xff))
+                continue
+            self._pair(pair, npairs, len(indices), count,
+                       [self.values[8*i:8*(i+1)] for i in indices])
+
+    def _pair(self, pair, npairs, nbytes, count, values):
+        sent = [Signal(len(value)) for value in values]
+
+        arbiter = RoundRobin(nbytes, SP_CE)
+        self.submodules += arbiter
+        self.comb += arbiter.request.eq(
+            Cat(*[value != s for value, s in zip(values, sent)]))
+        changed = Array(arbiter.request[i]
+                        for i in range(nbytes))[arbiter.grant]
+
+        refresh = Signal(max=max(nbytes, 2))
+        use_refresh = Signal()
+        index = Signal(8)
+        self.comb += [
+            use_refresh.eq((count == 1) | ~changed),
+            If(use_refresh,
+                index.eq(refresh)
+            ).Else(
+                index.eq(arbiter.grant)
+            ),
+            arbiter.ce.eq(~changed | ((count != 0) & ~use_refresh))
+        ]
+
+        value = Array(values)[index]
+        self.sync += \
+            If(count != 0,
+                self.d[2*pair].eq(index*npairs + pair),
+                self.d[2*pair + 1].eq(value),
+                Array(sent)[index].eq(value),
+                If(use_refresh,
+                    If(refresh == nbytes - 1,
+                        refresh.eq(0)
+                    ).Else(
+                        refresh.eq(refresh + 1)
+                    )
+                )
+            )
+
+
+class DeltaRX(Module):
+    def __init__(self, nchannels=32, nwords=2):
+        npairs = _delta_pairs(nwords)
+        self.k = [Signal() for _ in range(nwords)]
+        self.d = [Signal(8) for _ in range(nwords)]
+        self.values = Signal(nchannels)
+
+        # # #
+
+        nbytes = (nchannels + 7)//8
+        values = Array(self.values[8*i:8*(i+1)] for i in range(nbytes))
+        for pair in range(npairs):
+            index, value = self.d[2*pair], self.d[2*pair + 1]
+            self.sync += \
+                If((Cat(*self.k) == 0) & (index < nbytes),
+                    values[index].eq(value)
+                )
+
+
+# Messages are four symbols long, sent over 4//nwords words:
+#   time:  K28.5, time[0:8], time[8:15], 0
+#   event: K28.0, channel, time[0:8], Cat(time[8:15], value)
+def _message_words(nwords):
+    if nwords not in (1, 2, 4):
+        raise ValueError("messages need 1, 2 or 4 symbols per word")
+    return 4//nwords
+
+
+# Queues the changes of the channels (stb and value), with timestamp, in a
+# FIFO per channel, and presents them in turn as events: readable, channel
+# and dout (Cat(timestamp, value)), read with re. busy is asserted for the
+# channels whose FIFO is full, whose changes are then lost.
+class EventQueue(Module):
+    def __init__(self, nchannels=32, fifo_depth=4):
+        if nchannels > 256:
+            raise ValueError("at most 256 channels")
+        self.stb = Signal(nchannels)
+        self.value = Signal(nchannels)
+        self.timestamp = Signal(TIMESTAMP_WIDTH)
+        self.busy = Signal(nchannels)
+
+        self.readable = Signal()
+        self.channel = Signal(8)
+        self.dout = Signal(TIMESTAMP_WIDTH + 1)
+        self.re = Signal()
+
+        # # #
+
+        fifos = [SyncFIFO(TIMESTAMP_WIDTH + 1, fifo_depth)
+                 for _ in range(nchannels)]
+        self.submodules += fifos
+        for i, fifo in enumerate(fifos):
+            self.comb += [
+                fifo.din.eq(Cat(self.timestamp, self.value[i])),
+                fifo.we.eq(self.stb[i]),
+                self.busy[i].eq(~fifo.writable)
+            ]
+
+        self.submodules.arbiter = arbiter = RoundRobin(nchannels, SP_CE)
+        self.comb += arbiter.request.eq(Cat(*[fifo.readable for fifo in fifos]))
+        granted = Array(fifos)[arbiter.grant]
+        self.comb += [
+            self.readable.eq(granted.readable),
+            self.channel.eq(arbiter.grant),
+            self.dout.eq(granted.dout),
+            granted.re.eq(self.re),
+            arbiter.ce.eq(~granted.readable | self.re)
+        ]
+
+
+# Sends the events (stb, channel and data, acknowledged by ack) as messages
+# and, when there is no event to send and at least every sync_interval
+# messages, time messages with time.
+class MessageTX(Module):
+    def __init__(self, nwords=2, sync_interval=16):
+        self.stb = Signal()
+        self.channel = Signal(8)
+        self.data = Signal(TIMESTAMP_WIDTH + 1)
+        self.ack = Signal()
+        self.time = Signal(TIMESTAMP_WIDTH)
+        self.k = [Signal() for _ in range(nwords)]
+        self.d = [Signal(8) for _ in range(nwords)]
+
+        # # #
+
+        words = _message_words(nwords)
+
+        since_sync = Signal(max=sync_interval)
+        send_event = Signal()
+        self.comb += send_event.eq(self.stb
+                                   & (since_sync != sync_interval - 1))
+
+        message = Signal(32)
+        self.comb += [
+            If(send_event,
+                message.eq(Cat(C(K28_0, 8), self.channel, self.data))
+            ).Else(
+                message.eq(Cat(C(K28_5, 8), self.time, C(0, 9)))
+            )
+        ]
+
+        word = Signal(max=max(words, 2))
+        message_r = Signal(32)
+        start = Signal()
+        self.comb += [
+            start.eq(word == 0),
+            self.ack.eq(start & send_event)
+        ]
+        self.sync += [
+            If(start,
+                message_r.eq(message),
+                If(send_event,
+                    since_sync.eq(since_sync + 1)
+                ).Else(
+                    since_sync.eq(0)
+                )
+            ),
+            If(word == words - 1,
+                word.eq(0)
+            ).Else(
+                word.eq(word + 1)
+            ),
+            [k.eq(start & (i == 0)) for i, k in enumerate(self.k)],
+            Case(word, {
+                w: [d.eq(Mux(start, message, message_r)[8*(nwords*w+i):
+                                                        8*(nwords*w+i+1)])
+                    for i, d in enumerate(self.d)]
+                for w in range(words)
+            })
+        ]
+
+
+# Reassembles the messages. event and time pulse for the event and time
+# messages, with their fields.
+class MessageRX(Module):
+    def __init__(self, nwords=2):
+        self.k = [Signal() for _ in range(nwords)]
+        self.d = [Signal(8) for _ in range(nwords)]
+        self.event = Signal()
+        self.time = Signal()
+        self.channel = Signal(8)
+        self.timestamp = Signal(TIMESTAMP_WIDTH)
+        self.value = Signal()
+
+        # # #
+
+        words = _message_words(nwords)
+
+        message = Signal(32)
+        index = Signal(max=words+1)
+        valid = Signal()
+        data = Cat(*self.d)
+        self.sync += [
+            valid.eq(0),
+            If(self.k[0],
+                message[:8*nwords].eq(data),
+                valid.eq(1) if words == 1 else index.eq(1)
+            ).Elif(index != 0,
+                Case(index, {
+                    w: message[8*nwords*w:8*nwords*(w+1)].eq(data)
+                    for w in range(1, words)
+                }),
+                If(index == words - 1,
+                    valid.eq(1),
+                    index.eq(0)
+                ).Else(
+                    index.eq(index + 1)
+                )
+            )
+        ]
+
+        kind = message[:8]
+        self.comb += [
+            self.event.eq(valid & (kind == K28_0)),
+            self.time.eq(valid & (kind == K28_5)),
+            self.channel.eq(message[8:16]),
+            If(kind == K28_5,
+                self.timestamp.eq(message[8:8+TIMESTAMP_WIDTH])
+            ).Else(
+                self.timestamp.eq(message[16:16+TIMESTAMP_WIDTH])
+            ),
+            self.value.eq(message[16+TIMESTAMP_WIDTH])
+        ]
+
+
+# Applies each event (we, channel, timestamp and value) to values when now
+# reaches its timestamp, after queueing it in a FIFO per channel. late
+# counts the events that were received after their time (and applied
+# immediately), overflow those that were lost because the FIFO of their
+# channel was full: fifo_depth must cover the changes of a channel within
+# the delay of the transmitter.
+class EventOutputs(Module):
+    def __init__(self, nchannels=32, fifo_depth=4):
+        if nchannels > 256:
+            raise ValueError("at most 256 channels")
+        self.we = Signal()
+        self.channel = Signal(8)
+        self.timestamp = Signal(TIMESTAMP_WIDTH)
+        self.value = Signal()
+        self.now = Signal(TIMESTAMP_WIDTH)
+        self.values = Signal(nchannels)
+        self.late = Signal(32)
+        self.overflow = Signal(32)
+
+        # # #
+
+        def reached(t):
+            return ~(self.now - t)[TIMESTAMP_WIDTH-1]
+
+        fifos = [SyncFIFO(TIMESTAMP_WIDTH + 1, fifo_depth)
+                 for _ in range(nchannels)]
+        self.submodules += fifos
+        for i, fifo in enumerate(fifos):
+            head_timestamp = fifo.dout[:TIMESTAMP_WIDTH]
+            self.comb += [
+                fifo.din.eq(Cat(self.timestamp, self.value)),
+                fifo.we.eq(self.we & (self.channel == i)),
+                fifo.re.eq(fifo.readable & reached(head_timestamp))
+            ]
+            self.sync += If(fifo.re, self.values[i].eq(fifo.dout[-1]))
+
+        writable = Array(fifo.writable for fifo in fifos)[self.channel]
+        self.sync += [
+            If(self.we & (self.channel < nchannels),
+                If(~writable,
+                    self.overflow.eq(self.overflow + 1)
+                ).Elif(reached(self.timestamp),
+                    self.late.eq(self.late + 1)
+                )
+            )
+        ]
+
+
+# stb and value are the change strobes and new values of the channels,
+# applied delay cycles later by EventRX. busy is asserted for the channels
+# whose FIFO is full, whose changes are then lost. now is the time.
+class EventTX(Module):
+    def __init__(self, nchannels=32, nwords=2, delay=64, fifo_depth=4,
+                 sync_interval=16):
+        if not 0 < delay < 2**(TIMESTAMP_WIDTH-1):
+            raise ValueError("delay out of range")
+        self.submodules.queue = queue = EventQueue(nchannels, fifo_depth)
+        self.submodules.message_tx = message_tx = MessageTX(nwords,
+                                                            sync_interval)
+        self.stb = queue.stb
+        self.value = queue.value
+        self.busy = queue.busy
+        self.k = message_tx.k
+        self.d = message_tx.d
+        self.now = Signal(TIMESTAMP_WIDTH)
+
+        # # #
+
+        self.sync += self.now.eq(self.now + 1)
+        self.comb += [
+            queue.timestamp.eq(self.now + delay),
+            message_tx.stb.eq(queue.readable),
+            message_tx.channel.eq(queue.channel),
+            message_tx.data.eq(queue.dout),
+            queue.re.eq(message_tx.ack),
+            message_tx.time.eq(self.now)
+        ]
+
+
+# values are the channel outputs, and now the time of the transmitter when
+# the current word was sent, plus a constant. late and overflow are as in
+# EventOutputs.
+class EventRX(Module):
+    def __init__(self, nchannels=32, nwords=2, fifo_depth=4):
+        self.submodules.message_rx = message_rx = MessageRX(nwords)
+        self.submodules.outputs = outputs = EventOutputs(nchannels,
+                                                         fifo_depth)
+        self.k = message_rx.k
+        self.d = message_rx.d
+        self.values = outputs.values
+        self.late = outputs.late
+        self.overflow = outputs.overflow
+        self.now = outputs.now
+
+        # # #
+
+        words = _message_words(nwords)
+        self.sync += \
+            If(message_rx.time,
+                self.now.eq(message_rx.timestamp + words + 1)
+            ).Else(
+                self.now.eq(self.now + 1)
+            )
+        self.comb += [
+            outputs.we.eq(message_rx.event),
+            outputs.channel.eq(message_rx.channel),
+            outputs.timestamp.eq(message_rx.timestamp),
+            outputs.value.eq(message_rx.value)
+        ]
+
+
+# Remote inputs, sent back over the return link: InputTX, on the receiver,
+# timestamps the changes of inputs (asynchronous) with time, the time of the
+# transmitter given by EventRX.now, plus delay, and InputRX, on the
+# transmitter, applies them to values when now (EventTX.now) reaches their
+# timestamp. The changes of the inputs thus reach values after a constant
+# latency, as long as delay covers the latencies of both directions.
+#
+# InputTX captures the inputs in the "sys" domain and sends the messages in
+# the "tx" domain, InputRX receives them in the "rx" domain and applies them
+# in the "sys" domain; the domains can be asynchronous. busy, late and
+# overflow are as in EventQueue and EventOutputs.
+class InputTX(Module):
+    def __init__(self, ninputs=8, nwords=2, delay=128, fifo_depth=16,
+                 sync_interval=16):
+        if not 0 < delay < 2**(TIMESTAMP_WIDTH-1):
+            raise ValueError("delay out of range")
+        self.inputs = Signal(ninputs)
+        self.time = Signal(TIMESTAMP_WIDTH)
+        self.busy = Signal(ninputs)
+        self.k = [Signal() for _ in range(nwords)]
+        self.d = [Signal(8) for _ in range(nwords)]
+
+        # # #
+
+        inputs = Signal(ninputs)
+        inputs_r = Signal(ninputs)
+        self.specials += MultiReg(self.inputs, inputs)
+        self.sync += inputs_r.eq(inputs)
+
+        queue = EventQueue(ninputs, fifo_depth)
+        cdc = ClockDomainsRenamer({"write": "sys", "read": "tx"})(
+            AsyncFIFO(8 + TIMESTAMP_WIDTH + 1, 16))
+        message_tx = ClockDomainsRenamer("tx")(
+            MessageTX(nwords, sync_interval))
+        self.submodules += queue, cdc, message_tx
+        self.comb += [
+            queue.stb.eq(inputs ^ inputs_r),
+            queue.value.eq(inputs),
+            queue.timestamp.eq(self.time + delay),
+            self.busy.eq(queue.busy),
+
+            cdc.din.eq(Cat(queue.channel, queue.dout)),
+            cdc.we.eq(queue.readable),
+            queue.re.eq(queue.readable & cdc.writable),
+
+            message_tx.stb.eq(cdc.readable),
+            Cat(message_tx.channel, message_tx.data).eq(cdc.dout),
+            cdc.re.eq(message_tx.ack),
+            [a.eq(b) for a, b in zip(self.k + self.d,
+                                     message_tx.k + message_tx.d)]
+        ]
+
+
+class InputRX(Module):
+    def __init__(self, ninputs=8, nwords=2, fifo_depth=16):
+        self.k = [Signal() for _ in range(nwords)]
+        self.d = [Signal(8) for _ in range(nwords)]
+        self.now = Signal(TIMESTAMP_WIDTH)
+        self.values = Signal(ninputs)
+        self.late = Signal(32)
+        self.overflow = Signal(32)
+
+        # # #
+
+        message_rx = ClockDomainsRenamer("rx")(MessageRX(nwords))
+        cdc = ClockDomainsRenamer({"write": "rx", "read": "sys"})(
+            AsyncFIFO(8 + TIMESTAMP_WIDTH + 1, 16))
+        outputs = EventOutputs(ninputs, fifo_depth)
+        self.submodules += message_rx, cdc, outputs
+        self.comb += [
+            [a.eq(b) for a, b in zip(message_rx.k + message_rx.d,
+                                     self.k + self.d)],
+
+            cdc.din.eq(Cat(message_rx.channel, message_rx.timestamp,
+                           message_rx.value)),
+            cdc.we.eq(message_rx.event),
+
+            outputs.we.eq(cdc.readable),
+            Cat(outputs.channel, outputs.timestamp, outputs.value).eq(
+                cdc.dout),
+            cdc.re.eq(cdc.readable),
+            outputs.now.eq(self.now),
+            self.values.eq(outputs.values),
+            self.late.eq(outputs.late),
+            self.overflow.eq(outputs.overflow)
+        ]
+
+
+# Measures the latency of a remote output with a cable from that output to
+# a local input (loopback). start toggles o, which must then drive the
+# remote output while override is asserted, and latency is set to the
+# number of cycles from the change of o to that of loopback (not counting
+# the synchronizer of loopback, which is asynchronous). valid pulses at the
+# end of the measurement, with timeout set if loopback did not change within
+# max_latency cycles.
+class LatencyMeter(Module):
+    def __init__(self, max_latency=255):
+        self.start = Signal()
+        self.loopback = Signal()
+        self.override = Signal()
+        self.o = Signal()
+        self.latency = Signal(max=max_latency+1)
+        self.valid = Signal()
+        self.timeout = Signal()
+
+        # # #
+
+        loopback = Signal()
+        self.specials += MultiReg(self.loopback, loopback)
+
+        # the synchronizer takes two cycles
+        count = Signal(max=max_latency+3)
+        self.sync += [
+            self.valid.eq(0),
+            If(self.start,
+                self.override.eq(1),
+                self.o.eq(~loopback),
+                count.eq(0)
+            ).Elif(self.override,
+                If(loopback == self.o,
+                    self.override.eq(0),
+                    self.latency.eq(count - 2),
+                    self.timeout.eq(0),
+                    self.valid.eq(1)
+                ).Elif(count == max_latency + 2,
+                    self.override.eq(0),
+                    self.timeout.eq(1),
+                    self.valid.eq(1)
+                ).Else(
+                    count.eq(count + 1)
+                )
+            )
+        ]
+
+
+# Delays i by delay cycles (0 to depth-1) in o, to compensate the latency
+# of the remote outputs on the local ones. Changing delay drops or repeats
+# the changes of i that are in the delay line.
+class DelayLine(Module):
+    def __init__(self, depth=256):
+        self.i = Signal()
+        self.o = Signal()
+        self.delay = Signal(max=depth)
+
+        # # #
+
+        taps = Signal(depth - 1)
+        self.sync += taps.eq(Cat(self.i, taps))
+        self.comb += self.o.eq(
+            Array([self.i] + [taps[n] for n in range(depth - 1)])[self.delay])
@@ -1,4 +1,5 @@
-# Configures the Si5324 on the KC705 for 62.5MHz in, 62.5MHz out
+# Configures the Si5324 on the KC705 to clean up a clock, with the same
+# frequency in and out (62.5MHz by default).
 # Also configures the PCA9548 I2C switch on the KC705 to give access
 # to the Si5324.
 
@@ -8,16 +9,35 @@ from i2c import *
 from sequencer import *
 
 
-def get_i2c_program(sys_clk_freq):
+# The phase detector runs at 1.953125MHz and the oscillator at 5GHz
+# (N2 = 5*512), as determined with DSPLLsim for 62.5MHz; other frequencies
+# only change the input and output dividers.
+def get_dividers(clk_freq):
+    f3 = 62.5e6/32
+    f_osc = 5e9
+    n31 = round(clk_freq/f3)
+    if abs(n31*f3 - clk_freq) > 1e-6*clk_freq or not (1 <= n31 <= 2**19):
+        raise ValueError("Si5324 cannot take {} MHz in".format(clk_freq/1e6))
+    for n1_hs in range(4, 12):
+        nc1_ls = round(f_osc/(n1_hs*clk_freq))
+        if abs(n1_hs*nc1_ls*clk_freq - f_osc) > 1e-6*f_osc:
+            continue
+        if nc1_ls == 1 or (nc1_ls % 2 == 0 and nc1_ls <= 2**20):
+            return n1_hs, nc1_ls, 5, 512, n31
+    raise ValueError("Si5324 cannot generate {} MHz".format(clk_freq/1e6))
+
+
+def get_i2c_program(sys_clk_freq, clk_freq=62.5e6):
     # NOTE: the logical parameters DO NOT MAP to physical values written
     # into registers. They have to be mapped; see the datasheet.
     # DSPLLsim reports the logical parameters in the design summary, not
     # the physical register values (but those are present separately).
-    N1_HS  = 0   # 4
-    NC1_LS = 19  # 20
-    N2_HS  = 1   # 5
-    N2_LS  = 511 # 512
-    N31    = 31  # 32
+    n1_hs, nc1_ls, n2_hs, n2_ls, n31 = get_dividers(clk_freq)
+    N1_HS  = n1_hs - 4
+    NC1_LS = nc1_ls - 1
+    N2_HS  = n2_hs - 4
+    N2_LS  = n2_ls - 1
+    N31    = n31 - 1
 
     i2c_sequence = [
         # PCA9548: select channel 7
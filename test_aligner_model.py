@@ -0,0 +1,30 @@
+import unittest
+
+import aligner_model
+
+
+class TestAlignerModel(unittest.TestCase):
+    def test_modes(self):
+        parameters = aligner_model.default_parameters()
+        default = aligner_model.summarize(
+            aligner_model.simulate("default", parameters, 2000, seed=1))
+        adaptive = aligner_model.summarize(
+            aligner_model.simulate("adaptive", parameters, 2000, seed=1))
+        # one restart per check period, 20 phases
+        self.assertAlmostEqual(default.mean/parameters.check_period, 19.5,
+                               delta=1.5)
+        self.assertLess(adaptive.p99, default.median/10)
+        self.assertLessEqual(adaptive.median, adaptive.p95)
+
+    def test_single_phase(self):
+        parameters = aligner_model.default_parameters(
+            data_width=20, init_jitter=0)._replace(phases=1)
+        lock_times = aligner_model.simulate("adaptive", parameters, 100, seed=1)
+        words = 3*parameters.comma_interval
+        self.assertGreaterEqual(lock_times[0],
+                                parameters.init_time + words/parameters.word_rate)
+        self.assertLess(lock_times[-1], parameters.init_time
+                        + (words + parameters.comma_interval)/parameters.word_rate)
+        lock_times = aligner_model.simulate("default", parameters, 100, seed=1)
+        self.assertLess(lock_times[-1], parameters.check_period
+                        + parameters.init_time + 1e-6)
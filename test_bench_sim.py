@@ -0,0 +1,35 @@
+import json
+import unittest
+
+import bench_sim
+
+
+class TestBenchSim(unittest.TestCase):
+    def test_run_all(self):
+        results = bench_sim.run_all(cycles=20, repeat=1)
+        self.assertEqual(set(results["results"]), set(bench_sim.benchmarks))
+        for result in results["results"].values():
+            self.assertGreater(result["elaboration"], 0)
+            self.assertGreater(result["cycles_per_second"], 0)
+            self.assertEqual(result["cycles"], 20)
+        self.assertEqual(json.loads(json.dumps(results)), results)
+        self.assertEqual(len(bench_sim.format_results(results, results)),
+                         len(bench_sim.benchmarks) + 1)
+
+    def test_compare(self):
+        def results(elaboration, cycles_per_second):
+            return {"results": {"decoder": {
+                "elaboration": elaboration,
+                "simulation": 1000/cycles_per_second,
+                "cycles": 1000,
+                "cycles_per_second": cycles_per_second
+            }}}
+
+        baseline = results(0.010, 10000)
+        self.assertEqual(bench_sim.compare(baseline, results(0.011, 9000)), [])
+        self.assertEqual(bench_sim.compare(baseline, results(0.013, 10000)),
+                         [("decoder", "elaboration", 0.010, 0.013)])
+        self.assertEqual(bench_sim.compare(baseline, results(0.010, 5000)),
+                         [("decoder", "simulation", 1e-4, 2e-4)])
+        # benchmarks missing from either side are ignored
+        self.assertEqual(bench_sim.compare(baseline, {"results": {}}), [])
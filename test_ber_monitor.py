@@ -0,0 +1,74 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from comm_uart import CommUART
+from virtual_board import VirtualBoard, VirtualBoardPort
+import ber_monitor
+
+
+class TestBERMonitor(unittest.TestCase):
+    def test_poisson_interval(self):
+        low, high = ber_monitor.poisson_interval(0)
+        self.assertEqual(low, 0)
+        self.assertAlmostEqual(high, 3.689, places=3)
+        low, high = ber_monitor.poisson_interval(10)
+        self.assertAlmostEqual(low, 4.795, delta=0.05)
+        self.assertAlmostEqual(high, 18.39, delta=0.05)
+
+    def test_wraparound(self):
+        clock = mock.Mock(return_value=0.0)
+        board = VirtualBoard(clock=clock)
+        board.inject_errors(2**32 - 10)
+        with CommUART(VirtualBoardPort(board)) as comm:
+            monitor = ber_monitor.BERMonitor(comm)
+            monitor.sample()
+            board.inject_errors(20)
+            clock.return_value = 60.0
+            sample = monitor.sample()
+        self.assertEqual(sample.errors, 20)
+        self.assertEqual(sample.words, int(60*board.prbs_checker.word_rate))
+        ber = monitor.cumulative_ber()
+        self.assertAlmostEqual(ber.ber, 20/(16*sample.words))
+        self.assertLess(ber.low, ber.ber)
+        self.assertGreater(ber.high, ber.ber)
+
+    def test_wrap_warning(self):
+        board = VirtualBoard()
+        with CommUART(VirtualBoardPort(board)) as comm:
+            # 10Gbps, 40 bits: the word counter wraps every 18.3s
+            monitor = ber_monitor.BERMonitor(comm, word_rate=250e6*15/16)
+            self.assertAlmostEqual(monitor.wrap_time, 18.3, places=1)
+            with mock.patch("time.time", return_value=0.0) as time_:
+                monitor.sample()
+                time_.return_value = 5.0
+                with self.assertRaises(AssertionError):
+                    with self.assertLogs("ber_monitor"):
+                        monitor.sample()
+                time_.return_value = 15.0
+                with self.assertLogs("ber_monitor", "WARNING"):
+                    monitor.sample()
+
+    def test_run(self):
+        with tempfile.TemporaryDirectory() as directory:
+            csv = os.path.join(directory, "ber.csv")
+            binlog = os.path.join(directory, "ber.bin")
+            prometheus = os.path.join(directory, "ber.prom")
+            board = VirtualBoard(error_rate=1000.0, seed=0)
+            with CommUART(VirtualBoardPort(board)) as comm:
+                monitor = ber_monitor.BERMonitor(comm)
+                ber_monitor.run(monitor, 200, 0.2,
+                                [ber_monitor.CSVLog(csv),
+                                 ber_monitor.BinaryLog(binlog)],
+                                prometheus, report_interval=0.05,
+                                out=lambda line: None)
+            samples = ber_monitor.read_binary_log(binlog)
+            self.assertGreater(len(samples), 20)
+            self.assertEqual(samples[-1], monitor.last)
+            with open(csv) as f:
+                rows = f.read().splitlines()
+            self.assertEqual(rows[0].split(","), ber_monitor.CSVLog.fields)
+            self.assertEqual(len(rows), len(samples) + 1)
+            with open(prometheus) as f:
+                self.assertIn("prbs_ber{port=\"virtual://\"}", f.read())
@@ -0,0 +1,25 @@
+import unittest
+
+from build_cache import run_parallel
+
+
+results = []
+
+
+def record(value):
+    results.append(value)
+
+
+class TestRunParallel(unittest.TestCase):
+    def test_no_calls(self):
+        # e.g. demo_prbs.py --no-tx --no-rx
+        run_parallel([])
+
+    def test_single_call(self):
+        del results[:]
+        run_parallel([(record, (42,))])
+        self.assertEqual(results, [42])
+
+    def test_errors(self):
+        with self.assertRaises(ZeroDivisionError):
+            run_parallel([(divmod, (1, 1)), (divmod, (1, 0))])
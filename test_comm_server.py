@@ -0,0 +1,114 @@
+import asyncio
+import os
+import tempfile
+import threading
+import time
+import unittest
+
+from comm_uart import CommUART
+from comm_uart_async import AsyncCommUART
+from comm_server import CommServer
+from virtual_board import VirtualBoard, VirtualBoardPort
+
+
+# Port whose replies only become available delay seconds after the request,
+# so that requests from several clients overlap
+class SlowPort(VirtualBoardPort):
+    def __init__(self, board, delay):
+        VirtualBoardPort.__init__(self, board)
+        self.delay = delay
+        self._pending = []
+
+    def _release(self):
+        now = time.monotonic()
+        while self._pending and self._pending[0][0] <= now:
+            self._rx += self._pending.pop(0)[1]
+
+    @property
+    def in_waiting(self):
+        self._release()
+        return len(self._rx)
+
+    def write(self, data):
+        self._pending.append((time.monotonic() + self.delay,
+                              self.board.feed(data)))
+        return len(data)
+
+
+class TestCommServer(unittest.TestCase):
+    def setUp(self):
+        self.board = VirtualBoard()
+        self.board.inject_errors(7)
+        self.comm = AsyncCommUART(SlowPort(self.board, 0.05), timeout=5.0)
+        self.server = CommServer(self.comm)
+        self.loop = asyncio.new_event_loop()
+
+    def tearDown(self):
+        self.loop.close()
+        self.comm.close()
+
+    def test_clients(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "board.sock")
+            listener = self.loop.run_until_complete(self.server.serve(path))
+            thread = threading.Thread(target=self.loop.run_forever)
+            thread.start()
+            try:
+                results = {}
+                barrier = threading.Barrier(6)
+
+                def client(i):
+                    with CommUART("unix://" + path, timeout=5.0) as comm:
+                        barrier.wait()
+                        errors = comm.read(0x40)
+                        comm.write(0x04, 1000 + i)
+                        results[i] = errors, comm.read(0x04)
+
+                clients = [threading.Thread(target=client, args=(i,))
+                           for i in range(6)]
+                for c in clients:
+                    c.start()
+                for c in clients:
+                    c.join()
+            finally:
+                self.loop.call_soon_threadsafe(self.loop.stop)
+                thread.join()
+                listener.close()
+                self.loop.run_until_complete(listener.wait_closed())
+
+        self.assertEqual(len(results), 6)
+        for errors, divider in results.values():
+            self.assertEqual(errors, 7)
+            self.assertIn(divider, range(1000, 1006))
+        # every write reaches the board, identical concurrent reads do not
+        self.assertEqual(self.board.bus_writes, 6)
+        self.assertGreater(self.server.coalesced_reads, 0)
+        self.assertEqual(self.board.bus_reads + self.server.coalesced_reads, 12)
+
+    def test_write_invalidates_reads(self):
+        async def run():
+            first = asyncio.ensure_future(self.server.read(0x04, 1))
+            await asyncio.sleep(0)
+            write = asyncio.ensure_future(self.server.write(0x04, [5]))
+            second = asyncio.ensure_future(self.server.read(0x04, 1))
+            await write
+            return list(await first), list(await second)
+
+        first, second = self.loop.run_until_complete(run())
+        self.assertEqual(first, [0])
+        self.assertEqual(second, [5])
+        self.assertEqual(self.server.coalesced_reads, 0)
+        self.assertEqual(self.board.bus_reads, 2)
+
+    def test_coalesced_reads(self):
+        async def run():
+            return await asyncio.gather(
+                *[self.server.read(0x40, 2) for _ in range(5)])
+
+        results = self.loop.run_until_complete(run())
+        # a single transaction: the word counter reads the same everywhere
+        results = [list(result) for result in results]
+        self.assertEqual(results, [results[0]]*5)
+        self.assertEqual(results[0][0], 7)
+        self.assertEqual(self.server.coalesced_reads, 4)
+        self.assertEqual(self.board.bus_reads, 2)
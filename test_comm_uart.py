@@ -0,0 +1,142 @@
+import asyncio
+import threading
+import unittest
+from unittest import mock
+
+from comm_uart import CommUART
+from comm_uart_async import AsyncCommUART
+from i2c_registers import I2C_ACK, I2C_WRITE, I2C_START, I2C_STOP, I2C_IDLE
+from virtual_board import VirtualBoard, VirtualBoardPort, serve_pty
+
+
+def i2c_write(comm, octets):
+    for value in [I2C_START] + [I2C_WRITE | octet for octet in octets] + [I2C_STOP]:
+        comm.write(0x00, value)
+        while not (comm.read(0x00) & I2C_IDLE):
+            pass
+
+
+class TestCommUART(unittest.TestCase):
+    def test_registers(self):
+        board = VirtualBoard()
+        with CommUART(VirtualBoardPort(board)) as comm:
+            comm.write(0x04, 156000)
+            self.assertEqual(comm.read(0x04), 156000)
+            # the interconnect only decodes address bits 0 and 4
+            self.assertEqual(comm.read(0x0c), 156000)
+            board.inject_errors(42)
+            self.assertEqual(comm.read(0x40), 42)
+            self.assertEqual(comm.read(0x50), 42)
+        self.assertEqual(board.bus_reads, 4)
+        self.assertEqual(board.bus_writes, 1)
+
+    def test_error_rate(self):
+        clock = mock.Mock(return_value=0.0)
+        board = VirtualBoard(error_rate=1000.0, seed=1, clock=clock)
+        with CommUART(VirtualBoardPort(board)) as comm:
+            self.assertEqual(comm.read(0x40), 0)
+            clock.return_value = 10.0
+            errors = comm.read(0x40)
+        self.assertAlmostEqual(errors, 10000, delta=500)
+
+    def test_i2c(self):
+        board = VirtualBoard(i2c_busy_polls=3)
+        with CommUART(VirtualBoardPort(board)) as comm:
+            # the Si5324 is only reachable through the PCA9548
+            comm.write(0x00, I2C_START)
+            comm.write(0x00, I2C_WRITE | (0x68 << 1))
+            while not (comm.read(0x00) & I2C_IDLE):
+                pass
+            self.assertFalse(comm.read(0x00) & I2C_ACK)
+            comm.write(0x00, I2C_STOP)
+            i2c_write(comm, [0x74 << 1, 1 << 7])
+            i2c_write(comm, [0x68 << 1, 142, 0x12, 0x34])
+        self.assertEqual(board.si5324.registers[142:144], b"\x12\x34")
+
+    def test_framed_link_errors(self):
+        board = VirtualBoard(framed=True)
+        port = VirtualBoardPort(board, link_error_rate=2e-3, seed=3)
+        with CommUART(port, framed=True) as comm:
+            for i in range(50):
+                comm.write(0x04, i)
+                self.assertEqual(comm.read(0x04), i)
+        # retried writes are not executed twice
+        self.assertEqual(board.bus_writes, 50)
+
+    def test_framed_sessions(self):
+        # two sessions starting from the same SEQ, e.g. --readout followed
+        # by --set-pll-phase
+        clock = mock.Mock(return_value=0.0)
+        board = VirtualBoard(framed=True, clock=clock)
+        with mock.patch("random.randrange", return_value=0):
+            with CommUART(VirtualBoardPort(board), framed=True) as comm:
+                comm.read(0x40)
+            clock.return_value = 3.0
+            with CommUART(VirtualBoardPort(board), framed=True) as comm:
+                comm.write(0x04, 156000)
+                self.assertEqual(comm.read(0x04), 156000)
+        self.assertEqual(board.bus_writes, 1)
+
+    def test_batch(self):
+        for framed in False, True:
+            board = VirtualBoard(framed=framed)
+            board.inject_errors(7)
+            with CommUART(VirtualBoardPort(board), framed=framed) as comm:
+                with comm.batch() as batch:
+                    write = batch.write(0x04, 5)
+                    reads = [batch.read(0x04), batch.read(0x40), batch.read(0x50)]
+                self.assertIsNone(write.result())
+                self.assertEqual([read.result() for read in reads], [5, 7, 7])
+
+    def test_async(self):
+        async def readout(port):
+            comm = AsyncCommUART(port, framed=True)
+            await comm.write(0x04, 123)
+            result = await comm.read(0x04), await comm.read(0x40)
+            comm.close()
+            return result
+
+        async def readout_all():
+            return await asyncio.gather(
+                *[readout("virtual://?framed") for _ in range(4)])
+
+        loop = asyncio.new_event_loop()
+        try:
+            results = loop.run_until_complete(readout_all())
+        finally:
+            loop.close()
+        self.assertEqual(results, [(123, 0)]*4)
+
+    def test_async_unresponsive(self):
+        import demo_prbs
+
+        class DeadPort(VirtualBoardPort):
+            def write(self, data):
+                return len(data)
+
+        board = VirtualBoard()
+        board.inject_errors(5)
+        ports = [VirtualBoardPort(board), DeadPort(), "virtual://"]
+        loop = asyncio.new_event_loop()
+        try:
+            with mock.patch("builtins.print") as print_:
+                loop.run_until_complete(demo_prbs.async_readout(ports))
+        finally:
+            loop.close()
+        lines = [call[0][0] for call in print_.call_args_list]
+        self.assertEqual(len(lines), 3)
+        self.assertTrue(lines[0].endswith(": 5"))
+        self.assertTrue(lines[1].endswith(": no response"))
+        self.assertEqual(lines[2], "virtual://: 0")
+
+    def test_pty(self):
+        board = VirtualBoard()
+        board.inject_errors(99)
+        with mock.patch("builtins.print") as print_:
+            thread = threading.Thread(target=serve_pty, args=(board,), daemon=True)
+            thread.start()
+            while not print_.called:
+                thread.join(0.01)
+        name = print_.call_args[0][0].split()[-1]
+        with CommUART(name, timeout=1.0) as comm:
+            self.assertEqual(comm.read(0x40), 99)
@@ -0,0 +1,46 @@
+import unittest
+import random
+
+from migen import *
+
+from crc import CRC16
+from comm_uart import crc16
+
+
+def crc_gateware(data_width, words):
+    dut = CRC16(data_width)
+    result = None
+    def pump():
+        nonlocal result
+        yield dut.reset.eq(1)
+        yield
+        yield dut.reset.eq(0)
+        yield dut.ce.eq(1)
+        for w in words:
+            yield dut.data.eq(w)
+            yield
+        yield dut.ce.eq(0)
+        yield
+        result = yield dut.value
+    run_simulation(dut, pump())
+    return result
+
+
+class TestCRC(unittest.TestCase):
+    def test_check_value(self):
+        self.assertEqual(crc16(b"123456789"), 0x29b1)
+
+    def test_bytes(self):
+        prng = random.Random(42)
+        data = bytes(prng.randrange(256) for _ in range(64))
+        self.assertEqual(crc_gateware(8, data), crc16(data))
+
+    def test_words(self):
+        prng = random.Random(42)
+        data = bytes(prng.randrange(256) for _ in range(64))
+        words = [(data[i] << 8) | data[i+1] for i in range(0, len(data), 2)]
+        self.assertEqual(crc_gateware(16, words), crc16(data))
+
+    def test_residue(self):
+        data = b"\x01\x02\x03\x04"
+        self.assertEqual(crc16(data + crc16(data).to_bytes(2, "big")), 0)
@@ -0,0 +1,291 @@
+import unittest
+
+from migen import *
+from migen.fhdl import verilog
+from migen.build.xilinx.common import xilinx_special_overrides
+
+from gtx import GTXTransmitter, GTXReceiver, GTXTransceiver, drp_layout
+from gtx_control import GTXControl
+from gtx_init import GTXInit, BruteforceClockAligner, CommaAligner
+from gtx_registers import *
+
+
+def pads():
+    return Record([("p", 1), ("n", 1)])
+
+
+def convert(module):
+    return str(verilog.convert(module, ios=set(),
+                               special_overrides=xilinx_special_overrides))
+
+
+class TestGTX(unittest.TestCase):
+    def test_transceiver(self):
+        for line_rate, data_width in [(1.25e9, 20), (10e9, 40)]:
+            with self.subTest(line_rate=line_rate):
+                gtx = GTXTransceiver(pads(), pads(), pads(), 156e6,
+                                     line_rate, data_width)
+                self.assertEqual(len(gtx.encoder.d), data_width//10)
+                self.assertEqual(len(gtx.decoders), data_width//10)
+                v = convert(gtx)
+                self.assertEqual(v.count("GTXE2_CHANNEL #("), 1)
+                self.assertNotIn(".TXPD(", v)
+                self.assertNotIn(".RXPD(", v)
+                self.assertIn(".GTTXRESET(", v)
+                self.assertIn(".GTRXRESET(", v)
+                self.assertEqual(v.count("GTXE2_COMMON #("),
+                                 int(gtx.config.pll == "qpll"))
+
+    def test_comma_aligner(self):
+        gtx = GTXTransceiver(pads(), pads(), pads(), 156e6,
+                             comma_aligner="fabric")
+        gtx.submodules.control = GTXControl(gtx)
+        v = convert(gtx)
+        self.assertEqual(v.count("GTXE2_CHANNEL #("), 1)
+        self.assertFalse(hasattr(gtx, "clock_aligner"))
+        with self.assertRaises(ValueError):
+            GTXReceiver(pads(), pads(), 156e6, comma_aligner="rxslide")
+
+    def test_adaptive(self):
+        self.assertFalse(hasattr(GTXReceiver(pads(), pads(), 156e6)
+                                 .clock_aligner, "ready"))
+        gtx = GTXTransceiver(pads(), pads(), pads(), 156e6, adaptive=True)
+        self.assertTrue(hasattr(gtx.clock_aligner, "ready"))
+        v = convert(gtx)
+        self.assertEqual(v.count("GTXE2_CHANNEL #("), 1)
+
+    def test_simplex(self):
+        v = convert(GTXTransmitter(pads(), pads(), 156e6))
+        self.assertIn(".RXPD(", v)
+        self.assertNotIn(".GTRXRESET(", v)
+        v = convert(GTXReceiver(pads(), pads(), 156e6))
+        self.assertIn(".TXPD(", v)
+        self.assertNotIn(".GTTXRESET(", v)
+
+
+class DRPModel(Module):
+    def __init__(self, latency=3):
+        self.drp = Record(drp_layout)
+        self.registers = [0]*512
+        self.latency = latency
+
+    @passive
+    def respond(self):
+        while True:
+            yield
+            if (yield self.drp.en):
+                address = yield self.drp.addr
+                if (yield self.drp.we):
+                    self.registers[address] = yield self.drp.di
+                for _ in range(self.latency):
+                    yield
+                yield self.drp.do.eq(self.registers[address])
+                yield self.drp.rdy.eq(1)
+                yield
+                yield self.drp.rdy.eq(0)
+
+
+class TestGTXControl(unittest.TestCase):
+    def test_registers(self):
+        gtx = DRPModel()
+        gtx.txdiffctrl = Signal(4)
+        gtx.txprecursor = Signal(5)
+        gtx.txpostcursor = Signal(5)
+        gtx.tx_restart = Signal()
+        gtx.submodules.tx_init = GTXInit(156e6, rx=False)
+        dut = GTXControl(gtx)
+        dut.submodules += gtx
+        results = []
+        restarts = []
+        stats = []
+
+        def master():
+            results.append((yield from dut.bus.read(GTX_TXDIFFCTRL_ADDR)))
+            yield from dut.bus.write(GTX_TXPOSTCURSOR_ADDR, 0x13)
+            yield from dut.bus.write(GTX_RXEQ_ADDR, GTX_RXLPMEN)
+            results.append((yield from dut.bus.read(GTX_TXPOSTCURSOR_ADDR)))
+            # no receiver
+            results.append((yield from dut.bus.read(GTX_RXEQ_ADDR)))
+            yield from dut.bus.write(GTX_DRP_ADDR + 0xa8, 0x1234)
+            yield from dut.bus.write(GTX_DRP_ADDR + 0x11, 0xabcd)
+            results.append((yield from dut.bus.read(GTX_DRP_ADDR + 0xa8)))
+            yield from dut.bus.write(GTX_RESTART_ADDR, GTX_RESTART_TX)
+            for _ in range(2):
+                yield
+            results.append((yield gtx.txpostcursor))
+            stats.append((yield from dut.bus.read(GTX_TX_INIT_STATS_ADDR)))
+            stats.append((yield from dut.bus.read(GTX_RX_INIT_STATS_ADDR)))
+            yield from dut.bus.write(GTX_STATS_CLEAR_ADDR, 1)
+            stats.append((yield from dut.bus.read(GTX_TX_INIT_STATS_ADDR)))
+
+        @passive
+        def monitor():
+            while True:
+                restarts.append((yield gtx.tx_restart))
+                yield
+
+        run_simulation(dut, [master(), gtx.respond(), monitor()])
+        self.assertEqual(results, [0b1000, 0x13, 0, 0x1234, 0x13])
+        self.assertEqual(gtx.registers[0xa8], 0x1234)
+        self.assertEqual(gtx.registers[0x11], 0xabcd)
+        self.assertEqual(sum(restarts), 1)
+        # still in the INITIAL state of the TX initialization
+        self.assertGreater(stats[0], 20)
+        self.assertEqual(stats[1], 0)
+        self.assertLess(stats[2], 5)
+
+
+class TestGTXInit(unittest.TestCase):
+    def test_stats(self):
+        dut = GTXInit(10e6, rx=False)
+        results = []
+
+        def transceiver():
+            for _ in range(20):
+                yield
+            yield dut.cplllock.eq(1)
+            yield dut.Xxresetdone.eq(1)
+            yield dut.Xxdlysresetdone.eq(1)
+            for _ in range(4):
+                for _ in range(10):
+                    yield
+                yield dut.Xxphaligndone.eq(1)
+                for _ in range(10):
+                    yield
+                yield dut.Xxphaligndone.eq(0)
+            for _ in range(5):
+                yield
+            results.append((yield dut.done))
+            results.append((yield dut.total_cycles))
+            state_cycles = []
+            for counter in dut.state_cycles:
+                state_cycles.append((yield counter))
+            results.append(state_cycles)
+            yield dut.clear_stats.eq(1)
+            yield
+            yield dut.clear_stats.eq(0)
+            yield
+            results.append((yield dut.total_cycles))
+
+        run_simulation(dut, transceiver())
+        done, total, state_cycles, cleared = results
+        self.assertTrue(done)
+        self.assertGreater(state_cycles[GTX_INIT_STATES.index("WAIT_CPLL")], 10)
+        self.assertGreater(state_cycles[GTX_INIT_STATES.index("READY")], 0)
+        self.assertEqual(
+            sum(state_cycles) - state_cycles[GTX_INIT_STATES.index("READY")],
+            total)
+        self.assertEqual(cleared, 0)
+
+
+class TestBruteforceClockAligner(unittest.TestCase):
+    def test_stats(self):
+        comma = 0b0101111100
+        dut = BruteforceClockAligner(comma, 1e6, check_period=20e-6)
+        results = []
+
+        def rx():
+            for _ in range(70):
+                yield
+            yield dut.rxdata.eq(comma)
+            for _ in range(100):
+                yield
+            results.append((yield dut.restarts))
+            results.append((yield dut.lock_time))
+
+        run_simulation(dut, rx(), clocks={"sys": 10, "rx": 10})
+        restarts, lock_time = results
+        self.assertGreaterEqual(restarts, 3)
+        self.assertGreater(lock_time, 70)
+        self.assertLess(lock_time, 170)
+
+    def test_adaptive(self):
+        comma = 0b0101111100
+        dut = BruteforceClockAligner(comma, 1e6, check_period=100e-6,
+                                     adaptive=True)
+        restarts = []
+        results = []
+
+        def transceiver():
+            # misaligned by 3 bits, then aligned, after the restart
+            for rxdata in comma << 3, comma:
+                yield dut.ready.eq(1)
+                for i in range(60):
+                    yield dut.rxdata.eq(rxdata if i % 4 == 0 else 0)
+                    yield
+                    if (yield dut.restart):
+                        restarts.append(i)
+                        yield dut.ready.eq(0)
+                        for _ in range(10):
+                            yield
+                        break
+            results.append((yield dut.restarts))
+            results.append((yield dut.lock_time))
+            # no comma
+            yield dut.rxdata.eq(0)
+            for i in range(200):
+                yield
+                if (yield dut.restart):
+                    restarts.append(i)
+                    break
+
+        run_simulation(dut, transceiver(), clocks={"sys": 10, "rx": 10})
+        self.assertEqual(len(restarts), 2)
+        # four commas and the synchronization
+        self.assertLess(restarts[0], 4*4 + 8)
+        self.assertEqual(results[0], 1)
+        self.assertGreater(results[1], restarts[0] + 10)
+        self.assertLess(results[1], restarts[0] + 10 + 4*4 + 8)
+        self.assertGreater(restarts[1], 90)
+
+
+class TestCommaAligner(unittest.TestCase):
+    def test_align(self):
+        comma = 0b0101111100
+        for offset in 0, 7, 10, 19:
+            with self.subTest(offset=offset):
+                # comma and a counter in 10-bit symbols, first bit first
+                symbols = []
+                for i in range(40):
+                    symbols += [comma if i % 3 == 0 else 0x155, 0x200 + i]
+                stream = 0
+                for i, symbol in enumerate(symbols):
+                    stream |= symbol << 10*i
+                stream <<= offset
+                words = [(stream >> 20*i) & 0xfffff
+                         for i in range(len(symbols)//2)]
+
+                dut = CommaAligner(comma)
+                outputs = []
+
+                def receiver():
+                    for word in words:
+                        yield dut.rxdata.eq(word)
+                        yield
+                        outputs.append(((yield dut.locked), (yield dut.offset),
+                                        (yield dut.o)))
+
+                run_simulation(dut, receiver())
+                self.assertTrue(outputs[-1][0])
+                self.assertEqual(outputs[-1][1], offset)
+                # past the first comma
+                aligned = [o for locked, _, o in outputs[5:]]
+                expected = [symbols[2*i] | (symbols[2*i + 1] << 10)
+                            for i in range(len(symbols)//2)]
+                start = expected.index(aligned[0])
+                self.assertEqual(aligned, expected[start:start + len(aligned)])
+
+    def test_realign(self):
+        comma = 0b0101111100
+        dut = CommaAligner(comma)
+        offsets = []
+
+        def receiver():
+            for offset in 3, 11:
+                for i in range(12):
+                    yield dut.rxdata.eq(comma << offset if i % 2 else 0)
+                    yield
+                offsets.append(((yield dut.locked), (yield dut.offset)))
+
+        run_simulation(dut, receiver())
+        self.assertEqual(offsets, [(1, 3), (1, 11)])
@@ -0,0 +1,66 @@
+import unittest
+
+from gtx_config import gtx_config
+from si5324_kc705 import get_dividers
+
+
+class TestGTXConfig(unittest.TestCase):
+    def test_legacy(self):
+        config = gtx_config(1.25e9)
+        self.assertEqual(config.pll, "cpll")
+        self.assertEqual((config.n1, config.n2, config.m, config.out_div),
+                         (5, 4, 1, 4))
+        self.assertEqual(config.vco_freq, 2.5e9)
+        self.assertEqual(config.word_clk_freq, 62.5e6)
+        self.assertEqual(config.nwords, 2)
+        self.assertEqual(config.int_data_width, 20)
+        self.assertEqual(config.outclksel, 0b100)
+        self.assertEqual(config.clk25_div, 5)
+        self.assertEqual(config.rxcdr_cfg, 0x03000023ff10100020)
+
+    def test_cpll(self):
+        for line_rate, data_width, out_div in [(2.5e9, 20, 2),
+                                               (5e9, 40, 1),
+                                               (3.125e9, 20, 2)]:
+            with self.subTest(line_rate=line_rate):
+                config = gtx_config(line_rate, data_width=data_width)
+                self.assertEqual(config.pll, "cpll")
+                self.assertEqual(config.out_div, out_div)
+                self.assertAlmostEqual(2*config.vco_freq/config.out_div,
+                                       line_rate)
+                self.assertEqual(config.word_clk_freq, line_rate/data_width)
+
+    def test_qpll(self):
+        config = gtx_config(10e9, data_width=40)
+        self.assertEqual(config.pll, "qpll")
+        self.assertEqual((config.n1, config.m, config.out_div), (80, 1, 1))
+        self.assertEqual(config.qpll_fbdiv, 0b0100100000)
+        self.assertEqual(config.qpll_fbdiv_ratio, 1)
+        self.assertEqual(config.word_clk_freq, 250e6)
+        self.assertEqual(config.nwords, 4)
+        self.assertEqual(config.outclksel, 0b010)
+
+    def test_invalid(self):
+        for line_rate, data_width in [(1.25e9, 16),
+                                      (10e9, 20),
+                                      (6.6e9, 20),
+                                      (1.234e9, 20)]:
+            with self.subTest(line_rate=line_rate, data_width=data_width):
+                with self.assertRaises(ValueError):
+                    gtx_config(line_rate, data_width=data_width)
+
+
+class TestSi5324Dividers(unittest.TestCase):
+    def test_legacy(self):
+        self.assertEqual(get_dividers(62.5e6), (4, 20, 5, 512, 32))
+
+    def test_frequencies(self):
+        for clk_freq in [125e6, 156.25e6, 250e6]:
+            with self.subTest(clk_freq=clk_freq):
+                n1_hs, nc1_ls, n2_hs, n2_ls, n31 = get_dividers(clk_freq)
+                self.assertAlmostEqual(clk_freq/n31*n2_hs*n2_ls, 5e9)
+                self.assertAlmostEqual(n1_hs*nc1_ls*clk_freq, 5e9)
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            get_dividers(100e6)
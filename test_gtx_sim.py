@@ -0,0 +1,59 @@
+import unittest
+
+from migen import *
+
+from gtx_sim import Loopback, special_overrides, sim_clocks, time_to_ready
+
+
+class TestGTXSim(unittest.TestCase):
+    # Checks the received words once the comma aligner is locked, and
+    # returns the value of probe(dut) then
+    def run_loopback(self, comma_aligner, slips, probe, words=48):
+        dut = Loopback(comma_aligner=comma_aligner)
+        received = []
+        probed = []
+
+        def receiver():
+            while not (yield dut.locked):
+                yield
+            for _ in range(8):
+                yield
+            for _ in range(words):
+                received.append(((yield dut.gtx.decoders[0].k),
+                                 (yield dut.gtx.decoders[0].d),
+                                 (yield dut.gtx.decoders[1].d)))
+                yield
+            probed.append((yield probe(dut)))
+
+        run_simulation(dut, {"rx": receiver()}, clocks=sim_clocks(),
+                       special_overrides=special_overrides(slips))
+        self.assertEqual(len(received), words)
+        commas = [i for i, (k, d0, d1) in enumerate(received) if k]
+        self.assertEqual(commas, list(range(commas[0], words, 16)))
+        for i, (k, d0, d1) in enumerate(received):
+            count = (i - commas[0]) % 16
+            if k:
+                self.assertEqual(d0, 0xbc)
+            else:
+                self.assertEqual(d0, count)
+            self.assertEqual(d1, count + 1)
+        return probed[0]
+
+    def test_bruteforce(self):
+        restarts = self.run_loopback("bruteforce", [7, 13, 0],
+                                     lambda dut: dut.gtx.clock_aligner.restarts)
+        self.assertEqual(restarts, 2)
+
+    def test_fabric(self):
+        offset = self.run_loopback("fabric", [7],
+                                   lambda dut: dut.gtx.comma_aligner.offset)
+        self.assertEqual(offset, 7)
+
+    def test_time_to_ready(self):
+        times = time_to_ready("bruteforce", slips=[5, 0])
+        # the receiver waits 1024 cycles for the CDR to be stable
+        self.assertLess(times["tx_ready"], times["rx_ready"])
+        self.assertGreater(times["rx_ready"], 1024)
+        # two receiver initializations
+        self.assertGreater(times["locked"], 2*times["rx_ready"] - 500)
+        self.assertLess(times["locked"], 3*times["rx_ready"])
@@ -0,0 +1,91 @@
+import unittest
+from unittest import mock
+
+from comm_uart import CommUART
+from gtx_registers import *
+from gtx_tuner import (GTXTuner, drp_read, drp_write, restart,
+                       read_stats, clear_stats, format_stats)
+from virtual_board import VirtualBoard, VirtualBoardPort
+
+
+def error_model(settings):
+    return (1000*abs(settings["txdiffctrl"] - 11)
+            + 500*settings["rxlpmen"] + 200*settings["txpostcursor"])
+
+
+class TestGTXTuner(unittest.TestCase):
+    def setUp(self):
+        self.clock = mock.Mock(return_value=0.0)
+        self.board = VirtualBoard(seed=1, clock=self.clock,
+                                  error_model=error_model)
+        self.comm = CommUART(VirtualBoardPort(self.board))
+        # the same board stands in for the transmitter
+        self.tuner = GTXTuner(self.comm, self.comm)
+
+    def tearDown(self):
+        self.comm.close()
+
+    def sleep(self, delay):
+        self.clock.return_value += delay
+
+    def test_settings(self):
+        self.assertEqual(self.tuner.get("txdiffctrl"), 0b1000)
+        self.tuner.set("rxdfelfhold", 1)
+        self.tuner.set("rxlpmen", 1)
+        self.tuner.set("rxlpmen", 0)
+        self.tuner.set("txpostcursor", 17)
+        self.assertEqual(self.board.gtx_control.settings(), {
+            "txdiffctrl": 0b1000, "txprecursor": 0, "txpostcursor": 17,
+            "rxlpmen": 0, "rxlpmhfhold": 0, "rxlpmlfhold": 0,
+            "rxdfeagchold": 0, "rxdfelfhold": 1
+        })
+        with self.assertRaises(ValueError):
+            self.tuner.set("txdiffctrl", 16)
+        with self.assertRaises(ValueError):
+            GTXTuner(self.comm).set("txdiffctrl", 1)
+
+    def test_sweep(self):
+        results = self.tuner.sweep({"txdiffctrl": range(6, 16),
+                                    "rxlpmen": [0, 1]},
+                                   dwell=1.0, sleep=self.sleep)
+        self.assertEqual(len(results), 20)
+        self.assertEqual(results[0].settings, {"txdiffctrl": 11, "rxlpmen": 0})
+        self.assertEqual(results[0].errors, 0)
+        self.assertGreater(results[0].words, 0)
+        self.assertGreater(results[1].errors, 0)
+        self.assertEqual(self.tuner.get("txdiffctrl"), 11)
+        self.assertEqual(self.tuner.get("rxlpmen"), 0)
+
+    def test_drp(self):
+        drp_write(self.comm, 0x0a8, 0x0020)
+        drp_write(self.comm, 0x1ff, 0x12345)
+        self.assertEqual(drp_read(self.comm, 0x0a8), 0x0020)
+        self.assertEqual(drp_read(self.comm, 0x1ff), 0x2345)
+        restart(self.comm, rx=True)
+        self.assertEqual(self.board.gtx_control.rx_restarts, 1)
+        self.assertEqual(self.board.gtx_control.tx_restarts, 0)
+
+    def test_stats(self):
+        stats = self.board.gtx_control.stats
+        for i in range(len(GTX_INIT_STATES) + 1):
+            stats[GTX_RX_INIT_STATS_ADDR + i] = 156*(i + 1)
+        stats[GTX_ALIGNER_RESTARTS_ADDR] = 3
+        stats[GTX_ALIGNER_LOCK_TIME_ADDR] = 1560000
+        result = read_stats(self.comm)
+        self.assertEqual(set(result.tx_init.values()), {0})
+        self.assertEqual(result.rx_init["INITIAL"], 156)
+        self.assertEqual(result.rx_init["READY"], 156*len(GTX_INIT_STATES))
+        self.assertEqual(result.rx_init["total"], 156*(len(GTX_INIT_STATES) + 1))
+        self.assertEqual(result.aligner_restarts, 3)
+        lines = format_stats(result, 156e6)
+        self.assertEqual(lines[0], "RX initialization: 0.010ms not ready")
+        self.assertEqual(len(lines), len(GTX_INIT_STATES) + 2)
+        self.assertEqual(lines[-1], "RX clock aligner: 3 restarts, "
+                                    "last lock at 10.000ms")
+        stats[GTX_ALIGNER_OFFSET_ADDR] = GTX_ALIGNER_LOCKED | 13
+        result = read_stats(self.comm)
+        self.assertEqual(result.aligner_offset, 13)
+        self.assertEqual(format_stats(result)[-1],
+                         "RX comma aligner: locked at offset 13")
+        clear_stats(self.comm)
+        self.assertEqual(format_stats(read_stats(self.comm)), [])
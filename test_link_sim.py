@@ -0,0 +1,123 @@
+import random
+import unittest
+
+from migen import *
+
+from prbs import PRBSGenerator, PRBSChecker
+from line_coding import Encoder, Decoder
+import link_sim
+
+
+class TestModels(unittest.TestCase):
+    def test_encoder(self):
+        prng = random.Random(1)
+        inputs = []
+        for i in range(500):
+            if i % 7 == 0:
+                inputs.append(([0xbc, prng.randrange(256)], [True, False]))
+            else:
+                inputs.append(([prng.randrange(256), prng.randrange(256)],
+                               [False, False]))
+        dut = Encoder(2, True)
+        output = []
+
+        def pump():
+            for d, k in inputs:
+                for i in range(2):
+                    yield dut.d[i].eq(d[i])
+                    yield dut.k[i].eq(k[i])
+                yield
+                output.append(((yield dut.output[0]), (yield dut.output[1])))
+
+        run_simulation(dut, pump())
+        encoder = link_sim.SoftEncoder()
+        expected = []
+        for d, k in inputs:
+            bits = encoder.encode(d, k)
+            expected.append((int(bits[:10][::-1], 2), int(bits[10:][::-1], 2)))
+        # two cycles of latency
+        self.assertEqual(output[2:], expected[:-2])
+
+    def test_decoder(self):
+        dut = Decoder(True)
+        output = []
+
+        def pump():
+            for symbol in range(1024):
+                yield dut.input.eq(symbol)
+                yield
+                output.append(((yield dut.d), (yield dut.k)))
+
+        run_simulation(dut, pump())
+        expected = [link_sim.decode(format(symbol, "010b")[::-1])
+                    for symbol in range(1024)]
+        self.assertEqual(output[1:], [(d, int(k)) for d, k in expected[:-1]])
+
+    def test_prbs(self):
+        for width in 16, 32:
+            with self.subTest(width=width):
+                generator = PRBSGenerator(width)
+                checker = PRBSChecker(width)
+                flips = Signal(width)
+                dut = Module()
+                dut.submodules += generator, checker
+                dut.comb += checker.i.eq(generator.o ^ flips)
+                output = []
+                errors = []
+
+                def pump():
+                    for i in range(200):
+                        output.append((yield generator.o))
+                        yield flips.eq(0x101 if i % 50 == 49 else 0)
+                        yield
+                        errors.append((yield checker.errors))
+
+                run_simulation(dut, pump())
+                soft_generator = link_sim.SoftPRBSGenerator(width)
+                self.assertEqual(output, [soft_generator.next()
+                                          for _ in range(200)])
+                # the flips are applied from the next cycle
+                soft_checker = link_sim.SoftPRBSChecker(width)
+                soft_errors = [
+                    soft_checker.check(o ^ (0x101 if i % 50 == 0 and i else 0))
+                    for i, o in enumerate(output)]
+                self.assertEqual(errors[:-1], soft_errors[:-1])
+                self.assertGreater(sum(map(bool, errors)), 4)
+
+
+class TestLinkSim(unittest.TestCase):
+    def test_no_errors(self):
+        for nwords in 2, 4:
+            with self.subTest(nwords=nwords):
+                result = link_sim.simulate(
+                    50000, link_sim.Channel(latency=13), nwords)
+                self.assertEqual(result.error_words, 0)
+                self.assertEqual(result.relocks, 1)
+                self.assertGreater(result.checked_words, 0.9*50000)
+
+    def test_errors(self):
+        result = link_sim.simulate(100000, link_sim.Channel(ber=1e-5, seed=1))
+        self.assertGreater(result.bit_errors, 5)
+        # each error is detected, in one or more words
+        self.assertGreaterEqual(result.error_words, result.bit_errors)
+        self.assertLess(result.error_words, 4*result.bit_errors)
+
+    def test_slips(self):
+        result = link_sim.simulate(100000, link_sim.Channel(slip_rate=2e-6,
+                                                            seed=2))
+        self.assertGreater(result.slips, 0)
+        self.assertEqual(result.relocks, result.slips + 1)
+        self.assertGreater(result.error_words, 0)
+
+    def test_gateware(self):
+        errors = [20*300 + 3, 20*301 + 17, 20*550 + 8, 20*551 + 9]
+        results = [run(800, link_sim.Channel(latency=7, errors=errors))
+                   for run in (link_sim.simulate, link_sim.simulate_gateware)]
+        self.assertEqual(results[0].bit_errors, 4)
+        self.assertGreater(results[0].error_words, 0)
+        for field in "bit_errors", "error_words", "error_bits", "relocks":
+            self.assertEqual(getattr(results[0], field),
+                             getattr(results[1], field))
+        # the gateware pipeline checks a few more words
+        self.assertAlmostEqual(results[0].checked_words,
+                               results[1].checked_words, delta=4)
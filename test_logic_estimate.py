@@ -0,0 +1,98 @@
+import unittest
+from functools import reduce
+
+from migen import *
+
+from logic_estimate import estimate, CARRY_DELAY
+from line_coding import Encoder, Decoder
+from prbs import PRBSGenerator
+
+
+class _Reduce(Module):
+    def __init__(self, n, op):
+        self.i = Signal(n)
+        self.o = Signal()
+        i = Signal(n)
+        self.sync += [
+            i.eq(self.i),
+            self.o.eq(op(i))
+        ]
+
+
+class TestLogicEstimate(unittest.TestCase):
+    def test_and(self):
+        result = estimate(_Reduce(2, lambda i: i[0] & i[1]))
+        self.assertEqual((result.luts, result.ffs, result.depth), (1, 3, 1))
+        self.assertEqual(result.paths[0].end, "o")
+
+    def test_xor_tree(self):
+        def parity(i):
+            return reduce(lambda a, b: a ^ b, [i[j] for j in range(len(i))])
+        for n, luts, depth in (6, 1, 1), (36, 7, 2), (37, 8, 3):
+            with self.subTest(n=n):
+                result = estimate(_Reduce(n, parity))
+                self.assertEqual((result.luts, result.depth), (luts, depth))
+
+    def test_xor_cancellation(self):
+        result = estimate(_Reduce(8, lambda i: (i[0] ^ i[1]) ^ (i[1] ^ i[2])))
+        self.assertEqual((result.luts, result.depth), (1, 1))
+        result = estimate(_Reduce(8, lambda i: (i[0] ^ i[1]) ^ (i[1] ^ i[0])))
+        self.assertEqual((result.luts, result.depth), (0, 0))
+
+    def test_table(self):
+        table = Array(range(64))
+        result = estimate(_Reduce(6, lambda i: table[i] == 42))
+        self.assertEqual(result.depth, 1)
+
+    def test_case(self):
+        class Shifter(Module):
+            def __init__(self):
+                self.i = Signal(32)
+                self.offset = Signal(4)
+                self.o = Signal(16)
+                self.sync += Case(self.offset, {j: self.o.eq(self.i[j:j+16])
+                                                for j in range(16)})
+        # 16:1 multiplexers, each of two levels of 4:1
+        result = estimate(Shifter())
+        self.assertEqual(result.depth, 2)
+        self.assertEqual(result.ffs, 16)
+
+    def test_counter(self):
+        class Counter(Module):
+            def __init__(self):
+                self.count = Signal(32)
+                self.sync += self.count.eq(self.count + 1)
+        result = estimate(Counter())
+        self.assertEqual(result.ffs, 32)
+        # one LUT, XORCY and MUXCY per bit after the first one
+        self.assertEqual(result.luts, 31)
+        self.assertEqual(result.carry, 2*31 - 1)
+        self.assertAlmostEqual(result.depth, 1 + 31*CARRY_DELAY)
+
+    def test_comparison(self):
+        class Compare(Module):
+            def __init__(self):
+                self.a = Signal(8)
+                self.b = Signal((8, True))
+                self.o = Signal()
+                self.sync += self.o.eq(self.a < self.b)
+        result = estimate(Compare())
+        self.assertGreater(result.carry, 0)
+        self.assertIn(result.paths[0].start[0], "ab")
+
+    def test_loop(self):
+        module = Module()
+        a = Signal()
+        b = Signal()
+        o = Signal()
+        module.comb += [a.eq(~b), b.eq(a)]
+        module.sync += o.eq(a)
+        with self.assertRaises(ValueError):
+            estimate(module)
+
+    def test_designs(self):
+        self.assertEqual(estimate(PRBSGenerator(16)).ffs, 23 + 16)
+        self.assertLessEqual(estimate(Decoder(True)).depth, 2)
+        # the disparity goes through all the symbols
+        depths = [estimate(Encoder(nwords, True)).depth for nwords in (1, 4)]
+        self.assertGreater(depths[1], depths[0])
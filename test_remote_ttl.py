@@ -0,0 +1,518 @@
+import random
+import unittest
+
+from migen import *
+
+from remote_ttl import *
+
+
+# Transmitter and receiver connected by a link of latency cycles. flip and
+# flip_k are XORed with the data and the K flag of the last lane.
+class Link(Module):
+    def __init__(self, tx, rx, latency=5):
+        self.submodules.tx = tx
+        self.submodules.rx = rx
+        self.flip = Signal(8)
+        self.flip_k = Signal()
+
+        # # #
+
+        k, d = tx.k, tx.d
+        for _ in range(latency):
+            k_r = [Signal() for _ in k]
+            d_r = [Signal(8) for _ in d]
+            self.sync += [a.eq(b) for a, b in zip(k_r + d_r, k + d)]
+            k, d = k_r, d_r
+        k = k[:-1] + [k[-1] ^ self.flip_k]
+        d = d[:-1] + [d[-1] ^ self.flip]
+        self.comb += [a.eq(b) for a, b in zip(rx.k + rx.d, k + d)]
+
+
+# Returns the cycles at which the signal changed, with the new values.
+def edges(trace):
+    return [(cycle, value) for cycle, value in enumerate(trace)
+            if cycle and value != trace[cycle-1]]
+
+
+class TestState(unittest.TestCase):
+    def check(self, layout):
+        dut = Link(StateTX(layout), StateRX(layout))
+        prng = random.Random(1)
+        expected = [prng.getrandbits(layout.nchannels) for _ in range(4)]
+        received = []
+
+        def generator():
+            for values in expected:
+                yield dut.tx.values.eq(values)
+                for _ in range(2*layout.frame_words + 10):
+                    yield
+                received.append((yield dut.rx.values))
+
+        run_simulation(dut, generator())
+        self.assertEqual(received, expected)
+
+    def test_values(self):
+        self.check(FrameLayout())
+
+    def test_layouts(self):
+        for nchannels, lanes in (1, 1), (32, 4), (128, 2), (130, 2), (256, 4):
+            with self.subTest(nchannels=nchannels, lanes=lanes):
+                self.check(FrameLayout(nchannels, lanes))
+
+    def test_crc(self):
+        for lanes in 1, 2, 4:
+            with self.subTest(lanes=lanes):
+                self.check(FrameLayout(48, lanes, crc=True))
+
+    def test_rejected(self):
+        for lanes in 1, 2:
+            layout = FrameLayout(48, lanes, crc=True)
+            dut = Link(StateTX(layout), StateRX(layout))
+            values = []
+
+            def generator():
+                yield dut.tx.values.eq(0x123456789abc)
+                for _ in range(4*layout.frame_words):
+                    yield
+                yield dut.tx.values.eq(0xcba987654321)
+                for _ in range(2):
+                    yield
+                # one bit error in every frame
+                for _ in range(20):
+                    for cycle in range(layout.frame_words):
+                        yield dut.flip.eq(0x10 if cycle == 2 else 0)
+                        yield
+                        values.append((yield dut.rx.values))
+                yield dut.flip.eq(0)
+                rejected = yield dut.rx.rejected
+                for _ in range(2*layout.frame_words + 10):
+                    yield
+                values.append((yield dut.rx.values))
+                self.assertEqual((yield dut.rx.rejected), rejected)
+                self.assertGreaterEqual(rejected, 19)
+
+            with self.subTest(lanes=lanes):
+                run_simulation(dut, generator())
+                self.assertEqual(set(values[:-1]), {0x123456789abc})
+                self.assertEqual(values[-1], 0xcba987654321)
+
+    def test_incomplete(self):
+        layout = FrameLayout(32, 2)
+        dut = Link(StateTX(layout), StateRX(layout))
+
+        def generator():
+            yield dut.tx.values.eq(0xffffffff)
+            for _ in range(20):
+                yield
+            # a K character in a data word, in two consecutive words out of
+            # the three of a frame
+            yield dut.flip_k.eq(1)
+            yield
+            yield
+            yield dut.flip_k.eq(0)
+            for _ in range(20):
+                yield
+            self.assertEqual((yield dut.rx.values), 0xffffffff)
+            self.assertEqual((yield dut.rx.rejected), 1)
+
+        run_simulation(dut, generator())
+
+    def test_refresh_latency(self):
+        self.assertAlmostEqual(FrameLayout().refresh_latency(62.5e6), 48e-9)
+        layout = FrameLayout(128, 2)
+        self.assertEqual(layout.frame_words, 9)
+        self.assertEqual(FrameLayout(130, 2).frame_words, 10)
+        self.assertEqual(FrameLayout(128, 4).frame_words, 5)
+        self.assertEqual(FrameLayout(128, 4, crc=True).frame_words, 6)
+        with self.assertRaises(ValueError):
+            FrameLayout(0)
+        with self.assertRaises(ValueError):
+            FrameLayout(lanes=0)
+
+
+# Returns the average number of cycles from a change of the transmitter
+# values to the receiver values, for changes of one random channel every
+# spacing cycles.
+def average_latency(dut, nchannels, changes=30, spacing=20, seed=1):
+    prng = random.Random(seed)
+    latencies = []
+
+    def generator():
+        value = 0
+        for _ in range(100):
+            yield
+        for _ in range(changes):
+            value ^= 1 << prng.randrange(nchannels)
+            yield dut.tx.values.eq(value)
+            for cycle in range(spacing):
+                yield
+                if (yield dut.rx.values) == value:
+                    latencies.append(cycle)
+                    break
+            else:
+                raise AssertionError("change not received")
+
+    run_simulation(dut, generator())
+    return sum(latencies)/len(latencies)
+
+
+class TestDelta(unittest.TestCase):
+    def check(self, nchannels, nwords):
+        dut = Link(DeltaTX(nchannels, nwords), DeltaRX(nchannels, nwords))
+        prng = random.Random(1)
+        received = []
+        expected = []
+
+        def generator():
+            for _ in range(20):
+                values = prng.getrandbits(nchannels)
+                yield dut.tx.values.eq(values)
+                # all bytes changed: up to 16 words plus the commas
+                for _ in range(30):
+                    yield
+                received.append((yield dut.rx.values))
+                expected.append(values)
+
+        run_simulation(dut, generator())
+        self.assertEqual(received, expected)
+
+    def test_values(self):
+        self.check(128, 2)
+
+    def test_lanes(self):
+        for nchannels in 8, 128, 136:
+            with self.subTest(nchannels=nchannels):
+                self.check(nchannels, 4)
+
+    def test_refresh(self):
+        dut = Link(DeltaTX(64, interval=8), DeltaRX(64))
+        received = []
+
+        def generator():
+            yield dut.tx.values.eq(0x0123456789abcdef)
+            for _ in range(50):
+                yield
+            # corrupt the receiver state, the bytes are not sent again
+            # until they are refreshed
+            yield dut.rx.values.eq(0)
+            for _ in range(8*8 + 8):
+                yield
+            received.append((yield dut.rx.values))
+
+        run_simulation(dut, generator())
+        self.assertEqual(received, [0x0123456789abcdef])
+
+    def test_latency(self):
+        state = average_latency(Link(StateTX(), StateRX()), 32)
+        delta = average_latency(Link(DeltaTX(), DeltaRX()), 32)
+        self.assertLess(delta, state)
+
+    def test_parameters(self):
+        with self.assertRaises(ValueError):
+            DeltaTX(4096)
+        with self.assertRaises(ValueError):
+            DeltaTX(interval=1)
+        for nwords in 1, 3:
+            with self.assertRaises(ValueError):
+                DeltaTX(nwords=nwords)
+            with self.assertRaises(ValueError):
+                DeltaRX(nwords=nwords)
+
+
+class TestEvents(unittest.TestCase):
+    def check(self, nwords, changes, cycles=400, nchannels=16, fifo_depth=8):
+        dut = Link(EventTX(nchannels, nwords, delay=128),
+                   EventRX(nchannels, nwords, fifo_depth))
+        sent = []
+        received = []
+
+        def generator():
+            value = 0
+            for cycle in range(cycles):
+                new = value ^ changes.get(cycle, 0)
+                yield dut.tx.stb.eq(new ^ value)
+                yield dut.tx.value.eq(new)
+                value = new
+                sent.append(value)
+                yield
+                received.append((yield dut.rx.values))
+            self.assertEqual((yield dut.tx.busy), 0)
+            self.assertEqual((yield dut.rx.late), 0)
+            self.assertEqual((yield dut.rx.overflow), 0)
+
+        run_simulation(dut, generator())
+        sent = edges(sent)
+        received = edges(received)
+        self.assertEqual(len(received), len(sent))
+        offset = received[0][0] - sent[0][0]
+        self.assertEqual([(cycle + offset, value) for cycle, value in sent],
+                         received)
+
+    def test_pulses(self):
+        for nwords in 1, 2, 4:
+            with self.subTest(nwords=nwords):
+                # 1-cycle pulses, on one channel and on several at once: 16
+                # events, that take up to 64 cycles to send with nwords=1
+                self.check(nwords, {
+                    100: 1, 101: 1,
+                    150: 0x8001, 151: 0x8001,
+                    200: 0xf0, 201: 0x0f, 202: 0xff
+                })
+
+    def test_random(self):
+        prng = random.Random(1)
+        changes = dict()
+        for cycle in range(100, 900, 30):
+            changes[cycle] = 1 << prng.randrange(8)
+            changes[cycle + prng.randrange(1, 4)] = changes[cycle]
+        self.check(2, changes, cycles=1200, nchannels=8, fifo_depth=16)
+
+    def test_overflow(self):
+        dut = Link(EventTX(4, 2, delay=8, fifo_depth=2),
+                   EventRX(4, 2, fifo_depth=8))
+        busy = []
+
+        def generator():
+            # toggles faster than the link can send the events
+            for cycle in range(20):
+                yield dut.tx.stb.eq(1)
+                yield dut.tx.value.eq(cycle % 2)
+                yield
+                busy.append((yield dut.tx.busy) & 1)
+            yield dut.tx.stb.eq(0)
+            for _ in range(100):
+                yield
+            self.assertEqual((yield dut.rx.overflow), 0)
+
+        run_simulation(dut, generator())
+        self.assertIn(1, busy)
+
+    def test_parameters(self):
+        with self.assertRaises(ValueError):
+            EventTX(nwords=3)
+        with self.assertRaises(ValueError):
+            EventRX(nwords=8)
+        with self.assertRaises(ValueError):
+            EventTX(nchannels=300)
+        with self.assertRaises(ValueError):
+            EventTX(delay=2**TIMESTAMP_WIDTH)
+
+
+class TestLatency(unittest.TestCase):
+    def test_meter(self):
+        for latency in 0, 1, 5:
+            dut = LatencyMeter(10)
+            chain = [dut.o]
+            for _ in range(latency):
+                chain.append(Signal())
+                dut.sync += chain[-1].eq(chain[-2])
+            dut.comb += dut.loopback.eq(chain[-1])
+            results = []
+
+            def generator():
+                for _ in range(3):
+                    yield dut.start.eq(1)
+                    yield
+                    yield dut.start.eq(0)
+                    while not (yield dut.valid):
+                        yield
+                    results.append(((yield dut.latency), (yield dut.timeout)))
+
+            with self.subTest(latency=latency):
+                run_simulation(dut, generator())
+                self.assertEqual(results, [(latency, 0)]*3)
+
+    def test_timeout(self):
+        dut = LatencyMeter(10)
+
+        def generator():
+            yield dut.start.eq(1)
+            yield
+            yield dut.start.eq(0)
+            for cycle in range(20):
+                yield
+                if (yield dut.valid):
+                    break
+            self.assertEqual((yield dut.timeout), 1)
+            self.assertEqual((yield dut.override), 0)
+            self.assertGreaterEqual(cycle, 10)
+
+        run_simulation(dut, generator())
+
+    def test_delay_line(self):
+        prng = random.Random(1)
+        inputs = [prng.randrange(2) for _ in range(100)]
+        for delay in 0, 1, 7, 15:
+            dut = DelayLine(16)
+            outputs = []
+
+            def generator():
+                yield dut.delay.eq(delay)
+                for i in inputs:
+                    yield dut.i.eq(i)
+                    yield
+                    outputs.append((yield dut.o))
+
+            with self.subTest(delay=delay):
+                run_simulation(dut, generator())
+                self.assertEqual(outputs[delay:], inputs[:len(inputs)-delay])
+
+    # A local output, through a delay line, and a remote output, over the
+    # events protocol, both driven by command.
+    class Alignment(Module):
+        def __init__(self):
+            self.command = Signal()
+            self.submodules.link = Link(EventTX(1, 2, delay=32),
+                                        EventRX(1, 2))
+            self.submodules.meter = LatencyMeter()
+            self.submodules.delay_line = DelayLine()
+            self.local = self.delay_line.o
+            self.remote = self.link.rx.values[0]
+
+            # # #
+
+            # as in RemoteTTLChannels, with the remote output looped back
+            value = Signal()
+            value_r = Signal()
+            self.sync += [
+                If(self.meter.override,
+                    value.eq(self.meter.o)
+                ).Else(
+                    value.eq(self.command)
+                ),
+                value_r.eq(value),
+                self.delay_line.i.eq(self.command),
+                If(self.meter.valid,
+                    self.delay_line.delay.eq(self.meter.latency - 1)
+                )
+            ]
+            self.comb += [
+                self.link.tx.stb.eq(value ^ value_r),
+                self.link.tx.value.eq(value),
+                self.meter.loopback.eq(self.remote)
+            ]
+
+    def test_alignment(self):
+        dut = self.Alignment()
+        local = []
+        remote = []
+
+        def generator():
+            for _ in range(50):
+                yield
+            # the measurement sets the remote output high, and the local one
+            # follows command
+            yield dut.meter.start.eq(1)
+            yield
+            yield dut.meter.start.eq(0)
+            yield dut.command.eq(1)
+            while not (yield dut.meter.valid):
+                yield
+            self.assertEqual((yield dut.meter.timeout), 0)
+            for cycle in range(300):
+                yield dut.command.eq((cycle // 20 + 1) % 2)
+                yield
+                local.append((yield dut.local))
+                remote.append((yield dut.remote))
+
+        run_simulation(dut, generator())
+        self.assertGreaterEqual(len(edges(local)), 10)
+        self.assertEqual(edges(local), edges(remote))
+
+
+# Remote inputs: the transmitter sends its time to the receiver over the
+# events protocol, and the receiver sends back the changes of its inputs.
+class Inputs(Module):
+    def __init__(self, ninputs=8, delay=128):
+        self.submodules.forward = Link(EventTX(1), EventRX(1))
+        self.submodules.ret = Link(
+            ClockDomainsRenamer({"tx": "sys"})(InputTX(ninputs, delay=delay)),
+            ClockDomainsRenamer({"rx": "sys"})(InputRX(ninputs)))
+        self.inputs = self.ret.tx.inputs
+        self.values = self.ret.rx.values
+
+        # # #
+
+        self.comb += [
+            self.ret.tx.time.eq(self.forward.rx.now),
+            self.ret.rx.now.eq(self.forward.tx.now)
+        ]
+
+
+class TestInputs(unittest.TestCase):
+    # Toggles each input every period cycles, at evenly spread phases, and
+    # returns whether the link kept up: if so, checks that all changes are
+    # received with the same latency.
+    def check_rate(self, period, ninputs=8, cycles=1000):
+        dut = Inputs(ninputs)
+        sent = []
+        received = []
+        busy = []
+        errors = []
+
+        def generator():
+            inputs = 0
+            for cycle in range(cycles):
+                for i in range(ninputs):
+                    if cycle > 100 and cycle < cycles - 300 \
+                            and (cycle + i*period//ninputs) % period == 0:
+                        inputs ^= 1 << i
+                yield dut.inputs.eq(inputs)
+                sent.append(inputs)
+                yield
+                received.append((yield dut.values))
+                busy.append((yield dut.ret.tx.busy))
+            errors.append((yield dut.ret.rx.late))
+            errors.append((yield dut.ret.rx.overflow))
+
+        run_simulation(dut, generator())
+        if any(busy) or any(errors):
+            return False
+        sent = edges(sent)
+        received = edges(received)
+        self.assertEqual(len(received), len(sent))
+        offset = received[0][0] - sent[0][0]
+        self.assertEqual([(cycle + offset, value) for cycle, value in sent],
+                         received)
+        return True
+
+    def test_edges(self):
+        dut = Inputs(4)
+        prng = random.Random(1)
+        changes = {cycle: 1 << prng.randrange(4)
+                   for cycle in range(100, 600, 7)}
+        sent = []
+        received = []
+
+        def generator():
+            inputs = 0
+            for cycle in range(900):
+                inputs ^= changes.get(cycle, 0)
+                yield dut.inputs.eq(inputs)
+                sent.append(inputs)
+                yield
+                received.append((yield dut.values))
+
+        run_simulation(dut, generator())
+        sent = edges(sent)
+        received = edges(received)
+        self.assertEqual(len(received), len(changes))
+        offset = received[0][0] - sent[0][0]
+        self.assertEqual([(cycle + offset, value) for cycle, value in sent],
+                         received)
+
+    def test_sustained_rate(self):
+        # with 2 words per message and a time message every 16, the return
+        # link carries up to 15/32 events per cycle: 8 inputs changing every
+        # 18 cycles (0.44 events per cycle) are all received, while every 10
+        # cycles (0.8 events per cycle) they are delayed and lost
+        self.assertTrue(self.check_rate(18))
+        self.assertFalse(self.check_rate(10))
+
+    def test_parameters(self):
+        with self.assertRaises(ValueError):
+            InputTX(delay=0)
+        with self.assertRaises(ValueError):
+            InputTX(nwords=3)
+        with self.assertRaises(ValueError):
+            InputRX(ninputs=300)
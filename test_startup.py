@@ -0,0 +1,41 @@
+import os
+import subprocess
+import sys
+import unittest
+
+
+# Runs demo_prbs.py in a fresh interpreter and returns the time spent until
+# its main function returned, and the names of the modules it loaded
+def run_demo_prbs(*args):
+    code = "\n".join([
+        "import sys, time",
+        "start = time.perf_counter()",
+        "sys.argv = ['demo_prbs.py'] + {!r}".format(list(args)),
+        "import demo_prbs",
+        "demo_prbs.main()",
+        "print(time.perf_counter() - start)",
+        "print(' '.join(sys.modules))"
+    ])
+    output = subprocess.check_output([sys.executable, "-c", code],
+                                     cwd=os.path.dirname(os.path.abspath(__file__)))
+    lines = output.decode().splitlines()
+    return float(lines[-2]), set(lines[-1].split())
+
+
+class TestStartup(unittest.TestCase):
+    def check_host_command(self, *args):
+        elapsed, modules = run_demo_prbs(*args)
+        for module in "migen", "misoc", "gtx", "i2c", "asyncio":
+            self.assertNotIn(module, modules)
+        # generous bound, typically a few tens of ms
+        self.assertLess(elapsed, 1.0)
+
+    def test_readout(self):
+        self.check_host_command("--readout", "virtual://")
+
+    def test_set_pll_phase(self):
+        self.check_host_command("--set-pll-phase", "virtual://", "3")
+
+    def test_monitor(self):
+        self.check_host_command("--monitor", "virtual://",
+                                "--rate", "100", "--duration", "0.1")
@@ -0,0 +1,163 @@
+import unittest
+
+from migen import *
+from migen.sim import passive
+
+from wishbonebridge import WishboneStreamingBridge
+from comm_uart import crc16
+
+
+class _MockEndpoint:
+    def __init__(self):
+        self.stb = Signal()
+        self.ack = Signal()
+        self.eop = Signal()
+        self.data = Signal(8)
+
+
+class _MockPHY:
+    def __init__(self):
+        self.source = _MockEndpoint()
+        self.sink = _MockEndpoint()
+
+
+def framed_request(seq, cmd, addr, length, data=b""):
+    body = bytes([seq, cmd, length]) + (addr//4).to_bytes(4, "big") + data
+    return bytes([0x5a]) + body + crc16(body).to_bytes(2, "big")
+
+
+def framed_reply(seq, data=b""):
+    body = bytes([seq]) + data
+    return bytes([0x5a]) + body + crc16(body).to_bytes(2, "big")
+
+
+def exchange(requests, framed, memory, write_log=None, gap=200, **kwargs):
+    phy = _MockPHY()
+    dut = WishboneStreamingBridge(phy, 1000000, framed=framed, **kwargs)
+    reply = []
+
+    def send():
+        for request in requests:
+            for octet in request:
+                yield phy.source.data.eq(octet)
+                yield phy.source.stb.eq(1)
+                yield
+                yield phy.source.stb.eq(0)
+                for _ in range(4):
+                    yield
+            for _ in range(gap):
+                yield
+        for _ in range(200):
+            yield
+
+    # replies go out slower than requests come in
+    @passive
+    def receive():
+        while True:
+            for _ in range(7):
+                yield
+            yield phy.sink.ack.eq(1)
+            yield
+            if (yield phy.sink.stb):
+                reply.append((yield phy.sink.data))
+            yield phy.sink.ack.eq(0)
+
+    @passive
+    def slave():
+        bus = dut.wishbone
+        while True:
+            yield bus.ack.eq(0)
+            yield
+            if (yield bus.cyc) and (yield bus.stb):
+                adr = yield bus.adr
+                if (yield bus.we):
+                    value = yield bus.dat_w
+                    memory[adr] = value
+                    if write_log is not None:
+                        write_log.append((adr, value))
+                else:
+                    yield bus.dat_r.eq(memory.get(adr, 0))
+                yield bus.ack.eq(1)
+                yield
+
+    run_simulation(dut, [send(), receive(), slave()])
+    return bytes(reply)
+
+
+class TestWishboneStreamingBridge(unittest.TestCase):
+    def test_raw(self):
+        memory = {}
+        request = (bytes([0x01, 2]) + (0x10).to_bytes(4, "big")
+                   + (0x12345678).to_bytes(4, "big")
+                   + (0x9abcdef0).to_bytes(4, "big"))
+        self.assertEqual(exchange([request], False, memory), b"")
+        self.assertEqual(memory, {0x10: 0x12345678, 0x11: 0x9abcdef0})
+
+        request = bytes([0x02, 2]) + (0x10).to_bytes(4, "big")
+        self.assertEqual(exchange([request], False, memory),
+                         bytes.fromhex("123456789abcdef0"))
+
+    def test_raw_long(self):
+        memory = {i: i*0x01010101 for i in range(12)}
+        request = bytes([0x02, 12]) + (0).to_bytes(4, "big")
+        self.assertEqual(exchange([request], False, memory),
+                         b"".join(memory[i].to_bytes(4, "big") for i in range(12)))
+
+    def test_framed_read(self):
+        memory = {0x10: 0xdeadbeef, 0x11: 0xcafebabe}
+        request = framed_request(7, 0x02, 0x40, 2)
+        self.assertEqual(exchange([request], True, memory),
+                         framed_reply(7, bytes.fromhex("deadbeefcafebabe")))
+
+    def test_framed_write(self):
+        memory = {}
+        payload = (0x12345678).to_bytes(4, "big") + (0x55aa55aa).to_bytes(4, "big")
+        request = framed_request(3, 0x01, 0x00, 2, payload)
+        self.assertEqual(exchange([request], True, memory), framed_reply(3))
+        self.assertEqual(memory, {0: 0x12345678, 1: 0x55aa55aa})
+
+    def test_framed_bad_crc(self):
+        memory = {}
+        request = bytearray(framed_request(3, 0x01, 0x00, 1, b"\x00\x00\x00\x01"))
+        request[-3] ^= 0x10
+        self.assertEqual(exchange([bytes(request)], True, memory), b"")
+        self.assertEqual(memory, {})
+
+    def test_framed_resync(self):
+        memory = {0: 0x01020304}
+        request = framed_request(9, 0x02, 0x00, 1)
+        # the garbage swallows the SYNC of the first request, the retry gets through
+        self.assertEqual(exchange([b"\x5a\x00" + request, request], True, memory),
+                         framed_reply(9, bytes.fromhex("01020304")))
+
+    def test_framed_retry(self):
+        memory = {}
+        write_log = []
+        request = framed_request(5, 0x01, 0x00, 1, b"\x00\x00\x00\x2a")
+        self.assertEqual(exchange([request, request], True, memory, write_log),
+                         framed_reply(5) + framed_reply(5))
+        self.assertEqual(write_log, [(0, 0x2a)])
+
+    def test_framed_seq_timeout(self):
+        # a new host session reusing the last SEQ after some idle time
+        memory = {}
+        write_log = []
+        requests = [framed_request(1, 0x02, 0x00, 1),
+                    framed_request(1, 0x01, 0x00, 1, b"\x00\x00\x00\x2a")]
+        exchange(requests, True, memory, write_log, gap=400, seq_timeout=200e-6)
+        self.assertEqual(write_log, [(0, 0x2a)])
+
+    def test_pipelined(self):
+        memory = {i: 0x11111111*i for i in range(4)}
+        requests = [bytes([0x02, 2]) + (0).to_bytes(4, "big"),
+                    bytes([0x01, 1, 0, 0, 0, 3, 0, 0, 0, 0x42]),
+                    bytes([0x02, 2]) + (2).to_bytes(4, "big")]
+        self.assertEqual(exchange(requests, False, memory, gap=0),
+                         bytes.fromhex("00000000111111112222222200000042"))
+
+    def test_framed_pipelined(self):
+        memory = {0: 0x01020304}
+        requests = [framed_request(i, 0x02, 0x00, 1) for i in range(4)]
+        self.assertEqual(exchange(requests, True, memory, gap=0),
+                         b"".join(framed_reply(i, bytes.fromhex("01020304"))
+                                  for i in range(4)))
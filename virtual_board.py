@@ -0,0 +1,522 @@
+#!/usr/bin/env python3.5
+
+# Software model of the PRBS receiver (prbs_kc705.PRBSRX) as seen by the host
+# through its UART bridge, for testing and benchmarking host tools without a
+# KC705. It implements the byte protocol of WishboneStreamingBridge (raw or
+# framed) in front of the same Wishbone address map:
+#   0x00        I2C master transfer register (see i2c.py)
+#   0x04        I2C master clock divider
+#   0x40        PRBS error counter
+#   0x44        PRBS checked word counter
+#   0x80-0xf4   transceiver settings and statistics (see gtx_control.py)
+#   0x800       transceiver DRP, 512 registers
+# with the same address aliasing as the hardware interconnect. The I2C bus
+# carries the PCA9548 switch of the KC705 (0x74) and, behind its channel 7,
+# a Si5324 register file (0x68). The PRBS error rate may depend on the
+# transceiver settings (error_model).
+#
+# The model is available as a pyserial-like port, which CommUART and
+# AsyncCommUART also accept as virtual://[?framed][&error_rate=R][&seed=S],
+# or on a pseudo-terminal when this file is run as a script.
+
+import argparse
+import logging
+import math
+import os
+import random
+import time
+import tty
+from urllib.parse import parse_qs
+
+from i2c_registers import I2C_ACK, I2C_READ, I2C_WRITE, I2C_START, I2C_STOP, I2C_IDLE
+from gtx_registers import *
+from comm_uart import crc16
+
+
+logger = logging.getLogger(__name__)
+
+
+class PCA9548:
+    def __init__(self):
+        self.control = 0
+
+    def write(self, octet):
+        self.control = octet
+        return True
+
+    def read(self):
+        return self.control
+
+
+class Si5324:
+    def __init__(self):
+        self.registers = bytearray(144)
+        # DEVICE_ID
+        self.registers[134] = 0x01
+        self.registers[135] = 0x82
+        self.pointer = None
+
+    def start(self):
+        self.pointer = None
+
+    # the first byte written after the address sets the register pointer
+    def write(self, octet):
+        if self.pointer is None:
+            self.pointer = octet
+        else:
+            if self.pointer < len(self.registers):
+                self.registers[self.pointer] = octet
+            self.pointer += 1
+        return True
+
+    def read(self):
+        pointer = self.pointer or 0
+        self.pointer = pointer + 1
+        if pointer < len(self.registers):
+            return self.registers[pointer]
+        return 0
+
+
+class I2CBusModel:
+    def __init__(self):
+        self.pca9548 = PCA9548()
+        self.si5324 = Si5324()
+        self.started = False
+        self.device = None
+        self.reading = False
+        self.address_phase = False
+
+    def _device(self, address):
+        if address == 0x74:
+            return self.pca9548
+        if address == 0x68 and self.pca9548.control & (1 << 7):
+            return self.si5324
+        return None
+
+    def start(self):
+        self.started = True
+        self.address_phase = True
+        self.device = None
+
+    def stop(self):
+        self.started = False
+        self.device = None
+
+    # returns True if a device acknowledged the byte
+    def write(self, octet):
+        if not self.started:
+            return False
+        if self.address_phase:
+            self.address_phase = False
+            self.device = self._device(octet >> 1)
+            self.reading = bool(octet & 1)
+            if hasattr(self.device, "start"):
+                self.device.start()
+            return self.device is not None
+        if self.device is None or self.reading:
+            return False
+        return self.device.write(octet)
+
+    def read(self):
+        if self.device is None or not self.reading:
+            return 0xff
+        return self.device.read()
+
+
+# Models the registers of i2c.I2CMaster. Transfers complete after
+# busy_polls reads of the transfer register.
+class I2CMasterModel:
+    def __init__(self, busy_polls=0):
+        self.bus = I2CBusModel()
+        self.busy_polls = busy_polls
+        self.busy = 0
+        self.data = 0
+        self.ack = 0
+        self.divider = 0
+
+    def write_xfer(self, value):
+        self.data = value & 0xff
+        self.ack = bool(value & I2C_ACK)
+        # same priority as I2CMasterMachine
+        if value & I2C_START:
+            self.bus.start()
+        elif value & I2C_STOP:
+            self.bus.stop()
+        elif value & I2C_WRITE:
+            self.ack = self.bus.write(self.data)
+        elif value & I2C_READ:
+            self.data = self.bus.read()
+        else:
+            return
+        self.busy = self.busy_polls
+
+    def read_xfer(self):
+        value = self.data | (I2C_ACK if self.ack else 0)
+        if self.busy:
+            self.busy -= 1
+        else:
+            value |= I2C_IDLE
+        return value
+
+
+# Counts PRBS errors, arriving at error_rate errors per second on average
+# plus those added with inject_errors, and checked words, arriving at
+# word_rate words per second (1.25Gbps, 16-bit words, one header word out
+# of 16).
+class PRBSCheckerModel:
+    def __init__(self, error_rate=0.0, word_rate=62.5e6*15/16, seed=None,
+                 clock=time.monotonic):
+        self.error_rate = error_rate
+        self.word_rate = word_rate
+        self.clock = clock
+        self.rng = random.Random(seed)
+        self.errors = 0
+        self.words = 0
+        self.last_update = clock()
+
+    def inject_errors(self, n):
+        self.errors += n
+
+    def set_error_rate(self, error_rate):
+        self._update()
+        self.error_rate = error_rate
+
+    def _poisson(self, mean):
+        if mean > 100:
+            return max(0, int(round(self.rng.gauss(mean, math.sqrt(mean)))))
+        k = 0
+        threshold = math.exp(-mean)
+        p = self.rng.random()
+        while p > threshold:
+            k += 1
+            p *= self.rng.random()
+        return k
+
+    def _update(self):
+        now = self.clock()
+        elapsed = now - self.last_update
+        if self.error_rate:
+            self.errors += self._poisson(self.error_rate*elapsed)
+        self.words += int(self.word_rate*elapsed)
+        self.last_update = now
+
+    def read_errors(self):
+        self._update()
+        return self.errors & 0xffffffff
+
+    def read_words(self):
+        self._update()
+        return self.words & 0xffffffff
+
+
+# Models the registers of gtx_control.GTXControl. The DRP is a plain
+# register file, and the bring-up statistics (word address: value) are
+# whatever the user puts into stats.
+class GTXControlModel:
+    rxeq_bits = [
+        ("rxlpmen", GTX_RXLPMEN),
+        ("rxlpmhfhold", GTX_RXLPMHFHOLD),
+        ("rxlpmlfhold", GTX_RXLPMLFHOLD),
+        ("rxdfeagchold", GTX_RXDFEAGCHOLD),
+        ("rxdfelfhold", GTX_RXDFELFHOLD)
+    ]
+
+    def __init__(self):
+        self.registers = {
+            GTX_TXDIFFCTRL_ADDR: 0b1000,
+            GTX_TXPRECURSOR_ADDR: 0,
+            GTX_TXPOSTCURSOR_ADDR: 0,
+            GTX_RXEQ_ADDR: 0
+        }
+        self.widths = {
+            GTX_TXDIFFCTRL_ADDR: 4,
+            GTX_TXPRECURSOR_ADDR: 5,
+            GTX_TXPOSTCURSOR_ADDR: 5,
+            GTX_RXEQ_ADDR: 5
+        }
+        self.stats = dict()
+        self.drp = [0]*512
+        self.tx_restarts = 0
+        self.rx_restarts = 0
+
+    def settings(self):
+        rxeq = self.registers[GTX_RXEQ_ADDR]
+        settings = {
+            "txdiffctrl": self.registers[GTX_TXDIFFCTRL_ADDR],
+            "txprecursor": self.registers[GTX_TXPRECURSOR_ADDR],
+            "txpostcursor": self.registers[GTX_TXPOSTCURSOR_ADDR]
+        }
+        for name, bit in self.rxeq_bits:
+            settings[name] = int(bool(rxeq & bit))
+        return settings
+
+    def read(self, adr):
+        if adr & (1 << 9):
+            return self.drp[adr & 0x1ff]
+        adr &= 0x1f
+        return self.registers.get(adr, self.stats.get(adr, 0))
+
+    def write(self, adr, value):
+        if adr & (1 << 9):
+            self.drp[adr & 0x1ff] = value & 0xffff
+        elif (adr & 0x1f) in self.registers:
+            self.registers[adr & 0x1f] = value & (2**self.widths[adr & 0x1f] - 1)
+        elif (adr & 0x1f) == GTX_STATS_CLEAR_ADDR:
+            self.stats.clear()
+        elif (adr & 0x1f) == GTX_RESTART_ADDR:
+            if value & GTX_RESTART_TX:
+                self.tx_restarts += 1
+            if value & GTX_RESTART_RX:
+                self.rx_restarts += 1
+
+
+class VirtualBoard:
+    cmds = {
+        "write": 0x01,
+        "read": 0x02
+    }
+    sync_byte = 0x5a
+
+    # timeout mirrors the WaitTimer of the bridge, which resets it when a
+    # request takes more than 100ms to arrive, and seq_timeout the time
+    # after which it forgets the last SEQ. error_model, if given, is
+    # called with the transceiver settings (GTXControlModel.settings) when
+    # they change and returns the new error rate.
+    def __init__(self, framed=False, max_write_length=16, error_rate=0.0,
+                 seed=None, i2c_busy_polls=0, timeout=0.1, seq_timeout=2.0,
+                 clock=time.monotonic, error_model=None):
+        self.framed = framed
+        self.max_write_length = max_write_length
+        self.timeout = timeout
+        self.seq_timeout = seq_timeout
+        self.clock = clock
+        self.i2c_master = I2CMasterModel(i2c_busy_polls)
+        self.prbs_checker = PRBSCheckerModel(error_rate, seed=seed, clock=clock)
+        self.gtx_control = GTXControlModel()
+        self.error_model = error_model
+        if error_model is not None:
+            self.prbs_checker.set_error_rate(
+                error_model(self.gtx_control.settings()))
+        self.last_seq = None
+        self._last_seq_time = None
+        self.bus_reads = 0
+        self.bus_writes = 0
+        self._reply = bytearray()
+        self._start_parser()
+
+    @property
+    def i2c_bus(self):
+        return self.i2c_master.bus
+
+    @property
+    def si5324(self):
+        return self.i2c_master.bus.si5324
+
+    def inject_errors(self, n):
+        self.prbs_checker.inject_errors(n)
+
+    # Wishbone address decoding of PRBSRX
+    def bus_read(self, adr):
+        self.bus_reads += 1
+        if adr & ((1 << 5) | (1 << 9)):
+            return self.gtx_control.read(adr)
+        elif adr & (1 << 4):
+            if adr & 1:
+                return self.prbs_checker.read_words()
+            else:
+                return self.prbs_checker.read_errors()
+        elif adr & 1:
+            return self.i2c_master.divider
+        else:
+            return self.i2c_master.read_xfer()
+
+    def bus_write(self, adr, value):
+        self.bus_writes += 1
+        if adr & ((1 << 5) | (1 << 9)):
+            self.gtx_control.write(adr, value)
+            if self.error_model is not None:
+                self.prbs_checker.set_error_rate(
+                    self.error_model(self.gtx_control.settings()))
+        elif adr & (1 << 4):
+            pass
+        elif adr & 1:
+            self.i2c_master.divider = value & 0xfffff
+        else:
+            self.i2c_master.write_xfer(value)
+
+    def _start_parser(self):
+        self._idle = True
+        self._parser = self._framed_parser() if self.framed else self._raw_parser()
+        next(self._parser)
+
+    def _receive(self, n):
+        value = 0
+        for _ in range(n):
+            value = (value << 8) | (yield)
+        return value
+
+    def _raw_parser(self):
+        while True:
+            self._idle = True
+            cmd = yield
+            if cmd not in self.cmds.values():
+                continue
+            self._idle = False
+            self._request_start = self.clock()
+            length = yield
+            address = yield from self._receive(4)
+            for i in range(length):
+                adr = (address + i) & 0x3fffffff
+                if cmd == self.cmds["write"]:
+                    self.bus_write(adr, (yield from self._receive(4)))
+                else:
+                    self._reply += self.bus_read(adr).to_bytes(4, "big")
+
+    def _framed_parser(self):
+        while True:
+            self._idle = True
+            if (yield) != self.sync_byte:
+                continue
+            self._idle = False
+            self._request_start = self.clock()
+            seq = yield
+            cmd = yield
+            if cmd not in self.cmds.values():
+                continue
+            length = yield
+            if length == 0 or (cmd == self.cmds["write"]
+                               and length > self.max_write_length):
+                continue
+            body = bytearray([seq, cmd, length])
+            n = 4 + 2
+            if cmd == self.cmds["write"]:
+                n += 4*length
+            for _ in range(n):
+                body.append((yield))
+            if crc16(body) != 0:
+                logger.debug("dropping request %d with bad CRC", seq)
+                continue
+            address = int.from_bytes(body[3:7], "big")
+            reply = bytearray([seq])
+            if (self.last_seq is not None
+                    and self._request_start - self._last_seq_time > self.seq_timeout):
+                self.last_seq = None
+            if cmd == self.cmds["write"]:
+                if seq != self.last_seq:
+                    for i in range(length):
+                        self.bus_write((address + i) & 0x3fffffff,
+                                       int.from_bytes(body[7+4*i:11+4*i], "big"))
+            else:
+                for i in range(length):
+                    reply += self.bus_read((address + i) & 0x3fffffff).to_bytes(4, "big")
+            self.last_seq = seq
+            self._last_seq_time = self.clock()
+            self._reply += bytes([self.sync_byte]) + reply + crc16(reply).to_bytes(2, "big")
+
+    # Processes bytes sent by the host and returns the reply bytes
+    def feed(self, data):
+        if (not self._idle and self.timeout is not None
+                and self.clock() - self._request_start > self.timeout):
+            logger.debug("request timed out")
+            self._start_parser()
+        for octet in data:
+            self._parser.send(octet)
+        reply = bytes(self._reply)
+        self._reply.clear()
+        return reply
+
+
+# pyserial-like port connected to a VirtualBoard. Bits on the link are
+# flipped with probability link_error_rate, in both directions.
+class VirtualBoardPort:
+    def __init__(self, board=None, timeout=None, link_error_rate=0.0, seed=None):
+        if board is None:
+            board = VirtualBoard()
+        self.board = board
+        self.name = "virtual://"
+        self.timeout = timeout
+        self.link_error_rate = link_error_rate
+        self.rng = random.Random(seed)
+        self._rx = bytearray()
+
+    @classmethod
+    def from_url(cls, url, timeout=None):
+        options = parse_qs(url[len("virtual://"):].lstrip("?"),
+                           keep_blank_values=True)
+        def option(name, default):
+            if name in options:
+                return type(default)(options[name][0])
+            return default
+        board = VirtualBoard(framed="framed" in options,
+                             error_rate=option("error_rate", 0.0),
+                             seed=option("seed", 0),
+                             i2c_busy_polls=option("i2c_busy_polls", 0))
+        return cls(board, timeout,
+                   link_error_rate=option("link_error_rate", 0.0),
+                   seed=option("seed", 0))
+
+    def _corrupt(self, data):
+        if not self.link_error_rate:
+            return data
+        data = bytearray(data)
+        for i in range(len(data)):
+            for bit in range(8):
+                if self.rng.random() < self.link_error_rate:
+                    data[i] ^= 1 << bit
+        return data
+
+    def close(self):
+        pass
+
+    @property
+    def in_waiting(self):
+        return len(self._rx)
+
+    # replies are produced as soon as requests are written, so there is
+    # never anything to wait for
+    def read(self, size=1):
+        data = bytes(self._rx[:size])
+        del self._rx[:size]
+        return data
+
+    def write(self, data):
+        self._rx += self._corrupt(self.board.feed(self._corrupt(data)))
+        return len(data)
+
+    def reset_input_buffer(self):
+        self._rx.clear()
+
+
+# Serves a VirtualBoard on a pseudo-terminal until interrupted
+def serve_pty(board):
+    master, slave = os.openpty()
+    tty.setraw(slave)
+    print("serving virtual board on {}".format(os.ttyname(slave)), flush=True)
+    try:
+        while True:
+            reply = board.feed(os.read(master, 4096))
+            if reply:
+                os.write(master, reply)
+    finally:
+        os.close(master)
+        os.close(slave)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="PRBS receiver board emulator")
+    parser.add_argument("--framed", default=False, action="store_true",
+                        help="emulate a bridge built with the framed protocol")
+    parser.add_argument("--error-rate", default=0.0, type=float,
+                        help="average number of PRBS errors per second")
+    parser.add_argument("--seed", default=None, type=int)
+    args = parser.parse_args()
+
+    try:
+        serve_pty(VirtualBoard(args.framed, error_rate=args.error_rate,
+                               seed=args.seed))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -1,24 +1,74 @@
+from operator import or_
+from functools import reduce
+
 from migen import *
 
 from migen.genlib.misc import chooser, WaitTimer
 from migen.genlib.record import Record
 from migen.genlib.fsm import FSM, NextState
+from migen.genlib.fifo import SyncFIFO
 
 from misoc.interconnect import wishbone
 from misoc.interconnect import stream
 
+from crc import CRC16
+
 
+# Raw mode:
+#  request: <1> CMD <1> LENGTH <4> ADDRESS <4*LENGTH> DATA (writes only)
+#  reply:   <4*LENGTH> DATA (reads only)
+#
+# Framed mode:
+#  request: <1> SYNC <1> SEQ <1> CMD <1> LENGTH <4> ADDRESS
+#           <4*LENGTH> DATA (writes only) <2> CRC
+#  reply:   <1> SYNC <1> SEQ <4*LENGTH> DATA (reads only) <2> CRC
+#
+# CRC is CRC-16/CCITT (polynomial 0x1021, initial value 0xffff) over all
+# bytes following SYNC, sent MSB first. Requests with a bad CRC are dropped
+# and the bridge goes back to hunting for SYNC; the host is expected to
+# time out and retry with the same SEQ. Write data is buffered until the
+# CRC has been checked, and a request repeating the SEQ of the last executed
+# request is acknowledged without writing again. The last SEQ is forgotten
+# after seq_timeout seconds without requests, so that a new host session
+# cannot have its first write mistaken for a retry; this must be longer than
+# the time the host keeps retrying a request.
+#
+# Incoming bytes go through a FIFO of fifo_depth bytes, so that the host may
+# send further requests while replies are being transmitted, as long as it
+# keeps no more than fifo_depth request bytes ahead of the replies it has
+# received.
 class WishboneStreamingBridge(Module):
     cmds = {
         "write": 0x01,
         "read": 0x02
     }
+    sync_byte = 0x5a
 
-    def __init__(self, phy, clk_freq):
+    def __init__(self, phy, clk_freq, framed=False, max_write_length=16,
+                 fifo_depth=64, seq_timeout=2.0):
         self.wishbone = wishbone.Interface()
 
         # # #
 
+        source = Record([("stb", 1), ("ack", 1), ("data", 8)])
+        if fifo_depth:
+            fifo = SyncFIFO(8, fifo_depth)
+            self.submodules += fifo
+            self.comb += [
+                fifo.we.eq(phy.source.stb),
+                fifo.din.eq(phy.source.data),
+                phy.source.ack.eq(fifo.writable),
+                source.stb.eq(fifo.readable),
+                source.data.eq(fifo.dout),
+                fifo.re.eq(source.ack)
+            ]
+        else:
+            self.comb += [
+                source.stb.eq(phy.source.stb),
+                source.data.eq(phy.source.data),
+                phy.source.ack.eq(1)
+            ]
+
         byte_counter = Signal(3)
         byte_counter_reset = Signal()
         byte_counter_ce = Signal()
@@ -29,7 +79,7 @@ class WishboneStreamingBridge(Module):
                 byte_counter.eq(byte_counter + 1)
             )
 
-        word_counter = Signal(3)
+        word_counter = Signal(8)
         word_counter_reset = Signal()
         word_counter_ce = Signal()
         self.sync += \
@@ -53,11 +103,11 @@ class WishboneStreamingBridge(Module):
         tx_data_ce = Signal()
 
         self.sync += [
-            If(cmd_ce, cmd.eq(phy.source.data)),
-            If(length_ce, length.eq(phy.source.data)),
-            If(address_ce, address.eq(Cat(phy.source.data, address[0:24]))),
+            If(cmd_ce, cmd.eq(source.data)),
+            If(length_ce, length.eq(source.data)),
+            If(address_ce, address.eq(Cat(source.data, address[0:24]))),
             If(rx_data_ce,
-                data.eq(Cat(phy.source.data, data[0:24]))
+                data.eq(Cat(source.data, data[0:24]))
             ).Elif(tx_data_ce,
                 data.eq(self.wishbone.dat_r)
             )
@@ -66,99 +116,329 @@ class WishboneStreamingBridge(Module):
         fsm = ResetInserter()(FSM(reset_state="IDLE"))
         timer = WaitTimer(clk_freq//10)
         self.submodules += fsm, timer
+        self.comb += fsm.reset.eq(timer.done)
+
         self.comb += [
-            fsm.reset.eq(timer.done),
-            phy.source.ack.eq(1)
+            self.wishbone.adr.eq(address + word_counter),
+            self.wishbone.sel.eq(2**len(self.wishbone.sel) - 1)
         ]
-        fsm.act("IDLE",
-            If(phy.source.stb,
-                cmd_ce.eq(1),
-                If((phy.source.data == self.cmds["write"]) |
-                   (phy.source.data == self.cmds["read"]),
-                    NextState("RECEIVE_LENGTH")
+
+        data_byte = Signal(8)
+        self.comb += \
+            chooser(data, byte_counter, data_byte, n=4, reverse=True)
+
+        if framed:
+            seq = Signal(8)
+            seq_ce = Signal()
+            last_seq = Signal(8)
+            last_seq_valid = Signal()
+            last_seq_ce = Signal()
+            seq_timer = WaitTimer(int(seq_timeout*clk_freq))
+            self.submodules += seq_timer
+            self.comb += seq_timer.wait.eq(fsm.ongoing("IDLE") & ~source.stb)
+            self.sync += [
+                If(seq_ce, seq.eq(source.data)),
+                If(last_seq_ce,
+                    last_seq.eq(seq),
+                    last_seq_valid.eq(1)
+                ).Elif(seq_timer.done,
+                    last_seq_valid.eq(0)
+                )
+            ]
+
+            crc = CRC16()
+            crc_tx = Signal()
+            self.submodules += crc
+            self.comb += crc.data.eq(Mux(crc_tx, phy.sink.data, source.data))
+
+            write_buffer = Memory(32, max_write_length)
+            write_buffer_wr = write_buffer.get_port(write_capable=True)
+            write_buffer_rd = write_buffer.get_port(async_read=True)
+            self.specials += write_buffer, write_buffer_wr, write_buffer_rd
+            self.comb += [
+                write_buffer_wr.adr.eq(word_counter),
+                write_buffer_wr.dat_w.eq(data),
+                write_buffer_rd.adr.eq(word_counter),
+                self.wishbone.dat_w.eq(write_buffer_rd.dat_r)
+            ]
+
+            fsm.act("IDLE",
+                If(source.stb & (source.data == self.sync_byte),
+                    crc.reset.eq(1),
+                    NextState("RECEIVE_SEQ")
                 ),
                 byte_counter_reset.eq(1),
                 word_counter_reset.eq(1)
             )
-        )
-        fsm.act("RECEIVE_LENGTH",
-            If(phy.source.stb,
-                length_ce.eq(1),
-                NextState("RECEIVE_ADDRESS")
-            )
-        )
-        fsm.act("RECEIVE_ADDRESS",
-            If(phy.source.stb,
-                address_ce.eq(1),
-                byte_counter_ce.eq(1),
-                If(byte_counter == 3,
-                    If(cmd == self.cmds["write"],
-                        NextState("RECEIVE_DATA")
-                    ).Elif(cmd == self.cmds["read"],
-                        NextState("READ_DATA")
-                    ),
-                    byte_counter_reset.eq(1),
+            fsm.act("RECEIVE_SEQ",
+                If(source.stb,
+                    seq_ce.eq(1),
+                    crc.ce.eq(1),
+                    NextState("RECEIVE_CMD")
                 )
             )
-        )
-        fsm.act("RECEIVE_DATA",
-            If(phy.source.stb,
-                rx_data_ce.eq(1),
-                byte_counter_ce.eq(1),
-                If(byte_counter == 3,
-                    NextState("WRITE_DATA"),
-                    byte_counter_reset.eq(1)
+            fsm.act("RECEIVE_CMD",
+                If(source.stb,
+                    cmd_ce.eq(1),
+                    crc.ce.eq(1),
+                    If((source.data == self.cmds["write"]) |
+                       (source.data == self.cmds["read"]),
+                        NextState("RECEIVE_LENGTH")
+                    ).Else(
+                        NextState("IDLE")
+                    )
                 )
             )
-        )
-        self.comb += [
-            self.wishbone.adr.eq(address + word_counter),
-            self.wishbone.dat_w.eq(data),
-            self.wishbone.sel.eq(2**len(self.wishbone.sel) - 1)
-        ]
-        fsm.act("WRITE_DATA",
-            self.wishbone.stb.eq(1),
-            self.wishbone.we.eq(1),
-            self.wishbone.cyc.eq(1),
-            If(self.wishbone.ack,
+            fsm.act("RECEIVE_LENGTH",
+                If(source.stb,
+                    length_ce.eq(1),
+                    crc.ce.eq(1),
+                    If((source.data == 0) |
+                       ((cmd == self.cmds["write"]) &
+                        (source.data > max_write_length)),
+                        NextState("IDLE")
+                    ).Else(
+                        NextState("RECEIVE_ADDRESS")
+                    )
+                )
+            )
+            fsm.act("RECEIVE_ADDRESS",
+                If(source.stb,
+                    address_ce.eq(1),
+                    crc.ce.eq(1),
+                    byte_counter_ce.eq(1),
+                    If(byte_counter == 3,
+                        If(cmd == self.cmds["write"],
+                            NextState("RECEIVE_DATA")
+                        ).Else(
+                            NextState("RECEIVE_CRC")
+                        ),
+                        byte_counter_reset.eq(1)
+                    )
+                )
+            )
+            fsm.act("RECEIVE_DATA",
+                If(source.stb,
+                    rx_data_ce.eq(1),
+                    crc.ce.eq(1),
+                    byte_counter_ce.eq(1),
+                    If(byte_counter == 3,
+                        NextState("BUFFER_DATA"),
+                        byte_counter_reset.eq(1)
+                    )
+                )
+            )
+            fsm.act("BUFFER_DATA",
+                write_buffer_wr.we.eq(1),
                 word_counter_ce.eq(1),
                 If(word_counter == (length-1),
-                    NextState("IDLE")
+                    NextState("RECEIVE_CRC")
                 ).Else(
                     NextState("RECEIVE_DATA")
                 )
             )
-        )
-        fsm.act("READ_DATA",
-            self.wishbone.stb.eq(1),
-            self.wishbone.we.eq(0),
-            self.wishbone.cyc.eq(1),
-            If(self.wishbone.ack,
-                tx_data_ce.eq(1),
-                NextState("SEND_DATA")
+            fsm.act("RECEIVE_CRC",
+                If(source.stb,
+                    crc.ce.eq(1),
+                    byte_counter_ce.eq(1),
+                    If(byte_counter == 1,
+                        NextState("CHECK_CRC"),
+                        byte_counter_reset.eq(1)
+                    )
+                )
             )
-        )
-        self.comb += \
-            chooser(data, byte_counter, phy.sink.data, n=4, reverse=True)
-        fsm.act("SEND_DATA",
-            phy.sink.stb.eq(1),
-            If(phy.sink.ack,
-                byte_counter_ce.eq(1),
-                If(byte_counter == 3,
+            # a correct CRC leaves a zero residue
+            fsm.act("CHECK_CRC",
+                word_counter_reset.eq(1),
+                If(crc.value != 0,
+                    NextState("IDLE")
+                ).Else(
+                    last_seq_ce.eq(1),
+                    If((cmd == self.cmds["write"]) &
+                       ~(last_seq_valid & (seq == last_seq)),
+                        NextState("WRITE_DATA")
+                    ).Else(
+                        NextState("SEND_SYNC")
+                    )
+                )
+            )
+            fsm.act("WRITE_DATA",
+                self.wishbone.stb.eq(1),
+                self.wishbone.we.eq(1),
+                self.wishbone.cyc.eq(1),
+                If(self.wishbone.ack,
                     word_counter_ce.eq(1),
                     If(word_counter == (length-1),
-                        NextState("IDLE")
+                        NextState("SEND_SYNC")
+                    )
+                )
+            )
+            fsm.act("SEND_SYNC",
+                phy.sink.stb.eq(1),
+                phy.sink.data.eq(self.sync_byte),
+                word_counter_reset.eq(1),
+                If(phy.sink.ack,
+                    crc.reset.eq(1),
+                    NextState("SEND_SEQ")
+                )
+            )
+            fsm.act("SEND_SEQ",
+                phy.sink.stb.eq(1),
+                phy.sink.data.eq(seq),
+                If(phy.sink.ack,
+                    crc_tx.eq(1),
+                    crc.ce.eq(1),
+                    If(cmd == self.cmds["read"],
+                        NextState("READ_DATA")
                     ).Else(
-                        NextState("READ_DATA"),
+                        NextState("SEND_CRC")
+                    )
+                )
+            )
+            fsm.act("READ_DATA",
+                self.wishbone.stb.eq(1),
+                self.wishbone.we.eq(0),
+                self.wishbone.cyc.eq(1),
+                If(self.wishbone.ack,
+                    tx_data_ce.eq(1),
+                    NextState("SEND_DATA")
+                )
+            )
+            fsm.act("SEND_DATA",
+                phy.sink.stb.eq(1),
+                phy.sink.data.eq(data_byte),
+                If(phy.sink.ack,
+                    crc_tx.eq(1),
+                    crc.ce.eq(1),
+                    byte_counter_ce.eq(1),
+                    If(byte_counter == 3,
+                        word_counter_ce.eq(1),
+                        byte_counter_reset.eq(1),
+                        If(word_counter == (length-1),
+                            NextState("SEND_CRC")
+                        ).Else(
+                            NextState("READ_DATA")
+                        )
+                    )
+                )
+            )
+            fsm.act("SEND_CRC",
+                phy.sink.stb.eq(1),
+                If(byte_counter == 0,
+                    phy.sink.data.eq(crc.value[8:])
+                ).Else(
+                    phy.sink.data.eq(crc.value[:8])
+                ),
+                If(phy.sink.ack,
+                    byte_counter_ce.eq(1),
+                    If(byte_counter == 1,
+                        NextState("IDLE")
+                    )
+                )
+            )
+
+            receive_states = ["IDLE", "RECEIVE_SEQ", "RECEIVE_CMD",
+                              "RECEIVE_LENGTH", "RECEIVE_ADDRESS",
+                              "RECEIVE_DATA", "RECEIVE_CRC"]
+
+            self.comb += phy.sink.eop.eq(fsm.ongoing("SEND_CRC") & (byte_counter == 1))
+
+            if hasattr(phy.sink, "length"):
+                self.comb += phy.sink.length.eq(
+                    Mux(cmd == self.cmds["read"], 4*length, 0) + 4)
+        else:
+            self.comb += self.wishbone.dat_w.eq(data)
+
+            fsm.act("IDLE",
+                If(source.stb,
+                    cmd_ce.eq(1),
+                    If((source.data == self.cmds["write"]) |
+                       (source.data == self.cmds["read"]),
+                        NextState("RECEIVE_LENGTH")
+                    ),
+                    byte_counter_reset.eq(1),
+                    word_counter_reset.eq(1)
+                )
+            )
+            fsm.act("RECEIVE_LENGTH",
+                If(source.stb,
+                    length_ce.eq(1),
+                    NextState("RECEIVE_ADDRESS")
+                )
+            )
+            fsm.act("RECEIVE_ADDRESS",
+                If(source.stb,
+                    address_ce.eq(1),
+                    byte_counter_ce.eq(1),
+                    If(byte_counter == 3,
+                        If(cmd == self.cmds["write"],
+                            NextState("RECEIVE_DATA")
+                        ).Elif(cmd == self.cmds["read"],
+                            NextState("READ_DATA")
+                        ),
+                        byte_counter_reset.eq(1),
+                    )
+                )
+            )
+            fsm.act("RECEIVE_DATA",
+                If(source.stb,
+                    rx_data_ce.eq(1),
+                    byte_counter_ce.eq(1),
+                    If(byte_counter == 3,
+                        NextState("WRITE_DATA"),
                         byte_counter_reset.eq(1)
                     )
                 )
             )
-        )
+            fsm.act("WRITE_DATA",
+                self.wishbone.stb.eq(1),
+                self.wishbone.we.eq(1),
+                self.wishbone.cyc.eq(1),
+                If(self.wishbone.ack,
+                    word_counter_ce.eq(1),
+                    If(word_counter == (length-1),
+                        NextState("IDLE")
+                    ).Else(
+                        NextState("RECEIVE_DATA")
+                    )
+                )
+            )
+            fsm.act("READ_DATA",
+                self.wishbone.stb.eq(1),
+                self.wishbone.we.eq(0),
+                self.wishbone.cyc.eq(1),
+                If(self.wishbone.ack,
+                    tx_data_ce.eq(1),
+                    NextState("SEND_DATA")
+                )
+            )
+            fsm.act("SEND_DATA",
+                phy.sink.stb.eq(1),
+                phy.sink.data.eq(data_byte),
+                If(phy.sink.ack,
+                    byte_counter_ce.eq(1),
+                    If(byte_counter == 3,
+                        word_counter_ce.eq(1),
+                        If(word_counter == (length-1),
+                            NextState("IDLE")
+                        ).Else(
+                            NextState("READ_DATA"),
+                            byte_counter_reset.eq(1)
+                        )
+                    )
+                )
+            )
 
-        self.comb += timer.wait.eq(~fsm.ongoing("IDLE"))
+            receive_states = ["IDLE", "RECEIVE_LENGTH", "RECEIVE_ADDRESS",
+                              "RECEIVE_DATA"]
 
-        self.comb += phy.sink.eop.eq((byte_counter == 3) & (word_counter == length - 1))
+            self.comb += phy.sink.eop.eq((byte_counter == 3) & (word_counter == length - 1))
 
-        if hasattr(phy.sink, "length"):
-            self.comb += phy.sink.length.eq(4*length)
+            if hasattr(phy.sink, "length"):
+                self.comb += phy.sink.length.eq(4*length)
+
+        self.comb += [
+            source.ack.eq(reduce(or_, [fsm.ongoing(state)
+                                       for state in receive_states])),
+            timer.wait.eq(~fsm.ongoing("IDLE"))
+        ]